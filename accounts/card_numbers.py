@@ -0,0 +1,96 @@
+"""
+Card number allocation.
+
+A card number is ``CARD_NUMBER_PREFIX`` + a 9 digit account identifier + the
+Luhn check digit. Identifiers come from a database sequence that every
+process reserves in blocks of ``CARD_NUMBER_BLOCK_SIZE``, so numbers are
+unique without checking the card table and issuing a card never retries.
+The sequence value is spread over the identifier space with an invertible
+multiplication, so consecutive cards don't get consecutive numbers.
+"""
+
+import os
+import secrets
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+
+SEQUENCE_NAME = "accounts_card_number_seq"
+ACCOUNT_DIGITS = 9
+# Взаимно просто с 10, поэтому умножение по модулю 10^9 — перестановка
+MULTIPLIER = 387_420_489
+
+
+def luhn_check_digit(digits):
+    total = 0
+    for position, digit in enumerate(reversed(digits)):
+        value = int(digit)
+        if position % 2 == 0:
+            value *= 2
+            if value > 9:
+                value -= 9
+        total += value
+    return str((10 - total % 10) % 10)
+
+
+def is_luhn_valid(number):
+    return number.isdigit() and luhn_check_digit(number[:-1]) == number[-1]
+
+
+def card_number(sequence_value):
+    account = (sequence_value * MULTIPLIER) % 10**ACCOUNT_DIGITS
+    digits = f"{settings.CARD_NUMBER_PREFIX}{account:0{ACCOUNT_DIGITS}d}"
+    return digits + luhn_check_digit(digits)
+
+
+def new_cvv():
+    return f"{secrets.randbelow(1000):03d}"
+
+
+def reserve(count):
+    """Reserve ``count`` sequence values for this process."""
+    if connection.vendor == "postgresql":
+        # nextval не откатывается вместе с транзакцией, блок не выдадут дважды
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(%s) FROM generate_series(1, %s)",
+                [SEQUENCE_NAME, count],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    from accounts.models import CardNumberSequence
+
+    with transaction.atomic():
+        sequence, _ = CardNumberSequence.objects.select_for_update().get_or_create(pk=1)
+        CardNumberSequence.objects.filter(pk=1).update(
+            next_value=F("next_value") + count
+        )
+    return list(range(sequence.next_value, sequence.next_value + count))
+
+
+class CardNumberAllocator:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._reserved = []
+
+    def allocate(self, count):
+        """Return ``count`` new card numbers."""
+        with self._lock:
+            if self._pid != os.getpid():
+                # После fork блок родителя принадлежит ему, берём свой
+                self._pid = os.getpid()
+                self._reserved = []
+            missing = count - len(self._reserved)
+            if missing > 0:
+                self._reserved += reserve(max(missing, settings.CARD_NUMBER_BLOCK_SIZE))
+            values, self._reserved = self._reserved[:count], self._reserved[count:]
+        return [card_number(value) for value in values]
+
+    def next_number(self):
+        return self.allocate(1)[0]
+
+
+allocator = CardNumberAllocator()
@@ -33,3 +33,23 @@ PERIOD_DEPOSIT = (
     (WEEK, "WEEK"),
     (DAY, "DAY"),
 )
+
+OPENING = "opening"
+PAYMENT = "payment"
+DEPOSIT = "deposit"
+TRANSFER_OUT = "transfer_out"
+TRANSFER_IN = "transfer_in"
+SAVINGS = "savings"
+CREDIT_PAYMENT = "credit_payment"
+WRITE_OFF = "write_off"
+
+LEDGER_ENTRY_KIND = (
+    (OPENING, "Opening balance"),
+    (PAYMENT, "Payment"),
+    (DEPOSIT, "Deposit"),
+    (TRANSFER_OUT, "Transfer out"),
+    (TRANSFER_IN, "Transfer in"),
+    (SAVINGS, "Budget savings"),
+    (CREDIT_PAYMENT, "Credit payment"),
+    (WRITE_OFF, "Debt write-off"),
+)
@@ -0,0 +1,63 @@
+"""
+Outgoing e-mail for Celery workers.
+
+Every worker process keeps one open backend connection (one SMTP session for
+the SMTP backend) and sends all its messages through it, reopening it after
+``EMAIL_CONNECTION_MAX_MESSAGES`` messages or after a failure.
+"""
+
+import threading
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.template.loader import render_to_string
+from django_otp.plugins.otp_totp.models import TOTPDevice
+
+_local = threading.local()
+
+
+def _connection():
+    connection = getattr(_local, "connection", None)
+    if connection is None or _local.sent >= settings.EMAIL_CONNECTION_MAX_MESSAGES:
+        close_connection()
+        connection = get_connection(fail_silently=False)
+        connection.open()
+        _local.connection, _local.sent = connection, 0
+    return connection
+
+
+def close_connection():
+    connection = getattr(_local, "connection", None)
+    _local.connection = None
+    if connection is not None:
+        try:
+            connection.close()
+        except Exception:
+            # Соединение уже разорвано сервером — закрывать нечего
+            pass
+
+
+def send(messages):
+    """Send ``messages`` over the process connection; return the number sent."""
+    connection = _connection()
+    try:
+        sent = connection.send_messages(messages) or 0
+    except Exception:
+        close_connection()
+        raise
+    _local.sent += len(messages)
+    return sent
+
+
+def signup_message(user):
+    """Provision the user's TOTP device and build the activation e-mail."""
+    device = TOTPDevice.objects.filter(user=user).first()
+    if device is None:
+        device = user.totpdevice_set.create(confirmed=True)
+    message = render_to_string(
+        "emails/account_activation_email.html",
+        {"user": user, "qr_code": device.config_url},
+    )
+    email = EmailMessage("DJANGO OTP DEMO", message, to=[user.email])
+    email.content_subtype = "html"
+    return email
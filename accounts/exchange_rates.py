@@ -0,0 +1,241 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
+
+import requests
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = "exchange_rates:{source}"
+LAST_GOOD_KEY = "exchange_rates:{source}:last_good"
+
+
+class ExchangeRateError(Exception):
+    pass
+
+
+class HttpRateFetcher:
+    """Loads the kursExchange payload from the Belarusbank API (or a stand-in)."""
+
+    def __init__(self, url=None, timeout=None):
+        self.url = url or settings.EXCHANGE_RATE_URL
+        self.timeout = timeout or settings.EXCHANGE_RATE_TIMEOUT
+
+    @property
+    def source(self):
+        return self.url
+
+    def __call__(self):
+        try:
+            response = requests.get(self.url, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise ExchangeRateError(f"Exchange rate request failed: {e}") from e
+
+        if response.status_code != 200:
+            raise ExchangeRateError(
+                f"Exchange rate request failed with status {response.status_code}"
+            )
+
+        data = response.json()
+        # Курсы одинаковы для всех отделений, берём первое
+        if not isinstance(data, list) or not data or not isinstance(data[0], dict):
+            raise ExchangeRateError("Unexpected exchange rate payload structure")
+        return data[0]
+
+
+class ExchangeRateService:
+    """
+    Two-level (process LRU + Django cache) exchange rate cache.
+
+    Fresh entries are served directly. Entries older than ``ttl`` but younger
+    than ``stale_ttl`` are served immediately while a single background thread
+    refreshes them. Concurrent misses share one upstream fetch, and when
+    upstream is down the last known good payload is used.
+    """
+
+    def __init__(
+        self,
+        fetcher=None,
+        ttl=None,
+        stale_ttl=None,
+        local_size=None,
+        cache_alias=None,
+    ):
+        self.fetcher = fetcher or HttpRateFetcher()
+        self.ttl = ttl if ttl is not None else settings.EXCHANGE_RATE_TTL
+        self.stale_ttl = (
+            stale_ttl if stale_ttl is not None else settings.EXCHANGE_RATE_STALE_TTL
+        )
+        self.local_size = local_size or settings.EXCHANGE_RATE_LOCAL_CACHE_SIZE
+        self.cache_alias = cache_alias or settings.EXCHANGE_RATE_CACHE_ALIAS
+
+        self._local = OrderedDict()
+        self._local_lock = threading.Lock()
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+
+    @property
+    def source(self):
+        return getattr(self.fetcher, "source", type(self.fetcher).__name__)
+
+    @property
+    def cache_key(self):
+        return CACHE_KEY.format(source=self.source)
+
+    @property
+    def last_good_key(self):
+        return LAST_GOOD_KEY.format(source=self.source)
+
+    def get_rate(self, code="USD_in"):
+        rates = self.get_rates()
+        try:
+            return Decimal(str(rates[code]))
+        except (KeyError, TypeError, InvalidOperation):
+            logger.warning("Exchange rate %s is missing, using default", code)
+            return Decimal(settings.EXCHANGE_RATE_DEFAULTS[code])
+
+    def get_rates(self):
+        key = self.cache_key
+
+        entry = self._local_get(key)
+        if entry is None:
+            entry = self._shared_get(key)
+            if entry is not None:
+                self._local_set(key, entry)
+
+        if entry is not None:
+            rates, fetched_at = entry
+            age = time.time() - fetched_at
+            if age < self.ttl:
+                return rates
+            if age < self.stale_ttl:
+                self._refresh_in_background(key)
+                return rates
+
+        return self._load(key)
+
+    def refresh(self):
+        """Fetch upstream now and repopulate both cache levels."""
+        return self._fetch_and_store(self.cache_key)
+
+    def clear(self):
+        with self._local_lock:
+            self._local.clear()
+
+    def _load(self, key):
+        """Collapse concurrent misses for ``key`` into one upstream fetch."""
+        with self._inflight_lock:
+            event = self._inflight.get(key)
+            leader = event is None
+            if leader:
+                event = self._inflight[key] = threading.Event()
+
+        if not leader:
+            event.wait(self._fetch_timeout())
+            entry = self._local_get(key)
+            if entry is not None:
+                return entry[0]
+            return self._last_good(key)
+
+        try:
+            return self._fetch_and_store(key)
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    def _refresh_in_background(self, key):
+        with self._inflight_lock:
+            if key in self._inflight:
+                return
+            event = self._inflight[key] = threading.Event()
+
+        def run():
+            try:
+                self._fetch_and_store(key)
+            finally:
+                with self._inflight_lock:
+                    self._inflight.pop(key, None)
+                event.set()
+
+        threading.Thread(target=run, name="exchange-rate-refresh", daemon=True).start()
+
+    def _fetch_and_store(self, key):
+        try:
+            rates = self.fetcher()
+        except Exception as e:
+            logger.warning("Exchange rate refresh failed: %s", e)
+            rates = self._last_good(key)
+            # Не долбим упавший API на каждом запросе: до следующей попытки
+            # отдаём запасное значение, потом обновляем уже в фоне
+            retry_at = time.time() - self.ttl + settings.EXCHANGE_RATE_RETRY_AFTER
+            self._local_set(key, (rates, retry_at))
+            return rates
+
+        entry = (rates, time.time())
+        self._local_set(key, entry)
+        self._shared_set(key, entry, self.stale_ttl)
+        self._shared_set(self.last_good_key, rates, None)
+        return rates
+
+    def _last_good(self, key):
+        entry = self._local_get(key)
+        if entry is not None:
+            return entry[0]
+        rates = self._shared_get(self.last_good_key)
+        if rates is not None:
+            logger.warning("Using last known good exchange rates")
+            return rates
+        logger.error("No exchange rates available, using configured defaults")
+        return dict(settings.EXCHANGE_RATE_DEFAULTS)
+
+    def _fetch_timeout(self):
+        return getattr(self.fetcher, "timeout", None) or settings.EXCHANGE_RATE_TIMEOUT
+
+    def _local_get(self, key):
+        with self._local_lock:
+            entry = self._local.get(key)
+            if entry is not None:
+                self._local.move_to_end(key)
+            return entry
+
+    def _local_set(self, key, entry):
+        with self._local_lock:
+            self._local[key] = entry
+            self._local.move_to_end(key)
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+
+    def _shared_get(self, key):
+        try:
+            return caches[self.cache_alias].get(key)
+        except Exception as e:
+            # Redis недоступен — работаем только с локальным кэшем
+            logger.warning("Exchange rate cache read failed: %s", e)
+            return None
+
+    def _shared_set(self, key, value, timeout):
+        try:
+            caches[self.cache_alias].set(key, value, timeout)
+        except Exception as e:
+            logger.warning("Exchange rate cache write failed: %s", e)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_service():
+    global _service
+    with _service_lock:
+        if _service is None or _service.source != settings.EXCHANGE_RATE_URL:
+            _service = ExchangeRateService()
+        return _service
+
+
+def get_usd_rate(code="USD_in"):
+    return get_service().get_rate(code)
@@ -4,6 +4,9 @@ from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.db import transaction
 from django.forms import SelectDateWidget
+from django_otp.forms import OTPAuthenticationForm
+
+from . import otp
 from .models import User, UserAddress, Card, BudgetSystem
 from .constants import GENDER_CHOICE, CARD_TYPE, CURRENCY
 
@@ -26,6 +29,32 @@ class SignUpForm(UserCreationForm):
         ]
 
 
+class LoginForm(OTPAuthenticationForm):
+    """OTP login that checks the token against the user's TOTP device."""
+
+    def _chosen_device(self, user):
+        # Поддерживаем только TOTP, выбор устройства не нужен
+        return None
+
+    def _verify_token(self, user, token, device=None):
+        if otp.is_locked_out(user.pk):
+            raise forms.ValidationError(
+                self.otp_error_messages["n_failed_attempts"]
+                % {"failure_count": otp.failures(user.pk)}
+            )
+        device = otp.verify(user, token)
+        if device is None:
+            raise forms.ValidationError(
+                self.otp_error_messages["invalid_token"], code="invalid_token"
+            )
+        return device
+
+    @staticmethod
+    def device_choices(user):
+        device = otp.device_summary(user.pk)
+        return [(device["persistent_id"], device["name"])] if device else []
+
+
 class UserAddressForm(forms.ModelForm):
     class Meta:
         model = UserAddress
@@ -180,6 +209,15 @@ class DepositApprovalForm(forms.Form):
     approved = forms.BooleanField(label="Approve deposit", required=False)
 
 
+class BulkCardIssueForm(forms.Form):
+    file = forms.FileField(
+        label="CSV file", help_text="Columns: email, card_name, card_type, currency"
+    )
+    batch_size = forms.IntegerField(
+        label="Cards per transaction", required=False, min_value=1, max_value=10000
+    )
+
+
 class BudgetSystemForm(forms.ModelForm):
     card = forms.ModelChoiceField(
         queryset=None, empty_label="Select Card", label="Select Card"
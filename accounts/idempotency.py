@@ -0,0 +1,170 @@
+"""
+Idempotency keys for money-moving POSTs.
+
+A client sends the same key (``Idempotency-Key`` header or the hidden
+``idempotency_key`` form field) when it retries a request. The first request
+claims the key and stores its outcome; retries get the stored outcome back
+after a single indexed lookup, without touching any card.
+
+The outcome is written in the same transaction as the money movement
+(``atomic`` + ``complete``), so a key is either pending with nothing moved
+yet or completed with its movement committed. A pending key may be left by a
+request that is still running or by one that crashed and rolled back, so a
+retry with it goes into ``atomic`` as well: the key row lock serializes the
+two, and the one that finds the key completed replays its outcome. A key is
+bound to the endpoint that claimed it and is refused by the others.
+"""
+
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib import messages
+from django.db import transaction
+from django.http import HttpResponse
+from django.shortcuts import redirect
+from django.utils import timezone
+
+from accounts.models import IdempotencyKey
+
+FORM_FIELD = "idempotency_key"
+HEADER = "HTTP_IDEMPOTENCY_KEY"
+MAX_KEY_LENGTH = 64
+
+
+class Conflict(Exception):
+    """The claimed key is no longer pending, its request must not do the work."""
+
+
+def new_key():
+    return uuid.uuid4().hex
+
+
+def get_key(request):
+    key = request.META.get(HEADER) or request.POST.get(FORM_FIELD) or ""
+    key = key.strip()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        return None
+    return key
+
+
+def claim(request, scope):
+    """
+    Claim the request's idempotency key.
+
+    Returns ``(record, response)``. When ``response`` is set the request is a
+    retry and the view must return it as is. Otherwise the view does the work
+    and passes ``record`` (``None`` if the client sent no key) to ``complete``.
+    """
+    key = get_key(request)
+    if key is None:
+        return None, None
+
+    now = timezone.now()
+    record, created = IdempotencyKey.objects.get_or_create(
+        user=request.user,
+        key=key,
+        defaults={"scope": scope, "created_at": now, "expires_at": _expiry(now)},
+    )
+    if created:
+        return record, None
+
+    if record.completed and record.expires_at <= now:
+        # Исход просроченного ключа уже не нужен — забираем ключ себе
+        taken = IdempotencyKey.objects.filter(
+            pk=record.pk, completed=True, created_at=record.created_at
+        ).update(
+            scope=scope,
+            completed=False,
+            succeeded=False,
+            message="",
+            redirect_to="",
+            created_at=now,
+            expires_at=_expiry(now),
+        )
+        if taken:
+            record.refresh_from_db()
+            return record, None
+        record.refresh_from_db()
+
+    if record.scope != scope:
+        return None, scope_mismatch()
+    if not record.completed:
+        # Исход неизвестен: запрос ещё идёт или откатился. Решит блокировка
+        # ключа в atomic, а не отказ на весь срок жизни ключа
+        return record, None
+    return None, _stored_response(request, record)
+
+
+def replay(request, record):
+    """Stored outcome of a key that another request completed meanwhile."""
+    record = IdempotencyKey.objects.filter(pk=record.pk, completed=True).first()
+    if record is None:
+        # Другой запрос отпустил ключ, ничего не сделав
+        return in_progress()
+    return _stored_response(request, record)
+
+
+def _stored_response(request, record):
+    if record.message:
+        level = messages.SUCCESS if record.succeeded else messages.ERROR
+        messages.add_message(request, level, record.message)
+    return redirect(record.redirect_to or request.path)
+
+
+def in_progress():
+    return HttpResponse("This request is already being processed.", status=409)
+
+
+def scope_mismatch():
+    return HttpResponse(
+        "This idempotency key was used for another request.", status=422
+    )
+
+
+@contextmanager
+def atomic(record):
+    """
+    Transaction for the money movement of a claimed request.
+
+    The key row is locked first and has to be still pending. Call
+    ``complete`` inside the block, so the outcome commits or rolls back
+    together with the movement. Raises ``Conflict`` when another request has
+    completed or released the key meanwhile; the view answers with
+    ``replay``.
+    """
+    with transaction.atomic():
+        if record is not None:
+            pending = (
+                IdempotencyKey.objects.select_for_update()
+                .filter(pk=record.pk, completed=False)
+                .values_list("pk", flat=True)
+                .first()
+            )
+            if pending is None:
+                raise Conflict(record.key)
+        yield
+
+
+def complete(record, response, succeeded=True, message=""):
+    """Store the outcome of a claimed request and return ``response``."""
+    if record is not None:
+        # Исход, записанный параллельным повтором, не перетираем
+        IdempotencyKey.objects.filter(pk=record.pk, completed=False).update(
+            completed=True,
+            succeeded=succeeded,
+            message=message[:255],
+            redirect_to=getattr(response, "url", "")[:255],
+        )
+    return response
+
+
+def release(record):
+    """Forget a claimed key when the request did nothing (e.g. invalid form)."""
+    if record is not None:
+        IdempotencyKey.objects.filter(pk=record.pk, completed=False).delete()
+
+
+def _expiry(now):
+    return now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
@@ -0,0 +1,123 @@
+"""
+Bulk card issuance from CSV rows of ``email, card name, type, currency``.
+
+Rows are handled in batches: the users of a batch are resolved with one
+query, card numbers are taken from the allocator in one block and the cards
+are inserted with one ``bulk_create`` in their own transaction.
+"""
+
+import csv
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+
+from accounts import card_numbers
+from accounts.constants import CARD_TYPE, CURRENCY
+from accounts.models import Card, User
+
+HEADER = ["email", "card_name", "card_type", "currency"]
+MAX_REPORTED_ERRORS = 100
+
+
+def _choice_lookup(choices):
+    # Принимаем и код ("D"), и название ("Debit") в любом регистре
+    lookup = {}
+    for code, label in choices:
+        lookup[code.lower()] = code
+        lookup[label.lower()] = code
+    return lookup
+
+
+CARD_TYPES = _choice_lookup(CARD_TYPE)
+CURRENCIES = _choice_lookup(CURRENCY)
+
+
+class IssueReport:
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.batches = 0
+        self.errors = []
+        self.error_count = 0
+        self.elapsed = 0.0
+
+    @property
+    def rate(self):
+        return self.rows / self.elapsed if self.elapsed else 0
+
+    def error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+def read_rows(lines):
+    """Yield ``(line_number, row)`` from CSV text lines, skipping the header."""
+    reader = csv.reader(lines)
+    for row in reader:
+        if not row or row[0].strip().lower() == HEADER[0]:
+            continue
+        yield reader.line_num, row
+
+
+def issue_cards(lines, batch_size=None):
+    """Create the cards listed in CSV ``lines`` and return an ``IssueReport``."""
+    batch_size = batch_size or settings.CARD_ISSUE_BATCH_SIZE
+    report = IssueReport()
+    started = time.perf_counter()
+    rows = read_rows(lines)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        _issue_batch(batch, report)
+        report.rows += len(batch)
+        report.batches += 1
+    report.elapsed = time.perf_counter() - started
+    return report
+
+
+def _issue_batch(batch, report):
+    parsed = []
+    for line, row in batch:
+        if len(row) != len(HEADER):
+            report.error(line, f"expected {len(HEADER)} columns, got {len(row)}")
+            continue
+        email, card_name, card_type, currency = (value.strip() for value in row)
+        card_type = CARD_TYPES.get(card_type.lower())
+        currency = CURRENCIES.get(currency.lower())
+        if card_type is None or currency is None or not email:
+            report.error(line, "invalid email, card type or currency")
+            continue
+        parsed.append((line, email, card_name or "New Card", card_type, currency))
+
+    users = dict(
+        User.objects.filter(email__in={row[1] for row in parsed}).values_list(
+            "email", "id"
+        )
+    )
+    cards = []
+    for line, email, card_name, card_type, currency in parsed:
+        user_id = users.get(email)
+        if user_id is None:
+            report.error(line, f"unknown user {email}")
+            continue
+        cards.append(
+            Card(
+                user_id=user_id,
+                card_name=card_name[:100],
+                card_type=card_type,
+                currency=currency,
+                cvv_code=card_numbers.new_cvv(),
+            )
+        )
+    if not cards:
+        return
+
+    for card, account_no in zip(cards, card_numbers.allocator.allocate(len(cards))):
+        card.account_no = account_no
+    with transaction.atomic():
+        Card.objects.bulk_create(cards)
+    report.created += len(cards)
@@ -0,0 +1,61 @@
+"""
+Card balances derived from the ledger.
+
+``BalanceCheckpoint`` rows snapshot the ledger balance of a card, so the
+balance at any moment is the latest checkpoint before it plus the entries
+written in between — one index seek and a short range scan.
+"""
+
+from datetime import datetime, timezone as dt_timezone
+
+from django.db.models import DateTimeField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from accounts.models import BalanceCheckpoint, LedgerEntry
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def balance_as_of(card_id, when):
+    checkpoint = (
+        BalanceCheckpoint.objects.filter(card_id=card_id, as_of__lte=when)
+        .order_by("-as_of")
+        .first()
+    )
+    entries = LedgerEntry.objects.filter(card_id=card_id, created_at__lte=when)
+    balance = 0
+    if checkpoint is not None:
+        entries = entries.filter(created_at__gt=checkpoint.as_of)
+        balance = checkpoint.balance
+    return balance + (entries.aggregate(total=Sum("amount"))["total"] or 0)
+
+
+def with_ledger_balance(cards, as_of=None):
+    """
+    Annotate a ``Card`` queryset with the latest checkpoint before ``as_of``
+    (``checkpoint_balance``, ``checkpoint_as_of``) and ``ledger_moved``, the
+    sum of the entries written after it up to ``as_of``. Both sums are
+    ``None`` when there is nothing to add up; see ``ledger_balance``.
+    Without ``as_of`` everything committed so far is taken into account.
+    """
+    latest = BalanceCheckpoint.objects.filter(card=OuterRef("pk"))
+    entries = LedgerEntry.objects.filter(
+        card=OuterRef("pk"), created_at__gt=OuterRef("checkpoint_as_of")
+    )
+    if as_of is not None:
+        latest = latest.filter(as_of__lte=as_of)
+        entries = entries.filter(created_at__lte=as_of)
+    latest = latest.order_by("-as_of")
+    moved = entries.values("card").annotate(total=Sum("amount")).values("total")
+    return cards.annotate(
+        checkpoint_balance=Subquery(latest.values("balance")[:1]),
+        checkpoint_as_of=Coalesce(
+            Subquery(latest.values("as_of")[:1]),
+            Value(EPOCH, output_field=DateTimeField()),
+        ),
+    ).annotate(ledger_moved=Subquery(moved))
+
+
+def ledger_balance(card):
+    """Ledger balance of a card annotated by ``with_ledger_balance``."""
+    return (card.checkpoint_balance or 0) + (card.ledger_moved or 0)
@@ -0,0 +1,111 @@
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from accounts.models import Card, Payment, User
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammer a single debit card with concurrent payments and check that "
+        "the balance never goes below zero."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument("--payments", type=int, default=100, help="per thread")
+        parser.add_argument("--amount", type=Decimal, default=Decimal("1.00"))
+        parser.add_argument(
+            "--funded-ratio",
+            type=float,
+            default=0.5,
+            help="share of all attempted payments the card can afford",
+        )
+        parser.add_argument("--keep", action="store_true", help="keep test data")
+
+    def handle(self, *args, **options):
+        threads = options["threads"]
+        per_thread = options["payments"]
+        amount = options["amount"]
+        attempts = threads * per_thread
+        affordable = int(attempts * options["funded_ratio"])
+        initial_balance = amount * affordable
+
+        user = User.objects.create_user(
+            email=f"bench-{uuid.uuid4().hex}@example.com", password=None
+        )
+        card = Card.objects.create(
+            user=user,
+            card_name="Benchmark Card",
+            card_type="D",
+            currency="B",
+            balance=initial_balance,
+        )
+
+        def worker(_):
+            # У каждого потока своё соединение и свой экземпляр карты
+            own_card = Card.objects.get(pk=card.pk)
+            latencies, succeeded, rejected, errors = [], 0, 0, 0
+            try:
+                for _ in range(per_thread):
+                    started = time.perf_counter()
+                    try:
+                        success, _message = own_card.make_payment(amount, "D")
+                    except Exception:
+                        errors += 1
+                        continue
+                    finally:
+                        latencies.append(time.perf_counter() - started)
+                    if success:
+                        succeeded += 1
+                    else:
+                        rejected += 1
+            finally:
+                connection.close()
+            return latencies, succeeded, rejected, errors
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            results = list(executor.map(worker, range(threads)))
+        elapsed = time.perf_counter() - started
+
+        latencies = [latency for result in results for latency in result[0]]
+        succeeded = sum(result[1] for result in results)
+        rejected = sum(result[2] for result in results)
+        errors = sum(result[3] for result in results)
+
+        card.refresh_from_db()
+        payments = Payment.objects.filter(card=card).count()
+        expected_balance = initial_balance - amount * succeeded
+
+        p50, p95, p99 = (
+            statistics.quantiles(latencies, n=100)[i] * 1000 for i in (49, 94, 98)
+        )
+        self.stdout.write(
+            f"{attempts} payment attempts from {threads} threads in {elapsed:.2f}s "
+            f"({attempts / elapsed:.0f} payments/s)"
+        )
+        self.stdout.write(
+            f"succeeded={succeeded} rejected={rejected} errors={errors} "
+            f"p50={p50:.1f}ms p95={p95:.1f}ms p99={p99:.1f}ms"
+        )
+        self.stdout.write(
+            f"final balance={card.balance} expected={expected_balance} "
+            f"payment rows={payments}"
+        )
+
+        consistent = (
+            card.balance == expected_balance
+            and card.balance >= 0
+            and payments == succeeded
+        )
+        if not options["keep"]:
+            user.delete()
+        if not consistent:
+            raise CommandError("Card balance is inconsistent with recorded payments")
+        self.stdout.write(self.style.SUCCESS("Balance is consistent"))
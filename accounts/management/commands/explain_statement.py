@@ -0,0 +1,138 @@
+import random
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from accounts import card_numbers
+from accounts.models import Card, Payment, PaymentDailyRollup, User
+from accounts.pagination import after
+from accounts.utils import statement_queryset
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the payment table with synthetic rows and print the query plan "
+        "of the card statement queries."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument(
+            "--cards", type=int, default=100, help="cards the rows are spread over"
+        )
+        parser.add_argument(
+            "--days", type=int, default=365, help="history length in days"
+        )
+        parser.add_argument(
+            "--period", type=int, default=30, help="statement period in days"
+        )
+        parser.add_argument("--batch-size", type=int, default=10_000)
+        parser.add_argument("--keep", action="store_true", help="keep test data")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            card = self.generate(options)
+
+            end_date = timezone.now()
+            start_date = end_date - timedelta(days=options["period"])
+            payments = statement_queryset(card, start_date, end_date)
+            regular = payments.filter(deposit_pending=False).order_by("timestamp", "id")
+            # Курсор из середины периода: план должен начинать поиск с него
+            middle = regular.values_list("timestamp", "id")[
+                regular.count() // 2 :
+            ].first() or (start_date, 0)
+            page_size = settings.STATEMENT_PAGE_SIZE
+            # Те же планы, что у statement_total, но с доступом к explain()
+            queries = {
+                "first page of payments": regular[: page_size + 1],
+                "deep page of payments": after(regular, middle)[: page_size + 1],
+                "period total, closed days": PaymentDailyRollup.objects.filter(
+                    card=card,
+                    day__gte=start_date.date(),
+                    day__lt=timezone.localdate(),
+                )
+                .values("card")
+                .annotate(total_spent=Sum("debit_sum")),
+                "period total, today": Payment.objects.filter(
+                    card=card,
+                    deposit_pending=False,
+                    timestamp__gte=timezone.localtime(end_date).replace(
+                        hour=0, minute=0, second=0, microsecond=0
+                    ),
+                )
+                .values("card")
+                .annotate(total_spent=Sum("amount")),
+            }
+
+            if connection.vendor == "postgresql":
+                with connection.cursor() as cursor:
+                    cursor.execute(f"ANALYZE {Payment._meta.db_table}")
+                    cursor.execute(f"ANALYZE {PaymentDailyRollup._meta.db_table}")
+            for title, queryset in queries.items():
+                self.stdout.write(self.style.MIGRATE_HEADING(title))
+                self.stdout.write(str(queryset.query))
+                if connection.vendor == "postgresql":
+                    plan = queryset.explain(analyze=True, buffers=True)
+                else:
+                    plan = queryset.explain()
+                self.stdout.write(plan)
+
+            if not options["keep"]:
+                transaction.set_rollback(True)
+
+    def generate(self, options):
+        rows, days = options["rows"], options["days"]
+        user = User.objects.create_user(
+            email=f"explain-{uuid.uuid4().hex}@example.com", password=None
+        )
+        cards = Card.objects.bulk_create(
+            [
+                Card(
+                    user=user,
+                    card_name=f"Explain Card {i}",
+                    account_no=account_no,
+                    cvv_code=card_numbers.new_cvv(),
+                    card_type="D",
+                    currency="B",
+                )
+                for i, account_no in enumerate(
+                    card_numbers.allocator.allocate(options["cards"])
+                )
+            ]
+        )
+
+        started = time.perf_counter()
+        now = timezone.now()
+        created = 0
+        while created < rows:
+            batch = min(options["batch_size"], rows - created)
+            Payment.objects.bulk_create(
+                [
+                    Payment(
+                        card=random.choice(cards),
+                        amount=Decimal(random.randint(100, 100_000)) / 100,
+                        currency="B",
+                        card_type="D",
+                        timestamp=now
+                        - timedelta(seconds=random.uniform(0, days * 86400)),
+                        deposit_pending=random.random() < 0.2,
+                    )
+                    for _ in range(batch)
+                ],
+                update_rollups=False,
+            )
+            created += batch
+        self.stdout.write(
+            f"Inserted {created} payments over {len(cards)} cards "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+        call_command("rebuild_payment_rollups", stdout=self.stdout)
+        return cards[0]
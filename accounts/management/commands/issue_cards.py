@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from accounts.issuance import issue_cards
+
+
+class Command(BaseCommand):
+    help = (
+        "Issue cards in bulk from a CSV file with the columns "
+        "email, card_name, card_type, currency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV file")
+        parser.add_argument("--batch-size", type=int, help="cards per transaction")
+
+    def handle(self, *args, **options):
+        with open(options["path"], newline="", encoding="utf-8-sig") as lines:
+            report = issue_cards(lines, options["batch_size"])
+
+        for line, message in report.errors:
+            self.stderr.write(f"line {line}: {message}")
+        self.stdout.write(
+            f"Issued {report.created} of {report.rows} cards in {report.batches} "
+            f"batches, {report.error_count} rejected, {report.elapsed:.2f}s "
+            f"({report.rate:.0f} rows/s)"
+        )
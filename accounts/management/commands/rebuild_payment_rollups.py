@@ -0,0 +1,70 @@
+import time
+from datetime import date, datetime
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from accounts.models import Payment, PaymentDailyRollup
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily payment rollups from the payment table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--card", type=int, help="only this card id")
+        parser.add_argument(
+            "--since",
+            type=date.fromisoformat,
+            help="only days from YYYY-MM-DD on",
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        payments = Payment.objects.all()
+        rollups = PaymentDailyRollup.objects.all()
+        if options["card"]:
+            payments = payments.filter(card_id=options["card"])
+            rollups = rollups.filter(card_id=options["card"])
+        if options["since"]:
+            payments = payments.filter(
+                timestamp__gte=timezone.make_aware(
+                    datetime.combine(options["since"], datetime.min.time())
+                )
+            )
+            rollups = rollups.filter(day__gte=options["since"])
+
+        # День считается в часовом поясе проекта, как и в PaymentDailyRollup.add
+        days = (
+            payments.annotate(
+                day=TruncDate("timestamp", tzinfo=timezone.get_current_timezone())
+            )
+            .values("card_id", "day")
+            .annotate(
+                debit_sum=Sum("amount", filter=Q(deposit_pending=False), default=0),
+                credit_sum=Sum("amount", filter=Q(deposit_pending=True), default=0),
+                count=Count("id"),
+            )
+            .order_by("card_id", "day")
+        )
+
+        created = 0
+        with transaction.atomic():
+            deleted, _ = rollups.delete()
+            batch = []
+            for row in days.iterator(chunk_size=options["batch_size"]):
+                batch.append(PaymentDailyRollup(**row))
+                if len(batch) >= options["batch_size"]:
+                    PaymentDailyRollup.objects.bulk_create(batch)
+                    created += len(batch)
+                    batch = []
+            PaymentDailyRollup.objects.bulk_create(batch)
+            created += len(batch)
+
+        self.stdout.write(
+            f"Replaced {deleted} rollups with {created} "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
@@ -0,0 +1,73 @@
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from accounts.reconciliation import REPORT_FIELDS, partitions, reconcile_partition
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare every card balance with its ledger and write the cards that "
+        "disagree as CSV."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, default=os.cpu_count(), help="worker processes"
+        )
+        parser.add_argument("--partition-size", type=int, help="cards per partition")
+        parser.add_argument("--chunk-size", type=int, help="cards per query")
+        parser.add_argument("--output", help="report file (default: stdout)")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        ranges = partitions(options["partition_size"])
+        output = open(options["output"], "w", newline="") if options["output"] else None
+        report = csv.writer(output or self.stdout)
+        report.writerow(REPORT_FIELDS)
+
+        checked = found = 0
+        try:
+            for done, result in enumerate(
+                self.run(ranges, options["workers"], options["chunk_size"]), 1
+            ):
+                checked += result["checked"]
+                found += len(result["discrepancies"])
+                report.writerows(result["discrepancies"])
+                elapsed = time.perf_counter() - started
+                self.stderr.write(
+                    f"[{done}/{len(ranges)}] {checked} cards checked, "
+                    f"{found} discrepancies, {checked / elapsed:.0f} cards/s"
+                )
+        finally:
+            if output:
+                output.close()
+
+        elapsed = time.perf_counter() - started
+        self.stderr.write(
+            f"Checked {checked} cards in {elapsed:.1f}s "
+            f"({checked / elapsed if elapsed else 0:.0f} cards/s), "
+            f"{found} discrepancies"
+        )
+
+    def run(self, ranges, workers, chunk_size):
+        """Yield partition results as they finish."""
+        if workers <= 1:
+            for first_id, last_id in ranges:
+                yield reconcile_partition(first_id, last_id, chunk_size)
+            return
+
+        # Дочерние процессы не должны унаследовать открытые соединения с БД
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+            futures = [
+                pool.submit(reconcile_partition, first_id, last_id, chunk_size)
+                for first_id, last_id in ranges
+            ]
+            for future in as_completed(futures):
+                yield future.result()
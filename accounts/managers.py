@@ -1,5 +1,6 @@
 from django.contrib import auth
 from django.contrib.auth.base_user import BaseUserManager
+from django.db import models, transaction
 
 
 class UserManager(BaseUserManager):
@@ -59,3 +60,17 @@ class UserManager(BaseUserManager):
                 obj=obj,
             )
         return self.none()
+
+
+class PaymentManager(models.Manager):
+    def bulk_create(self, objs, *args, update_rollups=True, **kwargs):
+        """
+        Insert payments and add them to the daily rollups. Bulk loaders pass
+        ``update_rollups=False`` and run ``rebuild_payment_rollups`` afterwards.
+        """
+        # Без savepoint: ошибка всё равно откатит внешнюю транзакцию целиком
+        with transaction.atomic(using=self.db, savepoint=False):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            if update_rollups:
+                self.model.update_rollups(objs)
+        return objs
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:47
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class AddIndexConcurrentlyIfPostgres(AddIndexConcurrently):
+    # Индексы строятся без блокировки записи в payment; SQLite в тестах
+    # создаёт их обычным AddIndex
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_forwards(
+                self, app_label, schema_editor, from_state, to_state
+            )
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_backwards(
+                self, app_label, schema_editor, from_state, to_state
+            )
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("accounts", "0007_idempotencykey"),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyIfPostgres(
+            model_name="payment",
+            index=models.Index(
+                fields=["card", "timestamp"],
+                include=("deposit_pending", "amount"),
+                name="payment_card_ts_idx",
+            ),
+        ),
+        AddIndexConcurrentlyIfPostgres(
+            model_name="payment",
+            index=models.Index(
+                fields=["card", "deposit_pending", "timestamp"],
+                include=("amount",),
+                name="payment_card_pending_ts_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("accounts", "0008_payment_statement_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PaymentDailyRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                (
+                    "debit_sum",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                (
+                    "credit_sum",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                ("count", models.IntegerField(default=0)),
+                (
+                    "card",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_rollups",
+                        to="accounts.card",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="paymentdailyrollup",
+            constraint=models.UniqueConstraint(
+                fields=("card", "day"), name="unique_payment_rollup_per_card_day"
+            ),
+        ),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations
+from django.utils import timezone
+
+BATCH_SIZE = 5000
+
+
+def create_opening_entries(apps, schema_editor):
+    # Старая история платежей не годится для восстановления баланса,
+    # поэтому журнал каждой карты начинается с её текущего баланса
+    Card = apps.get_model("accounts", "Card")
+    LedgerEntry = apps.get_model("accounts", "LedgerEntry")
+    now = timezone.now()
+
+    cards = (
+        Card.objects.exclude(balance=0)
+        .order_by("id")
+        .values_list("id", "balance")
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    batch = []
+    for card_id, balance in cards:
+        batch.append(
+            LedgerEntry(
+                card_id=card_id,
+                kind="opening",
+                amount=balance,
+                balance_after=balance,
+                created_at=now,
+            )
+        )
+        if len(batch) >= BATCH_SIZE:
+            LedgerEntry.objects.bulk_create(batch)
+            batch = []
+    LedgerEntry.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("accounts", "0010_ledger"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_opening_entries, migrations.RunPython.noop),
+    ]
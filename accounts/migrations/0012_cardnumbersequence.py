@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:02
+
+from django.db import migrations, models
+
+SEQUENCE_NAME = "accounts_card_number_seq"
+
+
+def create_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(f"CREATE SEQUENCE IF NOT EXISTS {SEQUENCE_NAME}")
+
+
+def drop_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(f"DROP SEQUENCE IF EXISTS {SEQUENCE_NAME}")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("accounts", "0011_ledger_opening_entries"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CardNumberSequence",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("next_value", models.BigIntegerField(default=1)),
+            ],
+        ),
+        migrations.RunPython(create_sequence, drop_sequence),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("accounts", "0012_cardnumbersequence"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TaskWatermark",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("task", models.CharField(max_length=100, unique=True)),
+                ("processed_until", models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name="budgetsystem",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name="card",
+            name="daily_budget_on",
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="card",
+            name="monthly_budget_on",
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="card",
+            index=models.Index(
+                condition=models.Q(("using_system", True)),
+                fields=["daily_budget_on"],
+                name="card_daily_budget_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="card",
+            index=models.Index(
+                condition=models.Q(("using_system", True)),
+                fields=["monthly_budget_on"],
+                name="card_monthly_budget_idx",
+            ),
+        ),
+    ]
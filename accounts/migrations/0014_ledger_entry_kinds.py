@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("accounts", "0013_budget_watermarks"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="ledgerentry",
+            name="kind",
+            field=models.CharField(
+                choices=[
+                    ("opening", "Opening balance"),
+                    ("payment", "Payment"),
+                    ("deposit", "Deposit"),
+                    ("transfer_out", "Transfer out"),
+                    ("transfer_in", "Transfer in"),
+                    ("savings", "Budget savings"),
+                    ("credit_payment", "Credit payment"),
+                    ("write_off", "Debt write-off"),
+                ],
+                max_length=16,
+            ),
+        ),
+    ]
@@ -1,13 +1,16 @@
-import random
+from collections import defaultdict
+from decimal import Decimal
 
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 
 from django.contrib.auth.models import AbstractUser
-from django.db import models, transaction
+from django.db import connection, models, transaction
+from django.db.models import F, Q
 
-from .constants import CURRENCY, CARD_TYPE
-from .managers import UserManager
+from . import card_numbers
+from .constants import CURRENCY, CARD_TYPE, LEDGER_ENTRY_KIND, OPENING, PAYMENT
+from .managers import PaymentManager, UserManager
 
 
 class User(AbstractUser):
@@ -73,48 +76,92 @@ class Card(models.Model):
     cvv_code = models.CharField(max_length=3)
     card_type = models.CharField(max_length=1, choices=CARD_TYPE)
     currency = models.CharField(max_length=1, choices=CURRENCY)
+    # День и месяц (первое число), за которые задачи бюджета уже обработали карту
+    daily_budget_on = models.DateField(null=True, blank=True)
+    monthly_budget_on = models.DateField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Задачи бюджета выбирают только карты, у которых начался новый период
+            models.Index(
+                fields=["daily_budget_on"],
+                condition=Q(using_system=True),
+                name="card_daily_budget_idx",
+            ),
+            models.Index(
+                fields=["monthly_budget_on"],
+                condition=Q(using_system=True),
+                name="card_monthly_budget_idx",
+            ),
+        ]
 
     def save(self, *args, **kwargs):
         # Generate values for some fields
         if not self.account_no:
-            self.account_no = "".join(str(random.randint(0, 9)) for _ in range(16))
+            self.account_no = card_numbers.allocator.next_number()
         if not self.cvv_code:
-            self.cvv_code = random.randint(100, 999)
+            self.cvv_code = card_numbers.new_cvv()
 
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            opening = self._state.adding and self.balance
+            super().save(*args, **kwargs)
+            if opening:
+                LedgerEntry.objects.create(
+                    card=self,
+                    kind=OPENING,
+                    amount=self.balance,
+                    balance_after=self.balance,
+                )
 
     def make_payment(self, amount, card_type):
+        amount = Decimal(str(amount))
+
+        # Проверка средств и списание делаются одним условным UPDATE,
+        # поэтому два параллельных платежа не могут уйти в минус
+        cards = Card.objects.filter(pk=self.pk)
+        insufficient_funds = "Card not found"
         if card_type == "C":
             if not self.is_deposit_allowed:
                 return False, "Deposit not allowed for credits card"
         elif card_type == "D":
             if self.using_system:
-                if self.daily_balance < amount:
-                    return (
-                        False,
-                        "Insufficient funds for debit card with daily budgeting system",
-                    )
+                cards = cards.filter(daily_balance__gte=amount)
+                insufficient_funds = (
+                    "Insufficient funds for debit card with daily budgeting system"
+                )
             else:
-                if self.balance < amount:
-                    return False, "Insufficient funds for debit card"
+                cards = cards.filter(balance__gte=amount)
+                insufficient_funds = "Insufficient funds for debit card"
         else:
             return False, "Invalid card type"
 
+        updates = {"balance": F("balance") - amount}
+        if self.using_system:
+            updates["daily_balance"] = F("daily_balance") - amount
+
         # Perform the payment transaction
         with transaction.atomic():
-            # Create a Payment record
+            if not cards.update(**updates):
+                return False, insufficient_funds
+
             Payment.objects.create(
                 card=self,
                 amount=amount,
                 currency="B",
                 card_type=card_type,
             )
+            # Строка заблокирована нашим UPDATE, баланс после списания точный
+            balance_after = Card.objects.values_list("balance", flat=True).get(
+                pk=self.pk
+            )
+            LedgerEntry.objects.create(
+                card=self, kind=PAYMENT, amount=-amount, balance_after=balance_after
+            )
 
-            # Update the card balance
-            self.balance -= amount
-            if self.using_system:
-                self.daily_balance -= amount
-            self.save()
+        # Keep the in-memory instance in line with what was written
+        self.balance = balance_after
+        if self.using_system:
+            self.daily_balance = Decimal(str(self.daily_balance)) - amount
 
         return True, "Payment successful"
 
@@ -138,6 +185,7 @@ class BudgetSystem(models.Model):
     savings_percent = models.PositiveIntegerField(
         validators=[MinValueValidator(0), MaxValueValidator(100)], default=30
     )
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def save(self, *args, **kwargs):
         if not self.savings_card:
@@ -165,5 +213,219 @@ class Payment(models.Model):
     timestamp = models.DateTimeField(default=timezone.now)
     deposit_pending = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # Выписка за период: строки и итог читаются прямо из индекса
+            models.Index(
+                fields=["card", "timestamp"],
+                include=["deposit_pending", "amount"],
+                name="payment_card_ts_idx",
+            ),
+            models.Index(
+                fields=["card", "deposit_pending", "timestamp"],
+                include=["amount"],
+                name="payment_card_pending_ts_idx",
+            ),
+        ]
+
+    objects = PaymentManager()
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            previous = None
+            if not self._state.adding:
+                previous = Payment.objects.filter(pk=self.pk).first()
+            super().save(*args, **kwargs)
+            if previous is not None:
+                PaymentDailyRollup.add([previous], sign=-1)
+            PaymentDailyRollup.add([self])
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            PaymentDailyRollup.add([self], sign=-1)
+            return super().delete(*args, **kwargs)
+
+    @staticmethod
+    def update_rollups(payments):
+        PaymentDailyRollup.add(payments)
+
     def __str__(self):
         return f"{self.card.id} - {self.amount} {self.currency} ({self.timestamp})"
+
+
+class PaymentDailyRollup(models.Model):
+    """Per card and day totals of ``Payment``, kept up to date on every write."""
+
+    card = models.ForeignKey(
+        Card,
+        related_name="daily_rollups",
+        on_delete=models.CASCADE,
+    )
+    day = models.DateField()
+    # debit — обычные платежи, credit — ожидающие зачисления пополнения
+    debit_sum = models.DecimalField(default=0, max_digits=14, decimal_places=2)
+    credit_sum = models.DecimalField(default=0, max_digits=14, decimal_places=2)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["card", "day"], name="unique_payment_rollup_per_card_day"
+            )
+        ]
+
+    @classmethod
+    def add(cls, payments, sign=1):
+        """Add (or with ``sign=-1`` subtract) ``payments`` to their rollups."""
+        deltas = defaultdict(lambda: [Decimal(0), Decimal(0), 0])
+        for payment in payments:
+            delta = deltas[(payment.card_id, timezone.localdate(payment.timestamp))]
+            delta[1 if payment.deposit_pending else 0] += (
+                Decimal(str(payment.amount)) * sign
+            )
+            delta[2] += sign
+
+        if not deltas:
+            return
+        # Один INSERT ... ON CONFLICT на все строки вместо UPDATE и INSERT на
+        # каждую; строки в фиксированном порядке, чтобы не ловить deadlock
+        rows = sorted(deltas.items())
+        quote = connection.ops.quote_name
+        table = quote(cls._meta.db_table)
+        columns = ["card_id", "day", "debit_sum", "credit_sum", "count"]
+        increments = ", ".join(
+            f"{quote(column)} = {table}.{quote(column)} + EXCLUDED.{quote(column)}"
+            for column in columns[2:]
+        )
+        values = ", ".join(["(%s, %s, %s, %s, %s)"] * len(rows))
+        params = []
+        for (card_id, day), (debit, credit, count) in rows:
+            params += [
+                card_id,
+                connection.ops.adapt_datefield_value(day),
+                connection.ops.adapt_decimalfield_value(debit, 14, 2),
+                connection.ops.adapt_decimalfield_value(credit, 14, 2),
+                count,
+            ]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(map(quote, columns))}) "
+                f"VALUES {values} "
+                f"ON CONFLICT ({quote('card_id')}, {quote('day')}) "
+                f"DO UPDATE SET {increments}",
+                params,
+            )
+
+    def __str__(self):
+        return f"{self.card_id} {self.day}: -{self.debit_sum} +{self.credit_sum}"
+
+
+class CardNumberSequence(models.Model):
+    """
+    Card number sequence for databases without native sequences. On
+    PostgreSQL ``accounts.card_numbers`` uses a real sequence instead.
+    """
+
+    next_value = models.BigIntegerField(default=1)
+
+
+class LedgerEntry(models.Model):
+    """
+    One leg of a balance change, written in the same transaction as the change.
+
+    Entries are append-only: ``amount`` is signed and ``balance_after`` is the
+    card balance right after the change.
+    """
+
+    card = models.ForeignKey(
+        Card,
+        related_name="ledger_entries",
+        on_delete=models.CASCADE,
+    )
+    transfer = models.ForeignKey(
+        "transactions.Transaction",
+        related_name="ledger_entries",
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+    )
+    kind = models.CharField(max_length=16, choices=LEDGER_ENTRY_KIND)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    balance_after = models.DecimalField(max_digits=12, decimal_places=2)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["card", "created_at"],
+                include=["amount"],
+                name="ledger_card_created_idx",
+            )
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Ledger entries cannot be changed.")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("Ledger entries cannot be deleted.")
+
+    def __str__(self):
+        return f"{self.card_id} {self.kind} {self.amount} -> {self.balance_after}"
+
+
+class BalanceCheckpoint(models.Model):
+    """Card balance derived from the ledger at ``as_of``."""
+
+    card = models.ForeignKey(
+        Card,
+        related_name="balance_checkpoints",
+        on_delete=models.CASCADE,
+    )
+    balance = models.DecimalField(max_digits=12, decimal_places=2)
+    as_of = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["card", "as_of"], name="checkpoint_card_as_of_idx")
+        ]
+
+    def __str__(self):
+        return f"{self.card_id} {self.balance} @ {self.as_of}"
+
+
+class IdempotencyKey(models.Model):
+    user = models.ForeignKey(
+        User,
+        related_name="idempotency_keys",
+        on_delete=models.CASCADE,
+    )
+    key = models.CharField(max_length=64)
+    scope = models.CharField(max_length=32)
+    completed = models.BooleanField(default=False)
+    succeeded = models.BooleanField(default=False)
+    message = models.CharField(max_length=255, blank=True)
+    redirect_to = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "key"], name="unique_idempotency_key_per_user"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}:{self.key} ({self.scope})"
+
+
+class TaskWatermark(models.Model):
+    """Time up to which a periodic task has seen changes."""
+
+    task = models.CharField(max_length=100, unique=True)
+    processed_until = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.task}: {self.processed_until}"
@@ -0,0 +1,118 @@
+"""
+TOTP verification for the login form.
+
+Only the id and name of the user's confirmed TOTP device are cached, and
+users without a device are cached as such. The secret key is never put in
+the cache: ``verify`` loads the device by primary key when it checks a
+token. Accepted time steps and failed attempts are kept in the cache (Redis)
+instead of the device's ``last_t`` and throttling columns: a token is
+accepted once within its validity window and ``OTP_MAX_FAILURES`` wrong
+tokens lock verification for ``OTP_FAILURE_WINDOW`` seconds.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django_otp.oath import TOTP
+from django_otp.plugins.otp_totp.models import TOTPDevice
+
+# Кэшируем и отсутствие устройства, чтобы не ходить в БД на каждую попытку
+NO_DEVICE = 0
+
+
+def _cache():
+    return caches[settings.OTP_CACHE_ALIAS]
+
+
+def _device_key(user_id):
+    return f"otp:device:{user_id}"
+
+
+def _failures_key(user_id):
+    return f"otp:failures:{user_id}"
+
+
+def device_summary(user_id):
+    """
+    Return ``{"id", "persistent_id", "name"}`` of the user's confirmed TOTP
+    device or ``None``.
+    """
+    key = _device_key(user_id)
+    summary = _cache().get(key)
+    if summary is None:
+        # Только несекретные поля: ключ устройства в Redis не кладём
+        summary = (
+            TOTPDevice.objects.filter(user_id=user_id, confirmed=True)
+            .order_by("id")
+            .values("id", "name")
+            .first()
+        )
+        if summary is not None:
+            summary["persistent_id"] = f"{TOTPDevice.model_label()}/{summary['id']}"
+        _cache().set(key, summary or NO_DEVICE, settings.OTP_DEVICE_CACHE_TTL)
+    return summary or None
+
+
+@receiver(post_save, sender=TOTPDevice)
+@receiver(post_delete, sender=TOTPDevice)
+def invalidate_device(sender, instance, **kwargs):
+    _cache().delete(_device_key(instance.user_id))
+
+
+def failures(user_id):
+    return _cache().get(_failures_key(user_id), 0)
+
+
+def is_locked_out(user_id):
+    return failures(user_id) >= settings.OTP_MAX_FAILURES
+
+
+def _record_failure(user_id):
+    key = _failures_key(user_id)
+    # Окно не продлевается последующими ошибками: incr не меняет TTL
+    _cache().add(key, 0, settings.OTP_FAILURE_WINDOW)
+    try:
+        _cache().incr(key)
+    except ValueError:
+        # Ключ истёк между add и incr
+        _cache().set(key, 1, settings.OTP_FAILURE_WINDOW)
+
+
+def verify(user, token):
+    """
+    Check ``token`` against the user's TOTP device.
+
+    Returns the device when the token is valid and hasn't been used before,
+    otherwise ``None``. Doesn't check the lockout, see ``is_locked_out``.
+    """
+    summary = device_summary(user.pk)
+    if summary is None:
+        return None
+
+    try:
+        token = int(token)
+    except (TypeError, ValueError):
+        _record_failure(user.pk)
+        return None
+
+    device = TOTPDevice.objects.filter(pk=summary["id"], confirmed=True).first()
+    if device is None:
+        return None
+
+    totp = TOTP(device.bin_key, device.step, device.t0, device.digits, device.drift)
+    totp.time = time.time()
+    if not totp.verify(token, device.tolerance):
+        _record_failure(user.pk)
+        return None
+
+    # Шаг с учётом допуска принимается максимум (2 * tolerance + 1) шагов
+    used_for = device.step * (2 * device.tolerance + 2)
+    if not _cache().add(f"otp:used:{device.pk}:{totp.t()}", 1, used_for):
+        _record_failure(user.pk)
+        return None
+
+    _cache().delete(_failures_key(user.pk))
+    return device
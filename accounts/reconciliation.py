@@ -0,0 +1,75 @@
+"""
+Card balance vs ledger reconciliation.
+
+Cards are split into id ranges so the work can be spread over processes
+(``manage.py reconcile_balances``) or Celery workers (``reconcile_balances_all``).
+Every range is read in chunks; one query per chunk returns the stored balance
+next to the ledger balance, both from the same snapshot.
+"""
+
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Max, Min
+
+from accounts.ledger import ledger_balance, with_ledger_balance
+from accounts.models import Card
+
+REPORT_FIELDS = ["card_id", "balance", "ledger_balance", "difference"]
+CENT = Decimal("0.01")
+
+
+def partitions(size=None):
+    """Split the card id space into ``(first_id, last_id)`` ranges."""
+    size = size or settings.RECONCILE_PARTITION_SIZE
+    bounds = Card.objects.aggregate(first_id=Min("id"), last_id=Max("id"))
+    if bounds["first_id"] is None:
+        return []
+    return [
+        (first_id, first_id + size - 1)
+        for first_id in range(bounds["first_id"], bounds["last_id"] + 1, size)
+    ]
+
+
+def reconcile_partition(first_card_id, last_card_id, chunk_size=None):
+    """
+    Compare balances of the cards in the id range with their ledger.
+
+    Returns ``{"checked", "discrepancies", "elapsed"}`` where discrepancies are
+    ``[card_id, balance, ledger_balance, difference]`` rows with string amounts.
+    """
+    started = time.perf_counter()
+    chunk_size = chunk_size or settings.RECONCILE_CHUNK_SIZE
+    checked, discrepancies = 0, []
+    last_seen_id = first_card_id - 1
+    while True:
+        cards = list(
+            with_ledger_balance(
+                Card.objects.filter(id__gt=last_seen_id, id__lte=last_card_id)
+            )
+            .only("id", "balance")
+            .order_by("id")[:chunk_size]
+        )
+        if not cards:
+            break
+        last_seen_id = cards[-1].id
+        checked += len(cards)
+
+        for card in cards:
+            expected = Decimal(ledger_balance(card)).quantize(CENT)
+            if card.balance != expected:
+                discrepancies.append(
+                    [
+                        card.id,
+                        str(card.balance),
+                        str(expected),
+                        str(card.balance - expected),
+                    ]
+                )
+
+    return {
+        "checked": checked,
+        "discrepancies": discrepancies,
+        "elapsed": time.perf_counter() - started,
+    }
@@ -1,85 +1,459 @@
-from celery import shared_task
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from smtplib import SMTPException
+
+from celery import chord, shared_task
+from celery.signals import worker_process_shutdown
+from django.conf import settings
 from django.contrib.admin.models import LogEntry, CHANGE
 from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import F, Max, Min, Q
 from django.utils import timezone
 
-from accounts.models import Card, BudgetSystem
+from accounts import emails
+from accounts.constants import DEPOSIT, SAVINGS, WRITE_OFF
+from accounts.exchange_rates import get_service
+from accounts.ledger import ledger_balance, with_ledger_balance
+from accounts.models import (
+    User,
+    Card,
+    BudgetSystem,
+    IdempotencyKey,
+    LedgerEntry,
+    BalanceCheckpoint,
+    TaskWatermark,
+)
+from accounts.reconciliation import partitions, reconcile_partition
+from accounts.utils import adjust_balances
+from core.locks import single_instance
+
+logger = logging.getLogger(__name__)
+
+CENT = Decimal("0.01")
 
 
 @shared_task
+@single_instance()
 def check_credit_card_payments():
     # Эту функцию нужно будет вызывать из celery beat в начале каждого месяца
-    current_month = timezone.now().month
-    credit_cards = Card.objects.filter(card_type="C")
-
-    for credit_card in credit_cards:
-        # Проверка и погашение задолженности для каждой кредитной карты(временно)
-        if credit_card.balance < 0 and credit_card.last_payment_month != current_month:
-            credit_card.balance = 0
-            credit_card.last_payment_month = current_month
-            credit_card.save()
+    # Погашение задолженности по кредитным картам (временно)
+    with transaction.atomic():
+        debts = (
+            Card.objects.select_for_update()
+            .filter(card_type="C", balance__lt=0)
+            .values_list("id", "balance")
+        )
+        written_off = adjust_balances(
+            {card_id: -balance for card_id, balance in debts}, WRITE_OFF
+        )
+    return len(written_off)
 
 
 @shared_task
+@single_instance()
 def process_pending_deposits():
-    # Get cards with pending deposits
-    cards = Card.objects.filter(is_deposit_allowed=True, pending_deposit_amount__gt=0)
-
-    for card in cards:
-        # Process the deposit and update the balance
-        card.balance += card.pending_deposit_amount
-        card.pending_deposit_amount = 0
-        card.save()
-        user_id = card.user.id
-
-        # Log the deposit in the admin panel
-        content_type = ContentType.objects.get_for_model(card)
-        LogEntry.objects.create(
-            user_id=user_id,  # Use the appropriate user ID
-            content_type_id=content_type.id,
-            object_id=card.id,
-            object_repr=str(card),
-            action_flag=CHANGE,
-            change_message="Manual deposit processed.",
-        )
+    started = time.perf_counter()
+    processed = chunks = 0
+    content_type = ContentType.objects.get_for_model(Card)
+
+    while True:
+        with transaction.atomic():
+            # Занятые другим воркером карты пропускаем, а не ждём
+            cards = list(
+                Card.objects.select_for_update(skip_locked=True, of=("self",))
+                .filter(is_deposit_allowed=True, pending_deposit_amount__gt=0)
+                .select_related("user")
+                .order_by("id")[: settings.DEPOSIT_TASK_CHUNK_SIZE]
+            )
+            if not cards:
+                break
+
+            Card.objects.filter(pk__in=[card.pk for card in cards]).update(
+                balance=F("balance") + F("pending_deposit_amount"),
+                pending_deposit_amount=0,
+            )
+            entries = []
+            for card in cards:
+                card.balance += card.pending_deposit_amount
+                entries.append(
+                    LedgerEntry(
+                        card=card,
+                        kind=DEPOSIT,
+                        amount=card.pending_deposit_amount,
+                        balance_after=card.balance,
+                    )
+                )
+                card.pending_deposit_amount = 0
+            LedgerEntry.objects.bulk_create(entries)
+
+            # Log the deposits in the admin panel
+            LogEntry.objects.bulk_create(
+                [
+                    LogEntry(
+                        user_id=card.user_id,
+                        content_type_id=content_type.id,
+                        object_id=card.id,
+                        object_repr=str(card)[:200],
+                        action_flag=CHANGE,
+                        change_message="Manual deposit processed.",
+                    )
+                    for card in cards
+                ]
+            )
+
+        processed += len(cards)
+        chunks += 1
+
+    return _report("process_pending_deposits", processed, chunks, started)
 
 
 @shared_task
+@single_instance()
 def recount_daily_budget():
-    cards = Card.objects.filter(using_system=True)
-
-    for card in cards:
-        system = BudgetSystem.objects.filter(card=card.id).first()
-        if system.daily_redirect and (system.savings_card is not None):
-            card.balance -= card.daily_balance
-            card.daily_balance = 0
-            system.savings_card.balance += card.daily_balance
-            card.save()
-            system.savings_card.save()
-        if card.balance > card.fixated_sum:
-            card.daily_balance += card.fixated_sum
-        else:
-            card.daily_balance += card.balance
-        card.save()
+    started = time.perf_counter()
+    # Карты, уже пересчитанные сегодня, не трогаем: стоимость прогона зависит
+    # от числа карт с новым днём, а не от всех карт с системой
+    today = timezone.localdate()
+    processed = chunks = last_card_id = 0
+    while True:
+        with transaction.atomic():
+            systems, last_card_id = _budget_chunk(
+                last_card_id,
+                settings.BUDGET_TASK_CHUNK_SIZE,
+                selected=_due("daily_budget_on", today),
+            )
+            if not systems:
+                break
+
+            cards, savings_moves = [], defaultdict(Decimal)
+            for system in systems:
+                card = system.card
+                if system.daily_redirect and system.savings_card_id is not None:
+                    # Остаток дневного бюджета уходит на накопительную карту
+                    savings_moves[system.savings_card_id] += card.daily_balance
+                    savings_moves[card.id] -= card.daily_balance
+                    card.balance -= card.daily_balance
+                    card.daily_balance = 0
+                if card.balance > card.fixated_sum:
+                    card.daily_balance += card.fixated_sum
+                else:
+                    card.daily_balance += card.balance
+                card.daily_budget_on = today
+                cards.append(card)
+
+            # Баланс меняет только adjust_balances, вместе с записями журнала
+            Card.objects.bulk_update(cards, ["daily_balance", "daily_budget_on"])
+            adjust_balances(savings_moves, SAVINGS)
+
+        processed += len(cards)
+        chunks += 1
+
+    return _report("recount_daily_budget", processed, chunks, started)
 
 
 @shared_task()
+@single_instance()
 def count_monthly_budget_all():
-    cards = Card.objects.filter(using_system=True)
+    # Берём только карты с новым месяцем и карты, чья система изменилась после
+    # прошлого прогона; изменения в последние секунды могут быть не закоммичены,
+    # поэтому следующий прогон перекрывает их ещё раз
+    since = _watermark("count_monthly_budget_all")
+    processed_until = timezone.now() - timedelta(
+        seconds=settings.BUDGET_WATERMARK_OVERLAP
+    )
+    selected = _due("monthly_budget_on", _month_start())
+    if since is not None:
+        selected |= Q(updated_at__gt=since)
+
+    # Делим карты на диапазоны id и обрабатываем их параллельно на воркерах
+    bounds = BudgetSystem.objects.filter(selected, card__using_system=True).aggregate(
+        first_id=Min("card_id"), last_id=Max("card_id")
+    )
+    if bounds["first_id"] is None:
+        _advance_watermark("count_monthly_budget_all", processed_until)
+        return {"partitions": 0}
 
-    for card in cards:
-        count_monthly_budget(card.id)
+    size = settings.BUDGET_PARTITION_SIZE
+    changed_since = since.isoformat() if since is not None else None
+    partitions = [
+        count_monthly_budget_partition.s(first_id, first_id + size - 1, changed_since)
+        for first_id in range(bounds["first_id"], bounds["last_id"] + 1, size)
+    ]
+    chord(partitions)(
+        summarize_monthly_budget.s(processed_until=processed_until.isoformat())
+    )
+    return {"partitions": len(partitions)}
+
+
+@shared_task
+@single_instance(
+    key=lambda first_card_id, last_card_id, changed_since=None: (
+        f"{first_card_id}-{last_card_id}"
+    )
+)
+def count_monthly_budget_partition(first_card_id, last_card_id, changed_since=None):
+    started = time.perf_counter()
+    month = _month_start()
+    selected = _due("monthly_budget_on", month)
+    if changed_since is not None:
+        selected |= Q(updated_at__gt=datetime.fromisoformat(changed_since))
+    processed = chunks = 0
+    last_seen_id = first_card_id - 1
+    while True:
+        with transaction.atomic():
+            systems, last_seen_id = _budget_chunk(
+                last_seen_id, settings.BUDGET_TASK_CHUNK_SIZE, last_card_id, selected
+            )
+            if not systems:
+                break
+
+            cards, savings_moves = [], defaultdict(Decimal)
+            for system in systems:
+                card = system.card
+                # Изменённую в этом месяце систему только перефиксируем,
+                # накопления за месяц уже перечислены
+                due = card.monthly_budget_on is None or card.monthly_budget_on < month
+                if system.daily_control:
+                    card.fixated_sum = card.balance * system.daily_percent / 100
+                    if due:
+                        card.daily_balance = card.fixated_sum
+                if due and system.savings_card_id is not None:
+                    savings = (card.balance * system.savings_percent / 100).quantize(
+                        CENT, rounding=ROUND_HALF_UP
+                    )
+                    savings_moves[system.savings_card_id] += savings
+                    savings_moves[card.id] -= savings
+                card.monthly_budget_on = month
+                cards.append(card)
+
+            # Баланс меняет только adjust_balances, вместе с записями журнала
+            Card.objects.bulk_update(
+                cards, ["daily_balance", "fixated_sum", "monthly_budget_on"]
+            )
+            adjust_balances(savings_moves, SAVINGS)
+
+        processed += len(cards)
+        chunks += 1
+
+    return _report(
+        f"count_monthly_budget_partition[{first_card_id}-{last_card_id}]",
+        processed,
+        chunks,
+        started,
+    )
+
+
+@shared_task
+def summarize_monthly_budget(results, processed_until=None):
+    # Партиции, которые ещё считает параллельный прогон, вернули skipped
+    results = [result for result in results if not result.get("skipped")]
+    processed = sum(result["processed"] for result in results)
+    chunks = sum(result["chunks"] for result in results)
+    # Время самой долгой партиции — это и есть время всего прогона
+    elapsed = max((result["elapsed"] for result in results), default=0)
+    logger.info(
+        "count_monthly_budget_all: %d cards in %d partitions (%d chunks), "
+        "slowest partition %.2fs",
+        processed,
+        len(results),
+        chunks,
+        elapsed,
+    )
+    if processed_until is not None:
+        _advance_watermark(
+            "count_monthly_budget_all", datetime.fromisoformat(processed_until)
+        )
+    return {
+        "processed": processed,
+        "partitions": len(results),
+        "chunks": chunks,
+        "elapsed": elapsed,
+    }
 
 
 def count_monthly_budget(card_id):
-    card = Card.objects.filter(id=card_id).first()
-    system = BudgetSystem.objects.filter(card=card.id).first()
-    if system.daily_control:
-        card.fixated_sum = card.balance * system.daily_percent / 100
-        card.daily_balance = card.fixated_sum
-        card.save()
-    if system.savings_card is not None:
-        system.savings_card.balance += card.balance * system.savings_percent / 100
-        card.balance -= card.balance * system.savings_percent / 100
-        card.save()
-        system.savings_card.save()
+    return count_monthly_budget_partition(card_id, card_id)
+
+
+@shared_task(
+    autoretry_for=(SMTPException, OSError),
+    retry_backoff=True,
+    retry_backoff_max=600,
+    retry_jitter=True,
+    max_retries=8,
+)
+def send_signup_email(user_id):
+    user = User.objects.filter(pk=user_id).first()
+    if user is None:
+        return 0
+    return emails.send([emails.signup_message(user)])
+
+
+@worker_process_shutdown.connect
+def close_email_connection(**kwargs):
+    emails.close_connection()
+
+
+@shared_task
+@single_instance()
+def refresh_exchange_rates():
+    get_service().refresh()
+
+
+@shared_task
+@single_instance()
+def purge_expired_idempotency_keys():
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
+
+
+@shared_task
+@single_instance()
+def reconcile_balances_all():
+    ranges = partitions()
+    if not ranges:
+        return {"partitions": 0}
+    chord(
+        [
+            reconcile_balances_partition.s(first_id, last_id)
+            for first_id, last_id in ranges
+        ]
+    )(summarize_reconciliation.s())
+    return {"partitions": len(ranges)}
+
+
+@shared_task
+def reconcile_balances_partition(first_card_id, last_card_id):
+    result = reconcile_partition(first_card_id, last_card_id)
+    for card_id, balance, expected, difference in result["discrepancies"]:
+        logger.warning(
+            "Card %s balance %s differs from ledger %s by %s",
+            card_id,
+            balance,
+            expected,
+            difference,
+        )
+    return {
+        "processed": result["checked"],
+        "discrepancies": len(result["discrepancies"]),
+        "elapsed": result["elapsed"],
+    }
+
+
+@shared_task
+def summarize_reconciliation(results):
+    processed = sum(result["processed"] for result in results)
+    discrepancies = sum(result["discrepancies"] for result in results)
+    elapsed = max((result["elapsed"] for result in results), default=0)
+    logger.info(
+        "reconcile_balances_all: %d cards in %d partitions, %d discrepancies, "
+        "slowest partition %.2fs",
+        processed,
+        len(results),
+        discrepancies,
+        elapsed,
+    )
+    return {
+        "processed": processed,
+        "partitions": len(results),
+        "discrepancies": discrepancies,
+        "elapsed": elapsed,
+    }
+
+
+@shared_task
+@single_instance()
+def checkpoint_balances():
+    started = time.perf_counter()
+    # Свежие записи могут ещё не быть закоммичены, их заберёт следующий запуск
+    as_of = timezone.now() - timedelta(seconds=settings.LEDGER_CHECKPOINT_DELAY)
+    processed = chunks = last_card_id = 0
+    while True:
+        cards = list(
+            with_ledger_balance(Card.objects.filter(id__gt=last_card_id), as_of)
+            .only("id")
+            .order_by("id")[: settings.CHECKPOINT_TASK_CHUNK_SIZE]
+        )
+        if not cards:
+            break
+        last_card_id = cards[-1].id
+
+        checkpoints = [
+            BalanceCheckpoint(card=card, balance=ledger_balance(card), as_of=as_of)
+            for card in cards
+            if card.ledger_moved is not None
+        ]
+        BalanceCheckpoint.objects.bulk_create(checkpoints)
+        processed += len(checkpoints)
+        chunks += 1
+
+    return _report("checkpoint_balances", processed, chunks, started)
+
+
+def _budget_chunk(after_card_id, chunk_size, last_card_id=None, selected=None):
+    """
+    Lock the next ``chunk_size`` budgeting cards after ``after_card_id`` (up to
+    ``last_card_id``) and return their budgeting systems joined with the cards,
+    plus the last card id seen. Only the first system of every card is used.
+    ``selected`` narrows the systems further (a ``Q`` on ``BudgetSystem``).
+    """
+    systems = BudgetSystem.objects.select_for_update(of=("card",)).filter(
+        card__using_system=True, card_id__gt=after_card_id
+    )
+    if last_card_id is not None:
+        systems = systems.filter(card_id__lte=last_card_id)
+    if selected is not None:
+        systems = systems.filter(selected)
+    systems = list(
+        systems.select_related("card").order_by("card_id", "id")[:chunk_size]
+    )
+    if not systems:
+        return [], after_card_id
+
+    first_systems = {}
+    for system in systems:
+        first_systems.setdefault(system.card_id, system)
+    return list(first_systems.values()), systems[-1].card_id
+
+
+def _month_start():
+    return timezone.localdate().replace(day=1)
+
+
+def _due(marker, period_start):
+    """Systems whose card wasn't processed since ``period_start`` by ``marker``."""
+    return Q(**{f"card__{marker}__isnull": True}) | Q(
+        **{f"card__{marker}__lt": period_start}
+    )
+
+
+def _watermark(task_name):
+    return (
+        TaskWatermark.objects.filter(task=task_name)
+        .values_list("processed_until", flat=True)
+        .first()
+    )
+
+
+def _advance_watermark(task_name, processed_until):
+    TaskWatermark.objects.update_or_create(
+        task=task_name, defaults={"processed_until": processed_until}
+    )
+
+
+def _report(task_name, processed, chunks, started):
+    elapsed = time.perf_counter() - started
+    rate = processed / elapsed if elapsed else 0
+    logger.info(
+        "%s: %d cards in %d chunks, %.2fs (%.0f cards/s)",
+        task_name,
+        processed,
+        chunks,
+        elapsed,
+        rate,
+    )
+    return {"processed": processed, "chunks": chunks, "elapsed": elapsed}
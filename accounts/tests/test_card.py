@@ -1,10 +1,16 @@
 from decimal import Decimal
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
-from accounts.models import Card
+from accounts.card_numbers import (
+    CardNumberAllocator,
+    card_number,
+    is_luhn_valid,
+    luhn_check_digit,
+)
+from accounts.models import Card, Payment
 from accounts.utils import convert_currency
 
 User = get_user_model()
@@ -55,6 +61,46 @@ class CardModelTest(TestCase):
         self.assertFalse(success)
         self.assertEqual(message, "Invalid card type")
 
+    def test_make_payment_debit_card_insufficient_funds(self):
+        card = Card.objects.create(user=self.user, balance=100, card_type="D")
+
+        success, message = card.make_payment(Decimal("150"), "D")
+
+        self.assertFalse(success)
+        self.assertEqual(message, "Insufficient funds for debit card")
+        card.refresh_from_db()
+        self.assertEqual(card.balance, 100)
+        self.assertFalse(Payment.objects.filter(card=card).exists())
+
+    def test_make_payment_checks_current_balance(self):
+        card = Card.objects.create(user=self.user, balance=100, card_type="D")
+        # Второй экземпляр с устаревшим балансом не должен уйти в минус
+        stale_card = Card.objects.get(pk=card.pk)
+
+        self.assertTrue(card.make_payment(Decimal("80"), "D")[0])
+        success, _ = stale_card.make_payment(Decimal("80"), "D")
+
+        self.assertFalse(success)
+        card.refresh_from_db()
+        self.assertEqual(card.balance, 20)
+        self.assertEqual(Payment.objects.filter(card=card).count(), 1)
+
+    def test_make_payment_with_budgeting_system(self):
+        card = Card.objects.create(
+            user=self.user,
+            balance=300,
+            daily_balance=50,
+            using_system=True,
+            card_type="D",
+        )
+
+        self.assertFalse(card.make_payment(Decimal("60"), "D")[0])
+        self.assertTrue(card.make_payment(Decimal("40"), "D")[0])
+
+        card.refresh_from_db()
+        self.assertEqual(card.balance, 260)
+        self.assertEqual(card.daily_balance, 10)
+
     def test_make_payment_conversion(self):
         # Тестирование правильной конвертации валют при выполнении платежа
 
@@ -72,6 +118,56 @@ class CardModelTest(TestCase):
         )
 
 
+class CardNumberAllocatorTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="testuser@example.com", password="testpassword123"
+        )
+
+    def test_luhn_check_digit(self):
+        self.assertEqual(luhn_check_digit("7992739871"), "3")
+        self.assertTrue(is_luhn_valid("4111111111111111"))
+        self.assertFalse(is_luhn_valid("4111111111111112"))
+
+    def test_new_cards_get_unique_luhn_valid_numbers(self):
+        cards = [Card.objects.create(user=self.user) for _ in range(20)]
+
+        numbers = {card.account_no for card in cards}
+        self.assertEqual(len(numbers), 20)
+        for number in numbers:
+            self.assertEqual(len(number), 16)
+            self.assertTrue(number.startswith("415247"))
+            self.assertTrue(is_luhn_valid(number))
+
+    def test_cvv_is_three_digit_string(self):
+        card = Card.objects.create(user=self.user)
+
+        card.refresh_from_db()
+        self.assertRegex(card.cvv_code, r"^\d{3}$")
+
+    @override_settings(CARD_NUMBER_BLOCK_SIZE=10)
+    def test_allocator_reserves_blocks(self):
+        allocator = CardNumberAllocator()
+
+        first = allocator.allocate(3)
+        with self.assertNumQueries(0):
+            second = allocator.allocate(7)
+        third = allocator.allocate(25)
+
+        self.assertEqual(len(set(first + second + third)), 35)
+
+    def test_allocator_drops_block_after_fork(self):
+        allocator = CardNumberAllocator()
+        allocator.allocate(1)
+        parent_numbers = [card_number(value) for value in allocator._reserved]
+
+        # Как будто мы в дочернем процессе после fork
+        allocator._pid = -1
+        child_numbers = allocator.allocate(len(parent_numbers))
+
+        self.assertFalse(set(child_numbers) & set(parent_numbers))
+
+
 class ChangePasswordViewTest(TestCase):
     def setUp(self):
         self.user_data = {
@@ -0,0 +1,82 @@
+from smtplib import SMTPServerDisconnected
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django_otp.plugins.otp_totp.models import TOTPDevice
+
+from accounts import emails
+from banking_system.celery import app
+
+User = get_user_model()
+
+
+class SignUpEmailTest(TestCase):
+    def setUp(self):
+        app.conf.task_always_eager = True
+
+    def tearDown(self):
+        app.conf.task_always_eager = False
+        emails.close_connection()
+
+    def test_signup_sends_email_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.client.post(
+                reverse("signup"),
+                {
+                    "email": "newuser@example.com",
+                    "password1": "Sup3r-secret-pass",
+                    "password2": "Sup3r-secret-pass",
+                },
+            )
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(callbacks), 1)
+        user = User.objects.get(email="newuser@example.com")
+        self.assertEqual(TOTPDevice.objects.filter(user=user).count(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["newuser@example.com"])
+
+
+class EmailConnectionTest(TestCase):
+    def tearDown(self):
+        emails.close_connection()
+
+    def message(self):
+        return mail.EmailMessage("subject", "body", to=["user@example.com"])
+
+    def test_connection_is_reused(self):
+        with mock.patch(
+            "accounts.emails.get_connection", wraps=mail.get_connection
+        ) as get_connection:
+            emails.send([self.message()])
+            emails.send([self.message()])
+
+        self.assertEqual(get_connection.call_count, 1)
+        self.assertEqual(len(mail.outbox), 2)
+
+    @override_settings(EMAIL_CONNECTION_MAX_MESSAGES=1)
+    def test_connection_is_recycled(self):
+        with mock.patch(
+            "accounts.emails.get_connection", wraps=mail.get_connection
+        ) as get_connection:
+            emails.send([self.message()])
+            emails.send([self.message()])
+
+        self.assertEqual(get_connection.call_count, 2)
+
+    def test_connection_is_reopened_after_failure(self):
+        emails.send([self.message()])
+        with mock.patch.object(
+            emails._local.connection,
+            "send_messages",
+            side_effect=SMTPServerDisconnected,
+        ):
+            with self.assertRaises(SMTPServerDisconnected):
+                emails.send([self.message()])
+
+        self.assertIsNone(emails._local.connection)
+        emails.send([self.message()])
+        self.assertEqual(len(mail.outbox), 2)
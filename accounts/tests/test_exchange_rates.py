@@ -0,0 +1,125 @@
+import threading
+import time
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from accounts.exchange_rates import (
+    ExchangeRateError,
+    ExchangeRateService,
+    HttpRateFetcher,
+    get_usd_rate,
+)
+from core.standins import ExchangeRateStandIn
+
+
+class FakeFetcher:
+    source = "fake"
+    timeout = 1
+
+    def __init__(self, rates=None, delay=0):
+        self.rates = rates or {"USD_in": "3.20"}
+        self.delay = delay
+        self.calls = 0
+        self.fail = False
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise ExchangeRateError("upstream is down")
+        return dict(self.rates)
+
+
+class ExchangeRateServiceTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.fetcher = FakeFetcher()
+
+    def test_rate_is_served_from_cache(self):
+        service = ExchangeRateService(fetcher=self.fetcher, ttl=60, stale_ttl=120)
+
+        self.assertEqual(service.get_rate("USD_in"), Decimal("3.20"))
+        self.assertEqual(service.get_rate("USD_in"), Decimal("3.20"))
+        self.assertEqual(self.fetcher.calls, 1)
+
+    def test_shared_cache_is_used_by_other_processes(self):
+        ExchangeRateService(fetcher=self.fetcher, ttl=60, stale_ttl=120).get_rates()
+
+        # Новый экземпляр = другой процесс с пустым локальным кэшем
+        service = ExchangeRateService(fetcher=self.fetcher, ttl=60, stale_ttl=120)
+        self.assertEqual(service.get_rate("USD_in"), Decimal("3.20"))
+        self.assertEqual(self.fetcher.calls, 1)
+
+    def test_concurrent_misses_share_one_fetch(self):
+        self.fetcher.delay = 0.2
+        service = ExchangeRateService(fetcher=self.fetcher, ttl=60, stale_ttl=120)
+        results = []
+
+        threads = [
+            threading.Thread(target=lambda: results.append(service.get_rate()))
+            for _ in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.fetcher.calls, 1)
+        self.assertEqual(results, [Decimal("3.20")] * 10)
+
+    def test_stale_rate_is_served_while_refreshing(self):
+        service = ExchangeRateService(fetcher=self.fetcher, ttl=0, stale_ttl=120)
+        service.get_rates()
+        self.fetcher.rates = {"USD_in": "3.30"}
+
+        # Устаревшее значение отдаётся сразу, обновление идёт в фоне
+        self.assertEqual(service.get_rate(), Decimal("3.20"))
+        for _ in range(50):
+            if self.fetcher.calls == 2:
+                break
+            time.sleep(0.01)
+        time.sleep(0.05)
+        self.assertEqual(self.fetcher.calls, 2)
+        self.assertEqual(service._local_get(service.cache_key)[0]["USD_in"], "3.30")
+
+    def test_last_known_good_rate_is_used_when_upstream_is_down(self):
+        ExchangeRateService(fetcher=self.fetcher, ttl=0, stale_ttl=0).get_rates()
+        self.fetcher.fail = True
+
+        service = ExchangeRateService(fetcher=self.fetcher, ttl=0, stale_ttl=0)
+        self.assertEqual(service.get_rate(), Decimal("3.20"))
+
+    def test_default_rate_is_used_without_any_history(self):
+        self.fetcher.fail = True
+        service = ExchangeRateService(fetcher=self.fetcher, ttl=60, stale_ttl=120)
+
+        self.assertEqual(service.get_rate("USD_in"), Decimal("3.116"))
+        # Повторный запрос не идёт в упавший API до истечения паузы
+        service.get_rate("USD_in")
+        self.assertEqual(self.fetcher.calls, 1)
+
+
+class HttpRateFetcherTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_fetch_from_standin(self):
+        with ExchangeRateStandIn(rates={"USD_in": "3.25"}) as standin:
+            rates = HttpRateFetcher(url=standin.url, timeout=1)()
+
+        self.assertEqual(rates["USD_in"], "3.25")
+
+    def test_error_status_raises(self):
+        with ExchangeRateStandIn() as standin:
+            standin.status = 503
+            with self.assertRaises(ExchangeRateError):
+                HttpRateFetcher(url=standin.url, timeout=1)()
+
+    def test_get_usd_rate_uses_configured_url(self):
+        with ExchangeRateStandIn(rates={"USD_in": "3.27"}) as standin:
+            with override_settings(EXCHANGE_RATE_URL=standin.url):
+                self.assertEqual(get_usd_rate(), Decimal("3.27"))
+                self.assertEqual(get_usd_rate(), Decimal("3.27"))
+            self.assertEqual(standin.requests, 1)
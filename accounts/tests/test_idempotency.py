@@ -0,0 +1,158 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.messages import get_messages
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts import idempotency
+from accounts.models import Card, IdempotencyKey, Payment, User
+from accounts.tasks import purge_expired_idempotency_keys
+
+
+class MakePaymentIdempotencyTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="testuser@example.com", password="testpassword"
+        )
+        self.card = Card.objects.create(
+            user=self.user, balance=100, card_type="D", currency="B"
+        )
+        self.client.login(email="testuser@example.com", password="testpassword")
+        self.url = reverse("accounts:make_payment")
+
+    def pay(self, idempotency_key=None, **headers):
+        data = {"amount": "30", "card": self.card.id}
+        if idempotency_key:
+            data["idempotency_key"] = idempotency_key
+        return self.client.post(self.url, data, **headers)
+
+    def test_form_contains_idempotency_key(self):
+        response = self.client.get(self.url)
+        self.assertContains(response, 'name="idempotency_key"')
+
+    def test_retry_returns_stored_outcome(self):
+        self.pay(idempotency_key="retry-1")
+        response = self.pay(idempotency_key="retry-1")
+
+        self.assertRedirects(response, self.url)
+        messages = [m.message for m in get_messages(response.wsgi_request)]
+        self.assertIn("Payment successful", messages)
+        self.card.refresh_from_db()
+        self.assertEqual(self.card.balance, Decimal("70"))
+        self.assertEqual(Payment.objects.filter(card=self.card).count(), 1)
+
+    def test_header_key_is_accepted(self):
+        self.pay(HTTP_IDEMPOTENCY_KEY="header-1")
+        self.pay(HTTP_IDEMPOTENCY_KEY="header-1")
+
+        self.assertEqual(Payment.objects.filter(card=self.card).count(), 1)
+
+    def test_requests_without_key_are_not_deduplicated(self):
+        self.pay()
+        self.pay()
+
+        self.assertEqual(Payment.objects.filter(card=self.card).count(), 2)
+
+    def test_invalid_form_releases_key(self):
+        self.client.post(
+            self.url, {"amount": "-5", "card": self.card.id, "idempotency_key": "bad-1"}
+        )
+
+        self.assertFalse(IdempotencyKey.objects.filter(key="bad-1").exists())
+
+    def test_expired_key_can_be_reused(self):
+        self.pay(idempotency_key="old-1")
+        IdempotencyKey.objects.filter(key="old-1").update(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+
+        self.pay(idempotency_key="old-1")
+
+        self.assertEqual(Payment.objects.filter(card=self.card).count(), 2)
+
+    def pending_key(self, key):
+        # Первый запрос упал и откатился, ключ остался незавершённым
+        return IdempotencyKey.objects.create(
+            user=self.user,
+            key=key,
+            scope="make_payment",
+            created_at=timezone.now() - timedelta(minutes=5),
+            expires_at=timezone.now() + timedelta(hours=1),
+        )
+
+    def test_pending_key_of_crashed_request_is_retried(self):
+        self.pending_key("pending-1")
+
+        response = self.pay(idempotency_key="pending-1")
+
+        self.assertRedirects(response, self.url)
+        self.assertEqual(Payment.objects.filter(card=self.card).count(), 1)
+        self.assertTrue(IdempotencyKey.objects.get(key="pending-1").completed)
+
+    def test_key_completed_meanwhile_is_replayed(self):
+        record = self.pending_key("race-1")
+        claim = idempotency.claim
+
+        def claim_then_finish_elsewhere(request, scope):
+            claimed = claim(request, scope)
+            # Параллельный запрос успел провести платёж по тому же ключу
+            IdempotencyKey.objects.filter(pk=record.pk).update(
+                completed=True, succeeded=True, message="Payment successful"
+            )
+            return claimed
+
+        with mock.patch.object(idempotency, "claim", claim_then_finish_elsewhere):
+            response = self.pay(idempotency_key="race-1")
+
+        self.assertRedirects(response, self.url)
+        messages = [m.message for m in get_messages(response.wsgi_request)]
+        self.assertEqual(messages, ["Payment successful"])
+        self.assertFalse(Payment.objects.filter(card=self.card).exists())
+
+    def test_key_of_another_endpoint_is_refused(self):
+        self.pay(idempotency_key="shared-1")
+
+        response = self.client.post(
+            reverse("transactions:fund_transfer"),
+            {
+                "receiver_account_number": self.card.account_no,
+                "amount": "10",
+                "card": self.card.id,
+                "idempotency_key": "shared-1",
+            },
+        )
+
+        self.assertEqual(response.status_code, 422)
+        self.card.refresh_from_db()
+        self.assertEqual(self.card.balance, Decimal("70"))
+
+    def test_outcome_commits_with_the_payment(self):
+        with mock.patch.object(
+            idempotency, "complete", side_effect=RuntimeError("crash")
+        ):
+            with self.assertRaises(RuntimeError):
+                self.pay(idempotency_key="crash-1")
+
+        # Платёж откатился вместе с исходом, ключ отпущен для повтора
+        self.card.refresh_from_db()
+        self.assertEqual(self.card.balance, Decimal("100"))
+        self.assertFalse(Payment.objects.filter(card=self.card).exists())
+        self.assertFalse(IdempotencyKey.objects.filter(key="crash-1").exists())
+
+        self.pay(idempotency_key="crash-1")
+        self.assertEqual(Payment.objects.filter(card=self.card).count(), 1)
+
+    def test_purge_expired_keys(self):
+        self.pay(idempotency_key="old-1")
+        self.pay(idempotency_key="new-1")
+        IdempotencyKey.objects.filter(key="old-1").update(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+
+        self.assertEqual(purge_expired_idempotency_keys(), 1)
+        self.assertEqual(
+            list(IdempotencyKey.objects.values_list("key", flat=True)), ["new-1"]
+        )
@@ -0,0 +1,123 @@
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from accounts import card_numbers
+from accounts.card_numbers import CardNumberAllocator, is_luhn_valid
+from accounts.issuance import issue_cards
+from accounts.models import Card, User
+
+CSV = """email,card_name,card_type,currency
+alice@example.com,Payroll,D,B
+bob@example.com,Travel,Credit,usd
+nobody@example.com,Ghost,D,B
+alice@example.com,Broken,X,B
+alice@example.com,Savings,debit,BYN
+"""
+
+
+class IssueCardsTest(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(
+            email="alice@example.com", password="testpass"
+        )
+        self.bob = User.objects.create_user(
+            email="bob@example.com", password="testpass"
+        )
+
+    def test_valid_rows_become_cards(self):
+        report = issue_cards(StringIO(CSV), batch_size=2)
+
+        self.assertEqual(report.rows, 5)
+        self.assertEqual(report.batches, 3)
+        self.assertEqual(report.created, 3)
+        self.assertEqual(sorted(line for line, _ in report.errors), [4, 5])
+        travel = Card.objects.get(card_name="Travel")
+        self.assertEqual(
+            (travel.user, travel.card_type, travel.currency), (self.bob, "C", "U")
+        )
+        self.assertEqual(
+            set(
+                Card.objects.filter(user=self.alice).values_list("card_name", flat=True)
+            ),
+            {"Payroll", "Savings"},
+        )
+        for card in Card.objects.all():
+            self.assertTrue(is_luhn_valid(card.account_no))
+            self.assertRegex(card.cvv_code, r"^\d{3}$")
+
+    @override_settings(CARD_NUMBER_BLOCK_SIZE=1000)
+    def test_batch_costs_constant_queries(self):
+        rows = "".join(f"alice@example.com,Card {i},D,B\n" for i in range(50))
+        allocator = CardNumberAllocator()
+        allocator.allocate(1)
+
+        # Пользователи, затем вставка в savepoint: номера уже в блоке процесса
+        with mock.patch.object(card_numbers, "allocator", allocator):
+            with self.assertNumQueries(4):
+                report = issue_cards(StringIO(rows), batch_size=50)
+
+        self.assertEqual(report.created, 50)
+
+    def test_command_reports_rate(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as f:
+            f.write(CSV)
+        out, err = StringIO(), StringIO()
+        try:
+            call_command("issue_cards", f.name, stdout=out, stderr=err)
+        finally:
+            os.unlink(f.name)
+
+        self.assertIn("Issued 3 of 5 cards", out.getvalue())
+        self.assertIn("rows/s", out.getvalue())
+        self.assertIn("line 4: unknown user nobody@example.com", err.getvalue())
+
+
+class BulkIssueCardsViewTest(TestCase):
+    def setUp(self):
+        User.objects.create_user(email="alice@example.com", password="testpass")
+        User.objects.create_user(email="bob@example.com", password="testpass")
+        self.url = reverse("accounts:bulk_issue_cards")
+
+    def upload(self, encoding="utf-8"):
+        return self.client.post(
+            self.url, {"file": SimpleUploadedFile("cards.csv", CSV.encode(encoding))}
+        )
+
+    def test_staff_can_issue_cards(self):
+        User.objects.create_user(
+            email="staff@example.com", password="testpass", is_staff=True
+        )
+        self.client.login(email="staff@example.com", password="testpass")
+
+        response = self.upload()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["report"].created, 3)
+        self.assertEqual(Card.objects.count(), 3)
+
+    def test_excel_byte_order_mark_is_skipped(self):
+        User.objects.create_user(
+            email="staff@example.com", password="testpass", is_staff=True
+        )
+        self.client.login(email="staff@example.com", password="testpass")
+
+        response = self.upload(encoding="utf-8-sig")
+
+        report = response.context["report"]
+        self.assertEqual(report.created, 3)
+        self.assertEqual(sorted(line for line, _ in report.errors), [4, 5])
+
+    def test_customers_cannot_issue_cards(self):
+        self.client.login(email="alice@example.com", password="testpass")
+
+        response = self.upload()
+
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Card.objects.exists())
@@ -0,0 +1,269 @@
+import csv
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.constants import (
+    CREDIT_PAYMENT,
+    DEPOSIT,
+    OPENING,
+    PAYMENT,
+    SAVINGS,
+    WRITE_OFF,
+)
+from accounts.forms import DepositCardForm
+from accounts.ledger import balance_as_of
+from accounts.models import BalanceCheckpoint, BudgetSystem, Card, LedgerEntry, User
+from accounts.reconciliation import REPORT_FIELDS, reconcile_partition
+from accounts.tasks import (
+    check_credit_card_payments,
+    checkpoint_balances,
+    process_pending_deposits,
+    recount_daily_budget,
+    reconcile_balances_all,
+)
+from banking_system.celery import app
+from credits.models import Credit
+from credits.tasks import process_monthly_payment
+
+
+class LedgerTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="testuser@example.com", password="testpassword"
+        )
+        self.card = Card.objects.create(
+            user=self.user, balance=100, card_type="D", currency="B"
+        )
+
+    def test_new_card_gets_opening_entry(self):
+        entry = LedgerEntry.objects.get(card=self.card)
+
+        self.assertEqual(entry.kind, OPENING)
+        self.assertEqual(entry.balance_after, Decimal("100"))
+        empty_card = Card.objects.create(user=self.user, card_type="D", currency="B")
+        self.assertFalse(LedgerEntry.objects.filter(card=empty_card).exists())
+
+    def test_payment_writes_entry(self):
+        self.card.make_payment(Decimal("30"), "D")
+
+        entry = LedgerEntry.objects.filter(card=self.card, kind=PAYMENT).get()
+        self.assertEqual(entry.amount, Decimal("-30"))
+        self.assertEqual(entry.balance_after, Decimal("70"))
+
+    def test_failed_payment_writes_nothing(self):
+        self.card.make_payment(Decimal("300"), "D")
+
+        self.assertEqual(LedgerEntry.objects.filter(card=self.card).count(), 1)
+
+    def test_processed_deposit_writes_entry(self):
+        Card.objects.filter(pk=self.card.pk).update(pending_deposit_amount=25)
+
+        process_pending_deposits()
+
+        entry = LedgerEntry.objects.filter(card=self.card, kind=DEPOSIT).get()
+        self.assertEqual(entry.amount, Decimal("25"))
+        self.assertEqual(entry.balance_after, Decimal("125"))
+
+    def test_approved_deposit_writes_entry(self):
+        Card.objects.filter(pk=self.card.pk).update(
+            pending_deposit_amount=40, deposit_pending=True
+        )
+        User.objects.create_user(
+            email="staff@example.com", password="staffpassword", is_staff=True
+        )
+        self.client.login(email="staff@example.com", password="staffpassword")
+
+        self.client.post(
+            reverse("accounts:deposit_approval", args=[self.card.id]),
+            {"approved": True},
+        )
+
+        self.card.refresh_from_db()
+        entry = LedgerEntry.objects.filter(card=self.card, kind=DEPOSIT).get()
+        self.assertEqual(self.card.balance, Decimal("140"))
+        self.assertEqual(self.card.pending_deposit_amount, 0)
+        self.assertEqual(entry.amount, Decimal("40"))
+        self.assertEqual(entry.balance_after, Decimal("140"))
+
+    def test_deposit_request_keeps_concurrent_balance_change(self):
+        self.client.login(email="testuser@example.com", password="testpassword")
+        is_valid = DepositCardForm.is_valid
+
+        def pay_meanwhile(form):
+            # Платёж проходит, пока запрос держит карту со старым балансом
+            self.card.make_payment(Decimal("30"), "D")
+            return is_valid(form)
+
+        with mock.patch.object(DepositCardForm, "is_valid", pay_meanwhile):
+            self.client.post(
+                reverse("accounts:deposit_form", args=[self.card.id]),
+                {"deposit_amount": "50"},
+            )
+
+        self.card.refresh_from_db()
+        self.assertEqual(self.card.balance, Decimal("70"))
+        self.assertEqual(self.card.pending_deposit_amount, Decimal("50"))
+        self.assertTrue(self.card.deposit_pending)
+        self.assertEqual(balance_as_of(self.card.id, timezone.now()), self.card.balance)
+
+    def test_new_budget_system_does_not_save_the_whole_card(self):
+        savings_card = Card.objects.create(user=self.user, card_type="D")
+        self.client.login(email="testuser@example.com", password="testpassword")
+
+        with mock.patch.object(Card, "save", side_effect=AssertionError):
+            response = self.client.post(
+                reverse("accounts:create_budgeting_system"),
+                {
+                    "name": "Budget",
+                    "description": "Budget",
+                    "daily_percent": 3,
+                    "savings_percent": 10,
+                    "card": self.card.id,
+                    "savings_card": savings_card.id,
+                    "daily_control": True,
+                },
+            )
+
+        self.assertRedirects(response, reverse("accounts:budgeting_systems_list"))
+        self.card.refresh_from_db()
+        self.assertTrue(self.card.using_system)
+        self.assertEqual(self.card.balance, Decimal("90"))
+        self.assertEqual(balance_as_of(self.card.id, timezone.now()), self.card.balance)
+
+    def test_budget_savings_write_both_legs(self):
+        savings_card = Card.objects.create(user=self.user, card_type="D")
+        Card.objects.filter(pk=self.card.pk).update(using_system=True, daily_balance=7)
+        BudgetSystem.objects.create(
+            user=self.user,
+            name="Budget",
+            description="Budget",
+            card=self.card,
+            savings_card=savings_card,
+            daily_control=True,
+            daily_redirect=True,
+        )
+
+        recount_daily_budget()
+
+        legs = dict(
+            LedgerEntry.objects.filter(kind=SAVINGS).values_list("card_id", "amount")
+        )
+        self.assertEqual(legs, {self.card.id: Decimal("-7"), savings_card.id: 7})
+
+    def test_credit_tasks_write_entries(self):
+        credit_card = Card.objects.create(
+            user=self.user, card_type="C", balance=1000, currency="B"
+        )
+        debt_card = Card.objects.create(user=self.user, card_type="C")
+        Card.objects.filter(pk=debt_card.pk).update(balance=-25)
+        Credit.objects.create(
+            user=self.user,
+            card=credit_card,
+            amount=1000,
+            interest_rate=5,
+            term_months=12,
+            monthly_payment=Decimal("85.61"),
+            remaining_amount=1000,
+            status="APPROVED",
+        )
+
+        process_monthly_payment()
+        self.assertEqual(check_credit_card_payments(), 1)
+
+        payment = LedgerEntry.objects.get(kind=CREDIT_PAYMENT)
+        self.assertEqual(payment.card_id, credit_card.id)
+        self.assertEqual(payment.amount, Decimal("-85.61"))
+        self.assertEqual(payment.balance_after, Decimal("914.39"))
+        write_off = LedgerEntry.objects.get(kind=WRITE_OFF)
+        self.assertEqual(write_off.card_id, debt_card.id)
+        self.assertEqual(write_off.amount, Decimal("25"))
+        self.assertEqual(write_off.balance_after, 0)
+
+    def test_entries_are_append_only(self):
+        entry = LedgerEntry.objects.get(card=self.card)
+        entry.amount = 0
+
+        with self.assertRaises(ValueError):
+            entry.save()
+        with self.assertRaises(ValueError):
+            entry.delete()
+
+    def test_balance_as_of(self):
+        before = timezone.now()
+        self.card.make_payment(Decimal("30"), "D")
+        self.card.make_payment(Decimal("20"), "D")
+
+        self.assertEqual(balance_as_of(self.card.id, timezone.now()), Decimal("50"))
+        self.assertEqual(balance_as_of(self.card.id, before), Decimal("100"))
+        self.assertEqual(balance_as_of(self.card.id, before - timedelta(days=1)), 0)
+
+    @override_settings(LEDGER_CHECKPOINT_DELAY=0)
+    def test_checkpoint_then_balance_as_of(self):
+        self.card.make_payment(Decimal("30"), "D")
+
+        result = checkpoint_balances()
+
+        checkpoint = BalanceCheckpoint.objects.get(card=self.card)
+        self.assertEqual(result["processed"], 1)
+        self.assertEqual(checkpoint.balance, Decimal("70"))
+
+        self.card.make_payment(Decimal("20"), "D")
+        self.assertEqual(balance_as_of(self.card.id, timezone.now()), Decimal("50"))
+
+        checkpoint_balances()
+        second = BalanceCheckpoint.objects.filter(card=self.card).latest("as_of")
+        self.assertEqual(second.balance, Decimal("50"))
+        # Без новых записей повторный запуск новых срезов не создаёт
+        self.assertEqual(checkpoint_balances()["processed"], 0)
+
+
+@override_settings(RECONCILE_PARTITION_SIZE=2, RECONCILE_CHUNK_SIZE=1)
+class ReconcileBalancesTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="testuser@example.com", password="testpassword"
+        )
+        self.cards = [
+            Card.objects.create(user=self.user, balance=100, card_type="D")
+            for _ in range(5)
+        ]
+        self.cards[0].make_payment(Decimal("30"), "D")
+        # Правка баланса в обход журнала
+        Card.objects.filter(pk=self.cards[3].pk).update(balance=90)
+
+    def test_partition_reports_drift_only(self):
+        result = reconcile_partition(self.cards[0].id, self.cards[-1].id)
+
+        self.assertEqual(result["checked"], 5)
+        self.assertEqual(
+            result["discrepancies"],
+            [[self.cards[3].id, "90.00", "100.00", "-10.00"]],
+        )
+
+    def test_command_writes_csv_report(self):
+        out, err = StringIO(), StringIO()
+
+        call_command("reconcile_balances", workers=1, stdout=out, stderr=err)
+
+        rows = list(csv.reader(StringIO(out.getvalue())))
+        self.assertEqual(rows[0], REPORT_FIELDS)
+        self.assertEqual(
+            rows[1:], [[str(self.cards[3].id), "90.00", "100.00", "-10.00"]]
+        )
+        self.assertIn("Checked 5 cards", err.getvalue())
+
+    def test_task_fans_out_over_partitions(self):
+        app.conf.task_always_eager = True
+        try:
+            result = reconcile_balances_all()
+        finally:
+            app.conf.task_always_eager = False
+
+        self.assertEqual(result["partitions"], 3)
@@ -0,0 +1,87 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django_otp.oath import TOTP
+
+from accounts import otp
+
+User = get_user_model()
+
+
+class OTPLoginTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email="testuser@example.com", password="testpassword"
+        )
+        self.device = self.user.totpdevice_set.create(confirmed=True)
+
+    def tearDown(self):
+        cache.clear()
+
+    def token(self):
+        device = self.device
+        totp = TOTP(device.bin_key, device.step, device.t0, device.digits)
+        return f"{totp.token():0{device.digits}d}"
+
+    def post(self, token):
+        return self.client.post(
+            reverse("login"),
+            {
+                "username": "testuser@example.com",
+                "password": "testpassword",
+                "otp_token": token,
+            },
+        )
+
+    def test_login_with_valid_token(self):
+        response = self.post(self.token())
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(int(self.client.session["_auth_user_id"]), self.user.pk)
+
+    def test_invalid_token_is_rejected(self):
+        response = self.post("000000" if self.token() != "000000" else "111111")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("_auth_user_id", self.client.session)
+        self.assertEqual(otp.failures(self.user.pk), 1)
+
+    def test_token_is_accepted_once(self):
+        token = self.token()
+        self.assertEqual(otp.verify(self.user, token), self.device)
+        self.assertIsNone(otp.verify(self.user, token))
+
+    def test_device_lookup_is_cached(self):
+        otp.device_summary(self.user.pk)
+        # Ключ читается по первичному ключу, поиск устройства берётся из кэша
+        with self.assertNumQueries(1):
+            self.assertEqual(otp.verify(self.user, self.token()), self.device)
+
+    def test_secret_key_is_not_cached(self):
+        summary = otp.device_summary(self.user.pk)
+        cached = cache.get(f"otp:device:{self.user.pk}")
+        self.assertEqual(cached, summary)
+        self.assertEqual(set(cached), {"id", "persistent_id", "name"})
+        self.assertEqual(cached["persistent_id"], self.device.persistent_id)
+        self.assertNotIn(self.device.key, repr(cached))
+
+    def test_user_without_device_is_cached(self):
+        self.device.delete()
+        self.assertIsNone(otp.device_summary(self.user.pk))
+        with self.assertNumQueries(0):
+            self.assertIsNone(otp.verify(self.user, self.token()))
+
+    def test_device_change_invalidates_cache(self):
+        otp.device_summary(self.user.pk)
+        self.device.delete()
+        self.assertIsNone(otp.device_summary(self.user.pk))
+
+    @override_settings(OTP_MAX_FAILURES=2)
+    def test_lockout_after_failures(self):
+        otp.verify(self.user, "bad")
+        otp.verify(self.user, "bad")
+        self.assertTrue(otp.is_locked_out(self.user.pk))
+
+        response = self.post(self.token())
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("_auth_user_id", self.client.session)
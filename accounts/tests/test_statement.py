@@ -1,7 +1,18 @@
+import gzip
+import json
+from datetime import date, timedelta
+from django.core.management import call_command
+from django.db import connection
+from django.db.backends.postgresql.base import DatabaseWrapper
+from django.db.migrations.loader import MigrationLoader
 from django.test import TestCase
 from django.urls import reverse
+from django.utils import timezone
 from decimal import Decimal
-from accounts.models import Card, Payment, User
+from io import StringIO
+from accounts.models import Card, Payment, PaymentDailyRollup, User
+from accounts.pagination import after, decode_cursor, paginate
+from accounts.utils import statement_queryset, statement_total
 
 
 class StatementViewTest(TestCase):
@@ -53,3 +64,338 @@ class StatementViewTest(TestCase):
             "/accounts/login/?next="
             + reverse("accounts:card_history", kwargs={"card_id": self.card.id}),
         )
+
+    def test_statement_totals_regular_payments_of_period(self):
+        self.client.login(email="testuser@gmail.com", password="testpass")
+        Payment.objects.create(card=self.card, amount=Decimal("50"))
+        Payment.objects.create(card=self.card, amount=Decimal("20"))
+        Payment.objects.create(
+            card=self.card, amount=Decimal("30"), deposit_pending=True
+        )
+        Payment.objects.create(
+            card=self.card,
+            amount=Decimal("99"),
+            timestamp=timezone.now() - timedelta(days=40),
+        )
+
+        today = date.today()
+        response = self.client.get(
+            reverse("accounts:card_history", kwargs={"card_id": self.card.id}),
+            {"start_date": today - timedelta(days=7), "end_date": today},
+        )
+
+        self.assertEqual(response.context["total_spent"], Decimal("70"))
+        self.assertEqual(len(response.context["regular_payments"]), 2)
+        self.assertEqual(len(response.context["pending_deposits"]), 1)
+
+
+class StatementQuerysetTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="testuser@gmail.com", password="testpass"
+        )
+        self.card = Card.objects.create(user=self.user, balance=1000)
+        self.end = timezone.localdate() + timedelta(days=1)
+        self.start = self.end - timedelta(days=30)
+
+    def test_total_counts_regular_payments_only(self):
+        Payment.objects.create(card=self.card, amount=Decimal("10.50"))
+        Payment.objects.create(card=self.card, amount=Decimal("4.50"))
+        Payment.objects.create(
+            card=self.card, amount=Decimal("100"), deposit_pending=True
+        )
+
+        with self.assertNumQueries(2):
+            total = statement_total(self.card, self.start, self.end)
+
+        self.assertEqual(total, Decimal("15"))
+
+    def test_total_combines_rollups_with_today(self):
+        Payment.objects.create(
+            card=self.card,
+            amount=Decimal("7"),
+            timestamp=timezone.now() - timedelta(days=3),
+        )
+        Payment.objects.create(card=self.card, amount=Decimal("5"))
+        # Старые дни читаются только из сводной таблицы
+        PaymentDailyRollup.objects.filter(
+            card=self.card, day__lt=timezone.localdate()
+        ).update(debit_sum=Decimal("20"))
+
+        self.assertEqual(
+            statement_total(self.card, self.start, self.end), Decimal("25")
+        )
+
+    def test_total_without_regular_payments_is_zero(self):
+        Payment.objects.create(
+            card=self.card, amount=Decimal("100"), deposit_pending=True
+        )
+
+        self.assertEqual(statement_total(self.card, self.start, self.end), 0)
+
+    def test_explain_statement_rolls_back(self):
+        out = StringIO()
+
+        call_command("explain_statement", rows=50, cards=2, stdout=out)
+
+        self.assertIn("Inserted 50 payments", out.getvalue())
+        self.assertIn("deep page of payments", out.getvalue())
+        self.assertFalse(Payment.objects.exists())
+
+    def test_indexes_are_built_concurrently_on_postgresql(self):
+        # SQLite строит индексы обычным AddIndex, поэтому смотрим SQL для PostgreSQL
+        loader = MigrationLoader(connection)
+        state = loader.project_state(("accounts", "0007_idempotencykey"))
+        migration = loader.get_migration("accounts", "0008_payment_statement_indexes")
+        postgresql = DatabaseWrapper(
+            {**connection.settings_dict, "ENGINE": "django.db.backends.postgresql"},
+            alias=connection.alias,
+        )
+
+        with postgresql.schema_editor(collect_sql=True, atomic=False) as editor:
+            migration.apply(state, editor, collect_sql=True)
+
+        self.assertFalse(migration.atomic)
+        statements = [sql for sql in editor.collected_sql if "CREATE INDEX" in sql]
+        self.assertEqual(len(statements), 2)
+        for sql in statements:
+            self.assertIn("CREATE INDEX CONCURRENTLY", sql)
+
+
+class StatementPaginationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="testuser@gmail.com", password="testpass"
+        )
+        self.card = Card.objects.create(user=self.user, balance=1000)
+        self.url = reverse("accounts:card_history", kwargs={"card_id": self.card.id})
+        timestamp = timezone.now() - timedelta(hours=1)
+        # Одинаковое время у всех строк: порядок держится на id
+        for amount in range(1, 6):
+            Payment.objects.create(
+                card=self.card, amount=Decimal(amount), timestamp=timestamp
+            )
+        Payment.objects.create(
+            card=self.card, amount=Decimal("100"), deposit_pending=True
+        )
+        today = date.today()
+        self.period = {"start_date": today - timedelta(days=1), "end_date": today}
+
+    def test_pages_follow_cursor(self):
+        queryset = statement_queryset(
+            self.card, timezone.now() - timedelta(days=1), timezone.now()
+        ).filter(deposit_pending=False)
+
+        first = paginate(queryset, None, 2, scope="payments")
+        second = paginate(queryset, first.next_cursor, 2, scope="payments")
+        last = paginate(queryset, second.next_cursor, 2, scope="payments")
+
+        amounts = [p.amount for page in (first, second, last) for p in page]
+        self.assertEqual(amounts, [Decimal(a) for a in range(1, 6)])
+        self.assertFalse(last.has_next)
+
+    def test_period_end_is_exclusive(self):
+        end = timezone.now()
+        start = end - timedelta(days=1)
+        Payment.objects.create(card=self.card, amount=Decimal("7"), timestamp=start)
+        Payment.objects.create(card=self.card, amount=Decimal("9"), timestamp=end)
+
+        amounts = statement_queryset(self.card, start, end).values_list(
+            "amount", flat=True
+        )
+
+        self.assertIn(Decimal("7"), amounts)
+        self.assertNotIn(Decimal("9"), amounts)
+
+    def test_cursor_bounds_the_index_range(self):
+        last = Payment.objects.filter(card=self.card).order_by("timestamp", "id")[2]
+        queryset = after(
+            Payment.objects.filter(card=self.card), (last.timestamp, last.id)
+        ).order_by("timestamp", "id")[:3]
+
+        # Без дублирующего условия индекс ищет только по card_id
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+            plan = queryset.explain()
+            self.assertRegex(plan, r"Index Cond: .*timestamp.*>=")
+        else:
+            plan = queryset.explain()
+            self.assertIn(
+                "USING INDEX payment_card_ts_idx (card_id=? AND timestamp>?)", plan
+            )
+        self.assertEqual(
+            [p.amount for p in queryset], [Decimal(4), Decimal(5), Decimal(100)]
+        )
+
+    def test_foreign_or_forged_cursor_is_ignored(self):
+        queryset = Payment.objects.filter(card=self.card)
+        cursor = paginate(queryset, None, 2, scope="payments").next_cursor
+
+        self.assertIsNone(decode_cursor(cursor, "deposits"))
+        self.assertIsNone(decode_cursor(cursor + "x", "payments"))
+
+    def test_view_totals_whole_period_on_every_page(self):
+        self.client.login(email="testuser@gmail.com", password="testpass")
+
+        with self.settings(STATEMENT_PAGE_SIZE=2):
+            first = self.client.get(self.url, self.period)
+            next_url = first.context["next_payments_url"]
+            second = self.client.get(next_url)
+
+        self.assertEqual(
+            [p.amount for p in second.context["regular_payments"]],
+            [Decimal("3"), Decimal("4")],
+        )
+        self.assertEqual(first.context["total_spent"], Decimal("15"))
+        self.assertEqual(second.context["total_spent"], Decimal("15"))
+        self.assertIsNone(first.context["next_deposits_url"])
+        self.assertEqual(len(second.context["pending_deposits"]), 1)
+
+
+class StatementExportTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="testuser@gmail.com", password="testpass"
+        )
+        self.card = Card.objects.create(user=self.user, balance=1000)
+        self.url = reverse(
+            "accounts:card_history_export", kwargs={"card_id": self.card.id}
+        )
+        Payment.objects.create(card=self.card, amount=Decimal("12.50"), currency="B")
+        Payment.objects.create(
+            card=self.card, amount=Decimal("30"), currency="B", deposit_pending=True
+        )
+        today = date.today()
+        self.period = {"start_date": today - timedelta(days=1), "end_date": today}
+        self.client.login(email="testuser@gmail.com", password="testpass")
+
+    def export(self, **params):
+        response = self.client.get(self.url, {**self.period, **params})
+        self.assertTrue(response.streaming)
+        return response, b"".join(response.streaming_content)
+
+    def test_csv_export(self):
+        response, content = self.export(format="csv")
+
+        self.assertEqual(response["Content-Type"], "text/csv")
+        lines = content.decode().splitlines()
+        self.assertEqual(lines[0], "id,timestamp,amount,currency,deposit_pending")
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].endswith(",12.50,B,False"))
+
+    def test_jsonl_export(self):
+        _response, content = self.export(format="jsonl")
+
+        rows = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual([row["amount"] for row in rows], ["12.50", "30.00"])
+        self.assertEqual([row["deposit_pending"] for row in rows], [False, True])
+
+    def test_gzip_export(self):
+        response, content = self.export(format="csv", gzip="1")
+
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        self.assertIn(".csv.gz", response["Content-Disposition"])
+        self.assertEqual(len(gzip.decompress(content).decode().splitlines()), 3)
+
+    def test_invalid_format_is_rejected(self):
+        response = self.client.get(self.url, {**self.period, "format": "xml"})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_other_users_card_is_not_exported(self):
+        User.objects.create_user(email="other@gmail.com", password="testpass")
+        self.client.login(email="other@gmail.com", password="testpass")
+
+        response = self.client.get(self.url, {**self.period, "format": "csv"})
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_staff_can_export_any_card(self):
+        User.objects.create_user(
+            email="staff@gmail.com", password="testpass", is_staff=True
+        )
+        self.client.login(email="staff@gmail.com", password="testpass")
+
+        response, content = self.export(format="csv")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(content.decode().splitlines()), 3)
+
+
+class PaymentDailyRollupTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="testuser@gmail.com", password="testpass"
+        )
+        self.card = Card.objects.create(user=self.user, balance=1000)
+
+    def rollup(self, day=None):
+        return PaymentDailyRollup.objects.get(
+            card=self.card, day=day or timezone.localdate()
+        )
+
+    def test_create_updates_rollup(self):
+        Payment.objects.create(card=self.card, amount=Decimal("10"))
+        Payment.objects.create(card=self.card, amount=Decimal("2.50"))
+        Payment.objects.create(
+            card=self.card, amount=Decimal("40"), deposit_pending=True
+        )
+
+        rollup = self.rollup()
+        self.assertEqual(rollup.debit_sum, Decimal("12.50"))
+        self.assertEqual(rollup.credit_sum, Decimal("40"))
+        self.assertEqual(rollup.count, 3)
+
+    def test_bulk_create_updates_rollups_per_day(self):
+        yesterday = timezone.now() - timedelta(days=1)
+        Payment.objects.bulk_create(
+            [
+                Payment(card=self.card, amount=Decimal("1"), timestamp=yesterday),
+                Payment(card=self.card, amount=Decimal("2"), timestamp=yesterday),
+                Payment(card=self.card, amount=Decimal("3")),
+            ]
+        )
+
+        self.assertEqual(
+            self.rollup(timezone.localdate(yesterday)).debit_sum, Decimal("3")
+        )
+        self.assertEqual(self.rollup().debit_sum, Decimal("3"))
+
+    def test_edit_and_delete_move_rollup(self):
+        payment = Payment.objects.create(card=self.card, amount=Decimal("10"))
+
+        payment.amount = Decimal("4")
+        payment.deposit_pending = True
+        payment.save()
+        self.assertEqual(self.rollup().debit_sum, 0)
+        self.assertEqual(self.rollup().credit_sum, Decimal("4"))
+
+        payment.delete()
+        self.assertEqual(self.rollup().credit_sum, 0)
+        self.assertEqual(self.rollup().count, 0)
+
+    def test_rebuild_matches_incremental_rollups(self):
+        yesterday = timezone.now() - timedelta(days=1)
+        Payment.objects.create(card=self.card, amount=Decimal("10"))
+        Payment.objects.create(card=self.card, amount=Decimal("6"), timestamp=yesterday)
+        Payment.objects.create(
+            card=self.card, amount=Decimal("40"), deposit_pending=True
+        )
+        expected = list(
+            PaymentDailyRollup.objects.order_by("day").values_list(
+                "card", "day", "debit_sum", "credit_sum", "count"
+            )
+        )
+        PaymentDailyRollup.objects.update(debit_sum=0, credit_sum=0, count=0)
+
+        call_command("rebuild_payment_rollups", stdout=StringIO())
+
+        self.assertEqual(
+            list(
+                PaymentDailyRollup.objects.order_by("day").values_list(
+                    "card", "day", "debit_sum", "credit_sum", "count"
+                )
+            ),
+            expected,
+        )
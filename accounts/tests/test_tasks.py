@@ -0,0 +1,249 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.admin.models import LogEntry
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from accounts.constants import SAVINGS
+from accounts.models import BudgetSystem, Card, LedgerEntry, TaskWatermark, User
+from accounts.tasks import (
+    count_monthly_budget_all,
+    count_monthly_budget_partition,
+    process_pending_deposits,
+    recount_daily_budget,
+)
+from banking_system.celery import app
+
+
+class BudgetTaskTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="testuser@example.com", password="testpassword"
+        )
+        self.savings_card = Card.objects.create(
+            user=self.user, card_name="Savings", card_type="D", currency="B"
+        )
+
+    def create_budget_card(self, balance, daily_balance=0, fixated_sum=0, **system):
+        card = Card.objects.create(
+            user=self.user,
+            card_type="D",
+            currency="B",
+            using_system=True,
+            balance=balance,
+            daily_balance=daily_balance,
+            fixated_sum=fixated_sum,
+        )
+        BudgetSystem.objects.create(
+            user=self.user,
+            name="Budget",
+            description="Budget",
+            card=card,
+            savings_card=self.savings_card,
+            **system,
+        )
+        return card
+
+
+class RecountDailyBudgetTest(BudgetTaskTestCase):
+    def test_daily_balance_is_topped_up(self):
+        card = self.create_budget_card(balance=100, daily_balance=5, fixated_sum=10)
+        poor_card = self.create_budget_card(balance=4, fixated_sum=10)
+
+        stats = recount_daily_budget()
+
+        card.refresh_from_db()
+        poor_card.refresh_from_db()
+        self.assertEqual(card.daily_balance, Decimal("15"))
+        self.assertEqual(poor_card.daily_balance, Decimal("4"))
+        self.assertEqual(stats["processed"], 2)
+
+    def test_leftover_is_redirected_to_savings(self):
+        card = self.create_budget_card(
+            balance=100,
+            daily_balance=7,
+            fixated_sum=10,
+            daily_control=True,
+            daily_redirect=True,
+        )
+
+        recount_daily_budget()
+
+        card.refresh_from_db()
+        self.savings_card.refresh_from_db()
+        self.assertEqual(card.balance, Decimal("93"))
+        self.assertEqual(card.daily_balance, Decimal("10"))
+        self.assertEqual(self.savings_card.balance, Decimal("7"))
+
+    @override_settings(BUDGET_TASK_CHUNK_SIZE=2)
+    def test_cards_are_processed_in_chunks(self):
+        cards = [self.create_budget_card(balance=100, fixated_sum=10) for _ in range(5)]
+
+        stats = recount_daily_budget()
+
+        self.assertEqual(stats["processed"], 5)
+        self.assertEqual(stats["chunks"], 3)
+        for card in cards:
+            card.refresh_from_db()
+            self.assertEqual(card.daily_balance, Decimal("10"))
+
+    def test_card_is_recounted_once_per_day(self):
+        card = self.create_budget_card(balance=100, fixated_sum=10)
+
+        recount_daily_budget()
+        stats = recount_daily_budget()
+
+        card.refresh_from_db()
+        self.assertEqual(stats["processed"], 0)
+        self.assertEqual(card.daily_balance, Decimal("10"))
+        self.assertEqual(card.daily_budget_on, timezone.localdate())
+
+        Card.objects.filter(pk=card.pk).update(
+            daily_budget_on=timezone.localdate() - timedelta(days=1)
+        )
+        stats = recount_daily_budget()
+
+        card.refresh_from_db()
+        self.assertEqual(stats["processed"], 1)
+        self.assertEqual(card.daily_balance, Decimal("20"))
+
+
+class CountMonthlyBudgetTest(BudgetTaskTestCase):
+    def test_budget_is_fixated_and_savings_are_moved(self):
+        card = self.create_budget_card(
+            balance=1000, daily_control=True, daily_percent=3, savings_percent=30
+        )
+
+        stats = count_monthly_budget_partition(card.id, card.id)
+
+        card.refresh_from_db()
+        self.savings_card.refresh_from_db()
+        self.assertEqual(card.fixated_sum, Decimal("30"))
+        self.assertEqual(card.daily_balance, Decimal("30"))
+        self.assertEqual(card.balance, Decimal("700"))
+        self.assertEqual(self.savings_card.balance, Decimal("300"))
+        self.assertEqual(stats["processed"], 1)
+        legs = dict(
+            LedgerEntry.objects.filter(kind=SAVINGS).values_list("card_id", "amount")
+        )
+        self.assertEqual(
+            legs, {card.id: Decimal("-300"), self.savings_card.id: Decimal("300")}
+        )
+
+    def test_savings_are_rounded_to_cents(self):
+        card = self.create_budget_card(balance=Decimal("10.05"), savings_percent=15)
+
+        count_monthly_budget_partition(card.id, card.id)
+
+        card.refresh_from_db()
+        self.savings_card.refresh_from_db()
+        self.assertEqual(card.balance, Decimal("8.54"))
+        self.assertEqual(self.savings_card.balance, Decimal("1.51"))
+
+    def test_partition_only_touches_its_id_range(self):
+        first = self.create_budget_card(balance=100, savings_percent=10)
+        second = self.create_budget_card(balance=100, savings_percent=10)
+
+        count_monthly_budget_partition(first.id, first.id)
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.balance, Decimal("90"))
+        self.assertEqual(second.balance, Decimal("100"))
+
+    @override_settings(BUDGET_PARTITION_SIZE=2, BUDGET_TASK_CHUNK_SIZE=1)
+    def test_all_cards_are_processed_through_partitions(self):
+        cards = [
+            self.create_budget_card(balance=100, savings_percent=10) for _ in range(5)
+        ]
+
+        app.conf.task_always_eager = True
+        try:
+            result = count_monthly_budget_all()
+        finally:
+            app.conf.task_always_eager = False
+
+        self.assertEqual(result["partitions"], 3)
+        for card in cards:
+            card.refresh_from_db()
+            self.assertEqual(card.balance, Decimal("90"))
+        self.savings_card.refresh_from_db()
+        self.assertEqual(self.savings_card.balance, Decimal("50"))
+
+    def test_only_new_month_and_changed_systems_are_processed(self):
+        card = self.create_budget_card(
+            balance=1000, daily_control=True, daily_percent=3, savings_percent=10
+        )
+        untouched = self.create_budget_card(balance=100, savings_percent=10)
+
+        app.conf.task_always_eager = True
+        try:
+            count_monthly_budget_all()
+            self.assertTrue(
+                TaskWatermark.objects.filter(task="count_monthly_budget_all").exists()
+            )
+            # Системы, сохранённые до перекрытия водяного знака, больше не берутся
+            BudgetSystem.objects.update(
+                updated_at=timezone.now() - timedelta(minutes=5)
+            )
+            self.assertEqual(count_monthly_budget_all(), {"partitions": 0})
+
+            # Изменённую систему перефиксируют, накопления второй раз не снимают
+            system = BudgetSystem.objects.get(card=card)
+            system.daily_percent = 5
+            system.save()
+            count_monthly_budget_all()
+        finally:
+            app.conf.task_always_eager = False
+
+        card.refresh_from_db()
+        untouched.refresh_from_db()
+        self.assertEqual(card.balance, Decimal("900"))
+        self.assertEqual(card.fixated_sum, Decimal("45"))
+        self.assertEqual(card.daily_balance, Decimal("30"))
+        self.assertEqual(untouched.balance, Decimal("90"))
+        self.assertEqual(card.monthly_budget_on, timezone.localdate().replace(day=1))
+
+
+class ProcessPendingDepositsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="testuser@example.com", password="testpassword"
+        )
+
+    @override_settings(DEPOSIT_TASK_CHUNK_SIZE=2)
+    def test_pending_deposits_are_credited_and_logged(self):
+        cards = [
+            Card.objects.create(
+                user=self.user, balance=100, pending_deposit_amount=amount
+            )
+            for amount in (10, 20, 30)
+        ]
+        blocked = Card.objects.create(
+            user=self.user,
+            balance=100,
+            pending_deposit_amount=40,
+            is_deposit_allowed=False,
+        )
+
+        stats = process_pending_deposits()
+
+        self.assertEqual(stats["processed"], 3)
+        self.assertEqual(stats["chunks"], 2)
+        for card, expected in zip(cards, (110, 120, 130)):
+            card.refresh_from_db()
+            self.assertEqual(card.balance, expected)
+            self.assertEqual(card.pending_deposit_amount, 0)
+        blocked.refresh_from_db()
+        self.assertEqual(blocked.balance, 100)
+
+        entries = LogEntry.objects.order_by("object_id")
+        self.assertEqual(
+            [int(entry.object_id) for entry in entries], [c.id for c in cards]
+        )
+        self.assertTrue(all(entry.user_id == self.user.id for entry in entries))
+
+    def test_nothing_to_process(self):
+        self.assertEqual(process_pending_deposits()["processed"], 0)
+        self.assertFalse(LogEntry.objects.exists())
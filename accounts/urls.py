@@ -8,6 +8,7 @@ from .views import (
     StaffProfileView,
     make_payment,
     statement,
+    statement_export,
     deposit_approval,
     deposit_approval_list,
     create_budgeting_system,
@@ -15,6 +16,7 @@ from .views import (
     delete_budgeting_system,
     EditUserAddressView,
     AccountLoginView,
+    bulk_issue_cards,
 )
 
 app_name = "accounts"
@@ -28,7 +30,13 @@ urlpatterns = [
     path("make_payment/", make_payment, name="make_payment"),
     path("create_card/", CardCreateView.as_view(), name="create_card"),
     path("card_list/", CardListView.as_view(), name="card_list"),
+    path("cards/bulk-issue/", bulk_issue_cards, name="bulk_issue_cards"),
     path("card_history/<int:card_id>", statement, name="card_history"),
+    path(
+        "card_history/<int:card_id>/export",
+        statement_export,
+        name="card_history_export",
+    ),
     path("deposit_card/<int:card_id>", deposit_card, name="deposit_form"),
     path("deposit-approval/", deposit_approval_list, name="deposit_approval_list"),
     path("deposit-approval/<int:card_id>/", deposit_approval, name="deposit_approval"),
@@ -1,5 +1,12 @@
+from datetime import datetime, time, timedelta
 from decimal import Decimal, getcontext
 
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Sum, Value, When
+from django.utils import timezone
+
+from accounts.models import Card, LedgerEntry, Payment, PaymentDailyRollup
+
 
 def convert_currency(amount, from_currency, to_currency, rate):
     valid_currencies = {"USD", "BYN", "U", "B"}
@@ -18,3 +25,77 @@ def convert_currency(amount, from_currency, to_currency, rate):
         result = amount / rate
 
         return result
+
+
+def adjust_balances(deltas, kind):
+    """
+    Add ``{card_id: amount}`` to card balances with a single UPDATE and write
+    a ``kind`` ledger entry for every changed card in the same transaction.
+    Returns ``{card_id: balance_after}``.
+    """
+    deltas = {card_id: amount for card_id, amount in deltas.items() if amount}
+    if not deltas:
+        return {}
+    with transaction.atomic():
+        Card.objects.filter(pk__in=deltas).update(
+            balance=F("balance")
+            + Case(
+                *[
+                    When(pk=card_id, then=Value(amount))
+                    for card_id, amount in deltas.items()
+                ],
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            )
+        )
+        # Строки заблокированы нашим UPDATE, балансы после изменения точные
+        balances = dict(Card.objects.filter(pk__in=deltas).values_list("id", "balance"))
+        LedgerEntry.objects.bulk_create(
+            LedgerEntry(
+                card_id=card_id,
+                kind=kind,
+                amount=amount,
+                balance_after=balances[card_id],
+            )
+            for card_id, amount in deltas.items()
+            if card_id in balances
+        )
+    return balances
+
+
+def statement_queryset(card, start_date, end_date):
+    """
+    Payments of ``card`` from ``start_date`` up to, but not including,
+    ``end_date``, the same period as ``statement_total``.
+    """
+    return Payment.objects.filter(
+        card=card, timestamp__gte=start_date, timestamp__lt=end_date
+    )
+
+
+def statement_total(card, start_date, end_date):
+    """
+    Sum of the regular (non-pending) payments of ``card`` from ``start_date``
+    up to, but not including, ``end_date``.
+
+    Closed days are read from ``PaymentDailyRollup``; only today's payments
+    are summed from raw rows.
+    """
+    today = timezone.localdate()
+    total = (
+        PaymentDailyRollup.objects.filter(
+            card=card, day__gte=start_date, day__lt=min(end_date, today)
+        ).aggregate(total_spent=Sum("debit_sum"))["total_spent"]
+        or 0
+    )
+    if start_date <= today < end_date:
+        day_start = timezone.make_aware(datetime.combine(today, time.min))
+        total += (
+            Payment.objects.filter(
+                card=card,
+                deposit_pending=False,
+                timestamp__gte=day_start,
+                timestamp__lt=day_start + timedelta(days=1),
+            ).aggregate(total_spent=Sum("amount"))["total_spent"]
+            or 0
+        )
+    return total
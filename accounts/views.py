@@ -1,24 +1,22 @@
+import io
 from datetime import timedelta
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.admin.views.decorators import staff_member_required
-from django.contrib.auth import login, logout
+from django.contrib.auth import logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.views import LoginView
-import requests
-from django.contrib.sites.shortcuts import get_current_site
-from django.core.mail import EmailMessage
-from django.db.models import Sum
+from django.db import transaction
+from django.db.models import F
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.template.loader import render_to_string
 from django.urls import reverse_lazy
 from django.views import View
 from django.views.generic import TemplateView, RedirectView, FormView
-from django_otp import match_token, devices_for_user
-from django_otp.forms import OTPAuthenticationForm
-from django_otp.plugins.otp_totp.models import TOTPDevice
 
 from accounts.forms import (
+    LoginForm,
     UserAddressForm,
     CardCreationForm,
     DepositCardForm,
@@ -27,12 +25,24 @@ from accounts.forms import (
     DepositApprovalForm,
     BudgetSystemForm,
     SignUpForm,
+    BulkCardIssueForm,
 )
+from accounts import exports, idempotency
+from accounts.constants import DEPOSIT
+from accounts.issuance import issue_cards
+from accounts.exchange_rates import get_usd_rate
 from accounts.models import UserAddress, Card, Payment, BudgetSystem
-from accounts.tasks import count_monthly_budget
+from accounts.tasks import count_monthly_budget, send_signup_email
 import logging
 
-from accounts.utils import convert_currency
+from accounts.pagination import paginate
+from accounts.utils import (
+    adjust_balances,
+    convert_currency,
+    statement_queryset,
+    statement_total,
+)
+from core.metrics import PAYMENTS
 
 logger = logging.getLogger(__name__)
 
@@ -41,12 +51,6 @@ class SignUpView(View):
     form_class = SignUpForm
     template_name = "commons/signup.html"
 
-    def get_user_totp_device(self, user, confirmed=None):
-        devices = devices_for_user(user, confirmed=confirmed)
-        for device in devices:
-            if isinstance(device, TOTPDevice):
-                return device
-
     def get(self, request, *args, **kwargs):
         form = self.form_class()
         return render(request, self.template_name, {"form": form})
@@ -57,23 +61,8 @@ class SignUpView(View):
             user = form.save(commit=False)
             user.is_active = True  # Deactivate account till it is confirmed
             user.save()
-            device = self.get_user_totp_device(user)
-            if not device:
-                device = user.totpdevice_set.create(confirmed=True)
-                print(device.config_url)
-            current_site = get_current_site(request)
-            mail_subject = "DJANGO OTP DEMO"
-            message = render_to_string(
-                "emails/account_activation_email.html",
-                {
-                    "user": user,
-                    "qr_code": device.config_url,
-                },
-            )
-            to_email = form.cleaned_data.get("email")
-            email = EmailMessage(mail_subject, message, to=[to_email])
-            email.content_subtype = "html"
-            email.send()
+            # TOTP-устройство и письмо готовит воркер, как только пользователь в базе
+            transaction.on_commit(lambda: send_signup_email.delay(user.id))
 
             messages.success(
                 request, "Please Confirm your email to complete registration."
@@ -86,33 +75,10 @@ class SignUpView(View):
 
 class AccountLoginView(LoginView):
     template_name = "commons/login.html"
-    form_class = OTPAuthenticationForm
+    # Пароль и OTP-токен проверяются в форме, устройство берётся из кэша
+    form_class = LoginForm
     redirect_authenticated_user = True
 
-    def form_invalid(self, form):
-        return super().form_invalid(form)
-
-    def form_valid(self, form):
-        # Let the custom authentication form handle authentication
-        user = form.get_user()
-
-        if user is not None:
-            otp_token = form.cleaned_data.get("otp_token")
-            device_match = match_token(user=user, token=otp_token)
-
-            if device_match:
-                # Log the user in
-                login(self.request, user)
-                return super().form_valid(form)
-            else:
-                # Handle token mismatch
-                form.add_error("otp_token", "Invalid OTP token")
-        else:
-            # Handle authentication failure
-            form.add_error(None, "Invalid email or password")
-
-        return super().form_valid(form)
-
 
 class LogoutView(RedirectView):
     pattern_name = "home"
@@ -181,26 +147,8 @@ class EditUserAddressView(LoginRequiredMixin, FormView):
 
 
 def get_usd_exchange_rate():
-    url = "https://belarusbank.by/api/kursExchange"
-
-    # Отправка GET-запроса к API
-    response = requests.get(url)
-
-    # Проверка успешности запроса
-    if response.status_code == 200:
-        data = response.json()
-
-        # Предположим, что "USD_in" находится внутри первого элемента списка
-        if isinstance(data, list) and len(data) > 0:
-            usd_in_rate = data[0].get("USD_in")
-            return usd_in_rate
-        else:
-            print("Структура данных не соответствует ожидаемой.")
-            return None
-    else:
-        # Вывод сообщения об ошибке в случае неудачного запроса
-        print(f"Ошибка при получении данных. Статус код: {response.status_code}")
-        return None
+    # Курс берётся из кэша, API дёргается только при промахе или в фоне
+    return get_usd_rate()
 
 
 @login_required()
@@ -208,6 +156,10 @@ def make_payment(request, card_id=None):
     card = get_object_or_404(Card, id=card_id) if card_id else 1
 
     if request.method == "POST":
+        record, replayed = idempotency.claim(request, "make_payment")
+        if replayed:
+            return replayed
+
         form = PaymentForm(request.user, request.POST)
         if form.is_valid():
             amount = form.cleaned_data["amount"]
@@ -217,30 +169,42 @@ def make_payment(request, card_id=None):
             card_type = selected_card.card_type
             if selected_card.currency == "U":
                 usd_in_rate = get_usd_exchange_rate()
-
-                # Пример значения по умолчанию, если запрос к API неудачен
-                if usd_in_rate is None:
-                    usd_in_rate = 3.116
-                print(usd_in_rate)
                 converted_amount = convert_currency(amount, "USD", "BYN", usd_in_rate)
 
             else:
                 converted_amount = amount
 
-            # Выполняем платеж
-            success, message = selected_card.make_payment(converted_amount, card_type)
+            # Выполняем платеж; исход ключа фиксируется в той же транзакции
+            try:
+                with idempotency.atomic(record):
+                    success, message = selected_card.make_payment(
+                        converted_amount, card_type
+                    )
+                    response = idempotency.complete(
+                        record, redirect("accounts:make_payment"), success, message
+                    )
+            except idempotency.Conflict:
+                return idempotency.replay(request, record)
+            except Exception:
+                idempotency.release(record)
+                raise
+            PAYMENTS.labels(outcome="success" if success else "failure").inc()
 
             if success:
                 messages.success(request, f"{message}")
-                return redirect("accounts:make_payment")
             else:
                 messages.error(request, f"{message}")
-                return redirect("accounts:make_payment")
+            return response
 
+        idempotency.release(record)
     else:
         form = PaymentForm(request.user)
 
-    return render(request, "accounts/payment_form.html", {"form": form, "card": card})
+    return render(
+        request,
+        "accounts/payment_form.html",
+        {"form": form, "card": card, "idempotency_key": idempotency.new_key()},
+    )
 
 
 class StaffProfileView(TemplateView):
@@ -271,6 +235,30 @@ class CardCreateView(LoginRequiredMixin, View):
         return render(request, self.template_name, {"form": form})
 
 
+@staff_member_required
+def bulk_issue_cards(request):
+    report = None
+    if request.method == "POST":
+        form = BulkCardIssueForm(request.POST, request.FILES)
+        if form.is_valid():
+            # utf-8-sig убирает BOM, который Excel пишет в «CSV UTF-8»
+            lines = io.TextIOWrapper(form.cleaned_data["file"], encoding="utf-8-sig")
+            report = issue_cards(lines, form.cleaned_data["batch_size"])
+            logger.info(
+                "Bulk issue by %s: %d cards, %d rejected, %.0f rows/s",
+                request.user.email,
+                report.created,
+                report.error_count,
+                report.rate,
+            )
+    else:
+        form = BulkCardIssueForm()
+
+    return render(
+        request, "accounts/bulk_issue_cards.html", {"form": form, "report": report}
+    )
+
+
 class CardListView(LoginRequiredMixin, View):
     template_name = "accounts/card_list.html"
 
@@ -301,9 +289,12 @@ def deposit_card(request, card_id):
             deposit_amount = form.cleaned_data["deposit_amount"]
 
             # Set the pending deposit amount instead of updating the balance directly
+            # Только эти поля: save() затёр бы баланс, изменённый параллельно
+            Card.objects.filter(pk=card.pk).update(
+                pending_deposit_amount=F("pending_deposit_amount") + deposit_amount,
+                deposit_pending=True,
+            )
             card.pending_deposit_amount += deposit_amount
-            card.deposit_pending = True
-            card.save()
             Payment.objects.create(
                 card=card,
                 amount=card.pending_deposit_amount,
@@ -344,19 +335,21 @@ def deposit_approval(request, card_id):
 
             if approved:
                 # Process the approved deposit
-                card.balance += card.pending_deposit_amount
-                card.pending_deposit_amount = 0
-                card.deposit_pending = False
-                card.save()
+                with transaction.atomic():
+                    card = Card.objects.select_for_update().get(pk=card.pk)
+                    adjust_balances({card.pk: card.pending_deposit_amount}, DEPOSIT)
+                    Card.objects.filter(pk=card.pk).update(
+                        pending_deposit_amount=0, deposit_pending=False
+                    )
 
                 messages.success(
                     request, f"Deposit request for Card {card.account_no} approved."
                 )
             else:
-                # Reject the deposit
-                card.pending_deposit_amount = 0
-                card.deposit_pending = False
-                card.save()
+                # Reject the deposit; save() перезаписал бы баланс устаревшим
+                Card.objects.filter(pk=card.pk).update(
+                    pending_deposit_amount=0, deposit_pending=False
+                )
 
                 messages.warning(
                     request, f"Deposit request for Card {card.account_no} rejected."
@@ -381,19 +374,36 @@ def statement(request, card_id):
         start_date = form.cleaned_data["start_date"]
         end_date = form.cleaned_data["end_date"] + timedelta(days=1)
 
-        payments = Payment.objects.filter(
-            card=card, timestamp__range=[start_date, end_date]
-        )
+        payments = statement_queryset(card, start_date, end_date)
+        page_size = settings.STATEMENT_PAGE_SIZE
 
-        # Separate payments and pending deposits
-        regular_payments = payments.filter(deposit_pending=False)
-        pending_deposits = payments.filter(deposit_pending=True)
+        # Separate payments and pending deposits, each list has its own cursor
+        regular_payments = paginate(
+            payments.filter(deposit_pending=False),
+            request.GET.get("payments_after"),
+            page_size,
+            scope=f"payments:{card.id}",
+        )
+        pending_deposits = paginate(
+            payments.filter(deposit_pending=True),
+            request.GET.get("deposits_after"),
+            page_size,
+            scope=f"deposits:{card.id}",
+        )
 
-        total_spent = regular_payments.aggregate(Sum("amount"))["amount__sum"] or 0
+        # Итог считается отдельным запросом по всему периоду, а не по странице
+        total_spent = statement_total(card, start_date, end_date)
+        next_payments_url = _page_url(
+            request, "payments_after", regular_payments.next_cursor
+        )
+        next_deposits_url = _page_url(
+            request, "deposits_after", pending_deposits.next_cursor
+        )
     else:
         regular_payments = []
         pending_deposits = []
         total_spent = 0
+        next_payments_url = next_deposits_url = None
 
     return render(
         request,
@@ -403,11 +413,52 @@ def statement(request, card_id):
             "regular_payments": regular_payments,
             "pending_deposits": pending_deposits,
             "total_spent": total_spent,
+            "next_payments_url": next_payments_url,
+            "next_deposits_url": next_deposits_url,
             "card": card,
         },
     )
 
 
+@login_required
+def statement_export(request, card_id):
+    cards = Card.objects.all()
+    if not request.user.is_staff:
+        cards = cards.filter(user=request.user)
+    card = get_object_or_404(cards, id=card_id)
+
+    form = StatementFilterForm(request.GET)
+    fmt = request.GET.get("format", "csv")
+    if not form.is_valid() or fmt not in exports.FORMATS:
+        return HttpResponseBadRequest("Invalid export parameters.")
+
+    start_date = form.cleaned_data["start_date"]
+    last_day = form.cleaned_data["end_date"]
+    end_date = last_day + timedelta(days=1)
+    compress = request.GET.get("gzip") == "1"
+
+    filename = f"card_{card.id}_{start_date:%Y%m%d}_{last_day:%Y%m%d}.{fmt}"
+    content_type = exports.FORMATS[fmt]
+    if compress:
+        filename += ".gz"
+        content_type = "application/gzip"
+
+    response = StreamingHttpResponse(
+        exports.stream(statement_queryset(card, start_date, end_date), fmt, compress),
+        content_type=content_type,
+    )
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+def _page_url(request, param, cursor):
+    if cursor is None:
+        return None
+    query = request.GET.copy()
+    query[param] = cursor
+    return f"{request.path}?{query.urlencode()}"
+
+
 # ----------------Budgeting Systems-----------------------
 
 
@@ -422,9 +473,9 @@ def create_budgeting_system(request):
             form.save()
             print(form.cleaned_data)
             card = Card.objects.filter(id=int(form.data["card"]), user=user).first()
-            card.using_system = True
-            card.daily_balance = card.balance / 30
-            card.save()
+            Card.objects.filter(pk=card.pk).update(
+                using_system=True, daily_balance=card.balance / 30
+            )
             count_monthly_budget(int(form.data["card"]))
             return redirect("accounts:budgeting_systems_list")
         else:
@@ -1,7 +1,9 @@
 from __future__ import absolute_import, unicode_literals
 import os
+import time
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import before_task_publish
 
 # set the default Django settings module for the 'celery' program.
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "banking_system.settings")
@@ -15,6 +17,14 @@ app.config_from_object("django.conf:settings", namespace="CELERY")
 # Load task modules from all registered Django app configs.
 app.autodiscover_tasks()
 
+
+@before_task_publish.connect
+def stamp_published_at(headers=None, **kwargs):
+    # По этой отметке core.locks считает лаг периодических задач
+    headers.setdefault("published_at", time.time())
+
+
+# Every task here must be wrapped in core.locks.single_instance
 app.conf.beat_schedule = {
     "check_credit_card_payments": {
         "task": "accounts.tasks.check_credit_card_payments",
@@ -35,6 +45,22 @@ app.conf.beat_schedule = {
             minute="*/10"
         ),  # Set the schedule interval in seconds (e.g., every 10 minutes)
     },
+    "refresh_exchange_rates": {
+        "task": "accounts.tasks.refresh_exchange_rates",
+        "schedule": 240,  # keep the rate cache warm (TTL is 5 minutes)
+    },
+    "purge_expired_idempotency_keys": {
+        "task": "accounts.tasks.purge_expired_idempotency_keys",
+        "schedule": crontab(minute="0"),
+    },
+    "checkpoint_balances": {
+        "task": "accounts.tasks.checkpoint_balances",
+        "schedule": crontab(hour="1", minute="30"),
+    },
+    "reconcile_balances_all": {
+        "task": "accounts.tasks.reconcile_balances_all",
+        "schedule": crontab(hour="2", minute="0"),
+    },
     "count_monthly_budget_all": {
         "task": "accounts.tasks.count_monthly_budget_all",
         "schedule": crontab(
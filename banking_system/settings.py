@@ -59,6 +59,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первым, чтобы учитывать и запросы сессий/аутентификации
+    "core.middleware.QueryStatsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -69,6 +71,28 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# SQL per request: views over budget are logged as warnings
+QUERY_BUDGET_DEFAULT = 30
+QUERY_BUDGETS = {
+    # view name -> max queries, None disables the check
+    "transactions:fund_transfer": 25,
+    "transactions:fund_transfer_card_by_card": 25,
+}
+
+# Prometheus: when set, /metrics requires "Authorization: Bearer <token>".
+# When unset, /metrics is only served with DEBUG on or to staff users.
+# Multi-process aggregation is enabled by the PROMETHEUS_MULTIPROC_DIR env var
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "loggers": {
+        "core.middleware": {"handlers": ["console"], "level": "INFO"},
+    },
+}
+
 ROOT_URLCONF = "banking_system.urls"
 AUTH_USER_MODEL = "accounts.User"
 
@@ -178,24 +202,91 @@ LOGIN_REDIRECT_URL = "home"
 # Celery Settings
 CELERY_BROKER_URL = "redis://localhost:6379"
 CELERY_RESULT_BACKEND = "redis://localhost:6379"
+# Offline/load testing: run tasks inline instead of sending them to the broker
+if os.getenv("CELERY_TASK_ALWAYS_EAGER"):
+    CELERY_TASK_ALWAYS_EAGER = True
 CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers:DatabaseScheduler"
 BROKER_URL = "redis://localhost:6379/0"
 
 CELERY_TIMEZONE = TIME_ZONE
 
+# Cards handled per transaction by the periodic budget tasks
+BUDGET_TASK_CHUNK_SIZE = 1000
+# Cards credited per transaction by process_pending_deposits
+DEPOSIT_TASK_CHUNK_SIZE = 1000
+# Credits charged per transaction by process_monthly_payment
+CREDIT_TASK_CHUNK_SIZE = 1000
+# Card id range handled by one count_monthly_budget_all partition task
+BUDGET_PARTITION_SIZE = 50000
+# count_monthly_budget_all looks this far (seconds) behind its watermark again,
+# so budgeting systems saved by transactions still open at the last run are seen
+BUDGET_WATERMARK_OVERLAP = 60
+# Cards per query in checkpoint_balances
+CHECKPOINT_TASK_CHUNK_SIZE = 1000
+# Ledger entries younger than this (seconds) are left to the next checkpoint
+LEDGER_CHECKPOINT_DELAY = 60
+# Card id range per reconciliation partition and cards per query inside it
+RECONCILE_PARTITION_SIZE = 100000
+RECONCILE_CHUNK_SIZE = 5000
+# Periodic tasks run one at a time (core.locks): the lease is renewed every
+# third of TASK_LOCK_LEASE and frees itself that long after a worker dies
+TASK_LOCK_CACHE_ALIAS = "default"
+TASK_LOCK_LEASE = 60  # seconds
+TASK_LOCK_RETRY_AFTER = 30  # seconds before an overlapping queued run retries
+
 CACHES = {
     "default": {
         "BACKEND": "django_redis.cache.RedisCache",
         "LOCATION": "redis://127.0.0.1:18000/1",
     }
 }
+# Exchange rates (Belarusbank kursExchange API)
+EXCHANGE_RATE_URL = os.getenv(
+    "EXCHANGE_RATE_URL", "https://belarusbank.by/api/kursExchange"
+)
+EXCHANGE_RATE_TIMEOUT = 3  # seconds
+EXCHANGE_RATE_TTL = 300  # served without refreshing
+EXCHANGE_RATE_STALE_TTL = 3600  # served while refreshing in the background
+EXCHANGE_RATE_RETRY_AFTER = 30  # back-off after a failed fetch
+EXCHANGE_RATE_LOCAL_CACHE_SIZE = 16
+EXCHANGE_RATE_CACHE_ALIAS = "default"
+EXCHANGE_RATE_DEFAULTS = {"USD_in": "3.116", "USD_out": "3.19"}
+
+# OTP login: cached TOTP devices, used tokens and failed attempts
+OTP_CACHE_ALIAS = "default"
+OTP_DEVICE_CACHE_TTL = 3600
+OTP_MAX_FAILURES = 5
+OTP_FAILURE_WINDOW = 300  # seconds
+
+# Idempotency keys for payments and transfers
+IDEMPOTENCY_KEY_TTL = 60 * 60 * 24  # seconds
+
+# Card numbers: issuer prefix (6 digits) and numbers reserved per process at once
+CARD_NUMBER_PREFIX = "415247"
+CARD_NUMBER_BLOCK_SIZE = 100
+CARD_ISSUE_BATCH_SIZE = 1000  # cards per transaction in bulk issuance
+
+# Card history
+STATEMENT_PAGE_SIZE = 50
+STATEMENT_EXPORT_CHUNK_SIZE = 2000  # rows fetched per server-side cursor round trip
+
 BANK_USER_CONFIRMATION_KEY = "user_confirmation_{token}"
 BANK_USER_CONFIRMATION_TIMEOUT = 300
 
-EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
-EMAIL_HOST = "smtp.mail.ru"
-EMAIL_PORT = 587
-EMAIL_USE_TLS = True
+# Offline: EMAIL_BACKEND=django.core.mail.backends.filebased.EmailBackend
+# (messages land in EMAIL_FILE_PATH) or ...console.EmailBackend
+EMAIL_BACKEND = os.getenv(
+    "EMAIL_BACKEND", "django.core.mail.backends.smtp.EmailBackend"
+)
+EMAIL_FILE_PATH = os.getenv(
+    "EMAIL_FILE_PATH", os.path.join(BASE_DIR, "sent_emails")
+)
+EMAIL_HOST = os.getenv("EMAIL_HOST", "smtp.mail.ru")
+EMAIL_PORT = int(os.getenv("EMAIL_PORT", 587))
+EMAIL_USE_TLS = os.getenv("EMAIL_USE_TLS", "1") != "0"
 EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD")
-DEFAULT_FROM_EMAIL = os.getenv("EMAIL_HOST_USER")
+DEFAULT_FROM_EMAIL = os.getenv("EMAIL_HOST_USER") or "webmaster@localhost"
+EMAIL_TIMEOUT = 10
+# Messages sent over one worker SMTP session before it is reopened
+EMAIL_CONNECTION_MAX_MESSAGES = 100
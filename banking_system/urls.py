@@ -26,7 +26,7 @@ from django.contrib.auth.views import (
 from django.urls import include, path
 
 from accounts.views import AccountLoginView, SignUpView
-from core.views import HomeView
+from core.views import HomeView, metrics_view
 
 
 urlpatterns = [
@@ -37,6 +37,7 @@ urlpatterns = [
     path("credits/", include("credits.urls", namespace="credits")),
     path("login/", AccountLoginView.as_view(), name="login"),
     path("signup/", SignUpView.as_view(), name="signup"),
+    path("metrics", metrics_view, name="metrics"),
     # Change Password
     path(
         "change-password/",
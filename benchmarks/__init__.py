@@ -0,0 +1,13 @@
+"""
+Benchmarks for the banking hot paths.
+
+Every run creates a throwaway test database (like ``manage.py test``), fills
+it with ``core.synthetic`` data, measures the selected cases and prints
+throughput and p50/p95/p99 latency. Typical use::
+
+    python -m benchmarks --output baseline.json            # on main
+    python -m benchmarks --baseline baseline.json          # on a branch
+
+With ``--baseline`` the exit status is 1 when a case got slower than the
+baseline by more than ``--threshold``.
+"""
@@ -0,0 +1,202 @@
+"""
+Benchmark cases.
+
+Every case takes the run ``Context`` and returns a list of results built by
+``results.summarize``. Request cases go through the Django test client, so
+they include middleware, forms and template rendering.
+"""
+
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import F
+from django.db.models.functions import Mod
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import Card, User
+from accounts.tasks import (
+    count_monthly_budget_all,
+    process_pending_deposits,
+    recount_daily_budget,
+)
+from benchmarks.results import summarize
+from core.synthetic import Generator
+from credits.tasks import process_monthly_payment
+
+TASKS = [
+    recount_daily_budget,
+    process_pending_deposits,
+    count_monthly_budget_all,
+    process_monthly_payment,
+]
+
+
+class Context:
+    def __init__(self, iterations, warmup, seed, statement_payments, scales):
+        self.iterations = iterations
+        self.warmup = warmup
+        self.seed = seed
+        self.statement_payments = statement_payments
+        self.scales = scales
+        self.cards = 0
+        self._users = 0
+
+    def user(self):
+        self._users += 1
+        return User.objects.create_user(
+            email=f"bench{self._users}@example.com", password=None
+        )
+
+    def card(self, user, **fields):
+        fields.setdefault("card_type", "D")
+        fields.setdefault("currency", "B")
+        return Card.objects.create(user=user, **fields)
+
+    def client(self, user):
+        client = Client()
+        client.force_login(user)
+        return client
+
+    def grow_to(self, cards):
+        """Add synthetic users with two cards each until there are ``cards``."""
+        missing = cards - self.cards
+        if missing <= 0:
+            return
+        Generator(seed=self.seed, prefix=f"scale{cards}-").users_and_cards(
+            (missing + 1) // 2, 2
+        )
+        self.cards = Card.objects.count()
+
+
+def measure(ctx, name, call):
+    for _ in range(ctx.warmup):
+        call()
+    samples = []
+    for _ in range(ctx.iterations):
+        started = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - started)
+    return summarize(name, samples)
+
+
+def expect_redirect(response):
+    if response.status_code != 302:
+        raise AssertionError(f"expected a redirect, got {response.status_code}")
+
+
+def make_payment(ctx):
+    card = ctx.card(ctx.user(), balance=Decimal(10**9))
+
+    def call():
+        success, message = card.make_payment(Decimal("1.00"), "D")
+        assert success, message
+
+    return [measure(ctx, "make_payment", call)]
+
+
+def fund_transfer(ctx):
+    user = ctx.user()
+    card = ctx.card(user, balance=Decimal(10**9))
+    receiver = ctx.card(ctx.user())
+    client = ctx.client(user)
+    url = reverse("transactions:fund_transfer")
+
+    def call():
+        expect_redirect(
+            client.post(
+                url,
+                {
+                    "card": card.id,
+                    "receiver_account_number": receiver.account_no,
+                    "amount": "1.00",
+                    "idempotency_key": uuid.uuid4().hex,
+                },
+            )
+        )
+
+    return [measure(ctx, "fund_transfer", call)]
+
+
+def fund_transfer_card_by_card(ctx):
+    user = ctx.user()
+    card_one = ctx.card(user, balance=Decimal(10**9))
+    card_two = ctx.card(user, card_type="C")
+    client = ctx.client(user)
+    url = reverse("transactions:fund_transfer_card_by_card")
+
+    def call():
+        expect_redirect(
+            client.post(
+                url,
+                {
+                    "card_one": card_one.id,
+                    "card_two": card_two.id,
+                    "amount": "1.00",
+                    "idempotency_key": uuid.uuid4().hex,
+                },
+            )
+        )
+
+    return [measure(ctx, "fund_transfer_card_by_card", call)]
+
+
+def statement(ctx):
+    # Одна карта с историей за пять лет, выписки за 30 дней и за весь срок
+    generator = Generator(seed=ctx.seed, prefix="statement-")
+    generator.users_and_cards(1, 1)
+    generator.payments(ctx.statement_payments, 5 * 365)
+    card_id = generator.cards[0][0]
+    client = ctx.client(Card.objects.get(id=card_id).user)
+    url = reverse("accounts:card_history", args=[card_id])
+    today = timezone.localdate()
+
+    results = []
+    for name, days in (("statement_30d", 30), ("statement_5y", 5 * 365)):
+        period = {
+            "start_date": (today - timedelta(days=days)).isoformat(),
+            "end_date": today.isoformat(),
+        }
+
+        def call():
+            response = client.get(url, period)
+            assert response.status_code == 200, response.status_code
+
+        results.append(measure(ctx, name, call))
+    return results
+
+
+def periodic_tasks(ctx):
+    """Run every periodic task once per scale; chords run eagerly in-process."""
+    results = []
+    for label, cards in ctx.scales:
+        ctx.grow_to(cards)
+        # Каждая десятая карта ждёт зачисления депозита
+        Card.objects.annotate(bucket=Mod("id", 10)).filter(bucket=0).update(
+            pending_deposit_amount=F("pending_deposit_amount") + 10
+        )
+        # Меряем первый прогон периода: задачи бюджета обходят все карты
+        Card.objects.update(daily_budget_on=None, monthly_budget_on=None)
+        for task in TASKS:
+            started = time.perf_counter()
+            result = task.delay().get()
+            elapsed = time.perf_counter() - started
+            items = result.get("processed") if isinstance(result, dict) else None
+            if items is None:
+                # count_monthly_budget_all отдаёт число партиций, считаем карты
+                items = Card.objects.filter(using_system=True).count()
+            name = task.name.rsplit(".", 1)[-1]
+            results.append(summarize(f"{name}@{label}", [elapsed], items))
+    return results
+
+
+CASES = {
+    "make_payment": make_payment,
+    "fund_transfer": fund_transfer,
+    "fund_transfer_card_by_card": fund_transfer_card_by_card,
+    "statement": statement,
+    "tasks": periodic_tasks,
+}
@@ -0,0 +1,417 @@
+"""
+Concurrent load test of the web tier.
+
+``python -m benchmarks.load`` starts the exchange rate and SMTP stand-ins
+from ``core.standins``, starts gunicorn pointed at them (or uses a server
+given with ``--target``), creates virtual users with cards and TOTP devices
+in the configured database and lets them drive a weighted mix of login,
+card list, payment, transfer, statement and signup traffic over real HTTP.
+Latency percentiles, throughput and error rates are reported per operation.
+
+A virtual user logs in again at most once per TOTP step: the server accepts
+every token only once.
+"""
+
+import argparse
+import itertools
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import date, timedelta
+from pathlib import Path
+
+import django
+import requests
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+EMAIL_DOMAIN = "loadtest.test"
+PASSWORD = "Load-test-passw0rd"
+DEFAULT_MIX = "login=1,cards=4,payment=3,transfer=2,statement=2,signup=1"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.load",
+        description="Drive concurrent traffic against the web tier.",
+    )
+    parser.add_argument(
+        "--target", help="base URL of a running server (default: start gunicorn)"
+    )
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn workers")
+    parser.add_argument("--users", type=int, default=20, help="virtual users")
+    parser.add_argument("--duration", type=float, default=60, help="seconds")
+    parser.add_argument(
+        "--think", type=float, default=0, help="pause between requests, seconds"
+    )
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="operation=weight,...")
+    parser.add_argument(
+        "--rate-latency",
+        type=float,
+        default=0.05,
+        help="exchange rate stand-in latency, seconds",
+    )
+    parser.add_argument(
+        "--rate-failure-rate",
+        type=float,
+        default=0,
+        help="share of exchange rate requests that fail",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write JSON results here")
+    return parser.parse_args(argv)
+
+
+def parse_mix(mix):
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        if name.strip() not in VirtualUser.OPERATIONS:
+            raise SystemExit(f"Unknown operation {name!r}")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.error_examples = {}
+
+    def record(self, operation, duration, error=None):
+        with self._lock:
+            self.samples[operation].append(duration)
+            if error is not None:
+                self.errors[operation] += 1
+                self.error_examples.setdefault(operation, error)
+
+
+class VirtualUser:
+    OPERATIONS = ("login", "cards", "payment", "transfer", "statement", "signup")
+
+    def __init__(self, base_url, email, device, cards, recorder, rng):
+        self.base_url = base_url.rstrip("/")
+        self.email = email
+        self.device = device
+        self.debit_card, self.credit_card, self.usd_card = cards
+        self.recorder = recorder
+        self.rng = rng
+        self.session = requests.Session()
+        self.last_login_step = None
+
+    def url(self, path):
+        return f"{self.base_url}{path}"
+
+    def timed(self, operation, call, expected):
+        started = time.perf_counter()
+        error = None
+        try:
+            response = call()
+            if response.status_code != expected:
+                error = f"HTTP {response.status_code}"
+        except requests.RequestException as e:
+            error = str(e)
+        self.recorder.record(operation, time.perf_counter() - started, error)
+        return error is None
+
+    def form(self, session, path, data):
+        # Django сверяет токен формы с секретом из cookie csrftoken
+        data["csrfmiddlewaretoken"] = session.cookies.get("csrftoken", "")
+        return session.post(
+            self.url(path),
+            data,
+            headers={"Referer": self.url(path)},
+            allow_redirects=False,
+        )
+
+    def token(self):
+        from django_otp.oath import TOTP
+
+        key, step, t0, digits = self.device
+        totp = TOTP(key, step, t0, digits)
+        return totp.t(), f"{totp.token():0{digits}d}"
+
+    def can_login(self):
+        return self.token()[0] != self.last_login_step
+
+    def login(self):
+        self.session.cookies.clear()
+        self.session.get(self.url("/login/"))
+        step, token = self.token()
+        self.last_login_step = step
+        return self.timed(
+            "login",
+            lambda: self.form(
+                self.session,
+                "/login/",
+                {"username": self.email, "password": PASSWORD, "otp_token": token},
+            ),
+            302,
+        )
+
+    def cards(self):
+        return self.timed(
+            "cards",
+            lambda: self.session.get(
+                self.url("/accounts/card_list/"), allow_redirects=False
+            ),
+            200,
+        )
+
+    def payment(self):
+        return self.timed(
+            "payment",
+            lambda: self.form(
+                self.session,
+                "/accounts/make_payment/",
+                {
+                    "card": self.usd_card,
+                    "amount": "0.01",
+                    "idempotency_key": uuid.uuid4().hex,
+                },
+            ),
+            302,
+        )
+
+    def transfer(self):
+        return self.timed(
+            "transfer",
+            lambda: self.form(
+                self.session,
+                "/transactions/fund_transfer_card_by_card/",
+                {
+                    "card_one": self.debit_card,
+                    "card_two": self.credit_card,
+                    "amount": "0.01",
+                    "idempotency_key": uuid.uuid4().hex,
+                },
+            ),
+            302,
+        )
+
+    def statement(self):
+        today = date.today()
+        period = {
+            "start_date": (today - timedelta(days=30)).isoformat(),
+            "end_date": today.isoformat(),
+        }
+        return self.timed(
+            "statement",
+            lambda: self.session.get(
+                self.url(f"/accounts/card_history/{self.debit_card}"),
+                params=period,
+                allow_redirects=False,
+            ),
+            200,
+        )
+
+    def signup(self):
+        session = requests.Session()
+        session.get(self.url("/signup/"))
+        email = f"signup-{uuid.uuid4().hex[:12]}@{EMAIL_DOMAIN}"
+        return self.timed(
+            "signup",
+            lambda: self.form(
+                session,
+                "/signup/",
+                {"email": email, "password1": PASSWORD, "password2": PASSWORD},
+            ),
+            302,
+        )
+
+    def run(self, weights, deadline, think):
+        operations, cumulative = zip(*weights.items())
+        cumulative = list(itertools.accumulate(cumulative))
+        while time.monotonic() < deadline:
+            operation = self.rng.choices(operations, cum_weights=cumulative)[0]
+            if operation == "login" and not self.can_login():
+                operation = "cards"
+            getattr(self, operation)()
+            if think:
+                time.sleep(think)
+
+
+def create_users(count):
+    from django.contrib.auth.hashers import make_password
+
+    from accounts.models import Card, User
+
+    run = uuid.uuid4().hex[:8]
+    password = make_password(PASSWORD)
+    users = User.objects.bulk_create(
+        User(email=f"vu{i}-{run}@{EMAIL_DOMAIN}", password=password)
+        for i in range(count)
+    )
+    accounts = []
+    for user in users:
+        device = user.totpdevice_set.create(confirmed=True)
+        cards = [
+            Card.objects.create(
+                user=user, card_type="D", currency="B", balance=10**6
+            ),
+            Card.objects.create(user=user, card_type="C", currency="B"),
+            Card.objects.create(
+                user=user, card_type="D", currency="U", balance=10**6
+            ),
+        ]
+        accounts.append(
+            (
+                user.email,
+                (device.bin_key, device.step, device.t0, device.digits),
+                [card.id for card in cards],
+            )
+        )
+    return accounts
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(workers, env):
+    port = free_port()
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "-c",
+            "gunicorn.conf.py",
+            "--bind",
+            f"127.0.0.1:{port}",
+            "--workers",
+            str(workers),
+        ],
+        cwd=BASE_DIR,
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit("gunicorn exited during startup")
+        try:
+            requests.get(f"{base_url}/login/", timeout=1)
+            return server, base_url
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    server.terminate()
+    raise SystemExit("gunicorn didn't start in 30s")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    weights = parse_mix(args.mix)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "banking_system.settings")
+    django.setup()
+
+    from benchmarks.results import dump, summarize
+    from core.standins import ExchangeRateStandIn, SMTPSinkStandIn
+
+    rates = ExchangeRateStandIn(
+        latency=args.rate_latency, failure_rate=args.rate_failure_rate
+    ).start()
+    smtp = SMTPSinkStandIn().start()
+    server_env = {
+        "EXCHANGE_RATE_URL": rates.url,
+        "EMAIL_BACKEND": "django.core.mail.backends.smtp.EmailBackend",
+        "EMAIL_HOST": smtp.host,
+        "EMAIL_PORT": str(smtp.port),
+        "EMAIL_USE_TLS": "0",
+        "EMAIL_HOST_USER": "",
+        "EMAIL_HOST_PASSWORD": "",
+        "CELERY_TASK_ALWAYS_EAGER": "1",
+    }
+    server = None
+    try:
+        if args.target:
+            base_url = args.target
+            print("Run the target server with:", file=sys.stderr)
+            for name, value in server_env.items():
+                print(f"  {name}={value}", file=sys.stderr)
+        else:
+            server, base_url = start_server(
+                args.workers, dict(os.environ, **server_env)
+            )
+
+        recorder = Recorder()
+        rng = random.Random(args.seed)
+        virtual_users = [
+            VirtualUser(
+                base_url, email, device, cards, recorder, random.Random(rng.random())
+            )
+            for email, device, cards in create_users(args.users)
+        ]
+        for user in virtual_users:
+            if not user.login():
+                raise SystemExit(
+                    f"Initial login of {user.email} failed: "
+                    f"{recorder.error_examples['login']}"
+                )
+
+        started = time.monotonic()
+        deadline = started + args.duration
+        threads = [
+            threading.Thread(target=user.run, args=(weights, deadline, args.think))
+            for user in virtual_users
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        rates.stop()
+        smtp.stop()
+
+    report = {
+        "meta": {
+            "target": base_url,
+            "users": args.users,
+            "duration_s": round(elapsed, 2),
+            "mix": weights,
+            "exchange_rate_requests": rates.requests,
+            "exchange_rate_failures": rates.failures,
+            "emails_received": smtp.received,
+        },
+        "results": [],
+    }
+    for operation, samples in sorted(recorder.samples.items()):
+        result = summarize(operation, samples)
+        # Пропускная способность всей системы, а не одного виртуального пользователя
+        result["throughput_per_s"] = round(len(samples) / elapsed, 2)
+        result["errors"] = recorder.errors[operation]
+        result["error_rate"] = round(recorder.errors[operation] / len(samples), 4)
+        if operation in recorder.error_examples:
+            result["error_example"] = recorder.error_examples[operation]
+        report["results"].append(result)
+        print(
+            f"{operation:<10} {len(samples):>7} req {result['throughput_per_s']:>8.1f}/s "
+            f"p50 {result['p50_ms']:.1f}ms p95 {result['p95_ms']:.1f}ms "
+            f"p99 {result['p99_ms']:.1f}ms errors {result['error_rate']:.2%}",
+            file=sys.stderr,
+        )
+    print(
+        f"Stand-ins: {rates.requests} exchange rate requests "
+        f"({rates.failures} failed), {smtp.received} e-mails",
+        file=sys.stderr,
+    )
+
+    if args.output:
+        dump(report, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
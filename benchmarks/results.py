@@ -0,0 +1,72 @@
+"""Latency summaries and baseline comparison."""
+
+import json
+import math
+import statistics
+
+# Для задач важна пропускная способность, для остального — хвост задержек
+COMPARED = {"p95_ms": 1, "throughput_per_s": -1}
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of ``samples``."""
+    ordered = sorted(samples)
+    rank = max(math.ceil(fraction * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summarize(name, samples, items=None):
+    """
+    Build the result of one case from its per-iteration durations (seconds).
+
+    ``items`` is the number of processed items when an iteration handles more
+    than one (tasks), otherwise throughput is iterations per second.
+    """
+    total = sum(samples)
+    items = len(samples) if items is None else items
+    return {
+        "name": name,
+        "iterations": len(samples),
+        "items": items,
+        "total_s": round(total, 4),
+        "throughput_per_s": round(items / total, 2) if total else None,
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+        "p50_ms": round(percentile(samples, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 3),
+    }
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def dump(report, path):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(current, baseline, threshold):
+    """
+    Compare two reports case by case.
+
+    Returns ``[(name, metric, baseline, current, change)]`` for every metric
+    that got worse by more than ``threshold`` (0.1 = 10%).
+    """
+    before = {result["name"]: result for result in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        old = before.get(result["name"])
+        if old is None:
+            continue
+        for metric, direction in COMPARED.items():
+            if not old.get(metric) or result.get(metric) is None:
+                continue
+            change = (result[metric] - old[metric]) / old[metric]
+            if change * direction > threshold:
+                regressions.append(
+                    (result["name"], metric, old[metric], result[metric], change)
+                )
+    return regressions
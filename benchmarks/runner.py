@@ -0,0 +1,145 @@
+import argparse
+import logging
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+import django
+
+SCALES = {"10k": 10_000, "100k": 100_000, "1M": 1_000_000}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Measure the banking hot paths on a throwaway database.",
+    )
+    parser.add_argument(
+        "--cases",
+        default="make_payment,fund_transfer,fund_transfer_card_by_card,statement,tasks",
+        help="comma separated cases to run",
+    )
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument(
+        "--scales",
+        default="10k",
+        help=f"card counts for the periodic tasks, from {', '.join(SCALES)}",
+    )
+    parser.add_argument(
+        "--statement-payments",
+        type=int,
+        default=100_000,
+        help="payments in the five year history of the statement card",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write JSON results here")
+    parser.add_argument("--baseline", help="compare with these JSON results")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="flag regressions above this share (0.1 = 10%%)",
+    )
+    parser.add_argument(
+        "--keepdb", action="store_true", help="keep the benchmark database"
+    )
+    return parser.parse_args(argv)
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "banking_system.settings")
+    django.setup()
+
+    from django.conf import settings
+    from django.db import connection
+    from django.test.utils import setup_databases, teardown_databases
+
+    from banking_system.celery import app
+    from benchmarks import cases, results
+    from core.standins import ExchangeRateStandIn
+
+    selected = [name.strip() for name in args.cases.split(",") if name.strip()]
+    unknown = set(selected) - set(cases.CASES)
+    if unknown:
+        sys.exit(f"Unknown cases: {', '.join(sorted(unknown))}")
+    scales = [(label, SCALES[label]) for label in args.scales.split(",")]
+
+    # Строка лога на каждый запрос исказила бы замеры
+    logging.getLogger("core.middleware").setLevel(logging.WARNING)
+    app.conf.task_always_eager = True
+    settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, "testserver"]
+
+    ctx = cases.Context(
+        iterations=args.iterations,
+        warmup=args.warmup,
+        seed=args.seed,
+        statement_payments=args.statement_payments,
+        scales=scales,
+    )
+    databases = setup_databases(verbosity=0, interactive=False, keepdb=args.keepdb)
+    measured = []
+    try:
+        with ExchangeRateStandIn() as rates:
+            settings.EXCHANGE_RATE_URL = rates.url
+            for name in selected:
+                print(f"Running {name}...", file=sys.stderr)
+                for result in cases.CASES[name](ctx):
+                    measured.append(result)
+                    print(format_result(result), file=sys.stderr)
+        vendor = connection.vendor
+    finally:
+        teardown_databases(databases, verbosity=0, keepdb=args.keepdb)
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": vendor,
+            "iterations": args.iterations,
+            "seed": args.seed,
+        },
+        "results": measured,
+    }
+    if args.output:
+        results.dump(report, args.output)
+
+    if not args.baseline:
+        return 0
+    regressions = results.compare(report, results.load(args.baseline), args.threshold)
+    for name, metric, before, after, change in regressions:
+        print(
+            f"REGRESSION {name} {metric}: {before} -> {after} ({change:+.1%})",
+            file=sys.stderr,
+        )
+    if not regressions:
+        print(
+            f"No regressions above {args.threshold:.0%} against {args.baseline}",
+            file=sys.stderr,
+        )
+    return 1 if regressions else 0
+
+
+def format_result(result):
+    return (
+        f"  {result['name']:<40} {result['throughput_per_s'] or 0:>12.1f}/s "
+        f"p50 {result['p50_ms']:.2f}ms p95 {result['p95_ms']:.2f}ms "
+        f"p99 {result['p99_ms']:.2f}ms"
+    )
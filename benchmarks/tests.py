@@ -0,0 +1,39 @@
+from django.test import SimpleTestCase
+
+from benchmarks.results import compare, percentile, summarize
+
+
+class ResultsTest(SimpleTestCase):
+    def test_percentile(self):
+        samples = list(range(1, 101))
+        self.assertEqual(percentile(samples, 0.50), 50)
+        self.assertEqual(percentile(samples, 0.95), 95)
+        self.assertEqual(percentile(samples, 0.99), 99)
+        self.assertEqual(percentile([7], 0.99), 7)
+
+    def test_summarize(self):
+        result = summarize("case", [0.001, 0.002, 0.003, 0.004], items=40)
+        self.assertEqual(result["iterations"], 4)
+        self.assertEqual(result["throughput_per_s"], 4000)
+        self.assertEqual(result["p50_ms"], 2)
+        self.assertEqual(result["p99_ms"], 4)
+
+    def test_compare(self):
+        baseline = {
+            "results": [
+                {"name": "a", "p95_ms": 10, "throughput_per_s": 100},
+                {"name": "b", "p95_ms": 10, "throughput_per_s": 100},
+            ]
+        }
+        current = {
+            "results": [
+                {"name": "a", "p95_ms": 10.5, "throughput_per_s": 80},
+                {"name": "b", "p95_ms": 9, "throughput_per_s": 110},
+                {"name": "new", "p95_ms": 1, "throughput_per_s": 1},
+            ]
+        }
+        regressions = compare(current, baseline, threshold=0.1)
+        self.assertEqual(
+            [(name, metric) for name, metric, *_ in regressions],
+            [("a", "throughput_per_s")],
+        )
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     name = "core"
+
+    def ready(self):
+        # Подключает сигналы Celery для метрик задач
+        from core import metrics  # noqa: F401
@@ -0,0 +1,202 @@
+"""
+Single-instance guard for periodic Celery tasks.
+
+``single_instance`` takes a lease in the cache (Redis in production) before
+the task body runs. A heartbeat thread renews the lease while the body runs,
+so a long run keeps it. A worker that dies stops renewing it, so the lock
+frees itself at most ``TASK_LOCK_LEASE`` seconds later. A run that finds the
+lock taken is skipped, or with ``on_overlap=QUEUE`` sent again after
+``retry_after`` seconds. The lease is renewed and released only by its
+owner: the token check and the ``PEXPIRE``/``DEL`` run in one Lua script on
+Redis, so a lease that expired and went to another worker is never touched.
+
+Every finished run stores its duration and lag (time between publishing the
+message and starting the body) under ``task-runs:<name>`` and in Prometheus
+gauges.
+"""
+
+import functools
+import logging
+import threading
+import time
+import uuid
+
+from celery import current_task
+from celery.signals import worker_process_shutdown
+from django.conf import settings
+from django.core.cache import caches
+from django_redis import get_redis_connection
+from django_redis.cache import RedisCache
+
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+SKIP = "skip"
+QUEUE = "queue"
+
+# Аренды, которые держит этот процесс, — для освобождения при остановке
+_held = set()
+
+# Между проверкой токена и DEL/PEXPIRE аренда может истечь и достаться
+# другому воркеру, поэтому обе операции выполняются в Redis одним скриптом
+_RELEASE = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+_RENEW = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("pexpire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+# Кэши без Redis (locmem в тестах) живут в процессе, им хватает мьютекса
+_local_mutex = threading.Lock()
+
+
+def _cache():
+    return caches[settings.TASK_LOCK_CACHE_ALIAS]
+
+
+def _if_owner(script, key, token, *args):
+    cache = _cache()
+    client = get_redis_connection(settings.TASK_LOCK_CACHE_ALIAS)
+    # Значение сравнивается в том виде, в каком его записал cache.add
+    return client.eval(
+        script, 1, cache.make_key(key), cache.client.encode(token), *args
+    )
+
+
+def _renew_if_owner(key, token, seconds):
+    if isinstance(_cache(), RedisCache):
+        return bool(_if_owner(_RENEW, key, token, int(seconds * 1000)))
+    with _local_mutex:
+        return _cache().get(key) == token and _cache().touch(key, seconds)
+
+
+def _delete_if_owner(key, token):
+    if isinstance(_cache(), RedisCache):
+        return bool(_if_owner(_RELEASE, key, token))
+    with _local_mutex:
+        if _cache().get(key) != token:
+            return False
+        return _cache().delete(key)
+
+
+class Lease:
+    def __init__(self, key, seconds):
+        self.key = key
+        self.seconds = seconds
+        self.token = uuid.uuid4().hex
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    def acquire(self):
+        if not _cache().add(self.key, self.token, self.seconds):
+            return False
+        _held.add(self)
+        self._heartbeat = threading.Thread(
+            target=self._renew, name=f"lease {self.key}", daemon=True
+        )
+        self._heartbeat.start()
+        return True
+
+    def _renew(self):
+        while not self._stop.wait(self.seconds / 3):
+            try:
+                if not _renew_if_owner(self.key, self.token, self.seconds):
+                    logger.warning("Lost task lock %s", self.key)
+                    return
+            except Exception:
+                # Следующая попытка будет через треть аренды, она ещё не истекла
+                logger.exception("Couldn't renew task lock %s", self.key)
+
+    def release(self):
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+        _held.discard(self)
+        # Чужую аренду не трогаем: наша могла истечь, пока воркер стоял
+        _delete_if_owner(self.key, self.token)
+
+
+def single_instance(on_overlap=SKIP, lease=None, retry_after=None, key=None):
+    """
+    Run the decorated task body in at most one worker at a time.
+
+    Put it under ``@shared_task``. ``key(*args, **kwargs)`` narrows the lock
+    to the given arguments, e.g. a partition range.
+    """
+
+    def decorator(func):
+        task_name = f"{func.__module__}.{func.__name__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            name = task_name if key is None else f"{task_name}:{key(*args, **kwargs)}"
+            guard = Lease(f"task-lock:{name}", lease or settings.TASK_LOCK_LEASE)
+            if not guard.acquire():
+                return _overlap(name, task_name, on_overlap, retry_after, args, kwargs)
+
+            started = time.time()
+            lag = _lag(started)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                guard.release()
+                _record(name, task_name, started, time.time() - started, lag)
+
+        wrapper.single_instance = True
+        return wrapper
+
+    return decorator
+
+
+def last_run(name):
+    """``{"started_at", "duration", "lag"}`` of the last finished run, or None."""
+    return _cache().get(f"task-runs:{name}")
+
+
+def _overlap(name, task_name, on_overlap, retry_after, args, kwargs):
+    # Eager-задача выполнилась бы повторно тут же, под тем же занятым замком
+    queued = (
+        on_overlap == QUEUE and bool(current_task) and not current_task.request.is_eager
+    )
+    if queued:
+        countdown = retry_after or settings.TASK_LOCK_RETRY_AFTER
+        current_task.apply_async(args, kwargs, countdown=countdown)
+        logger.info("%s is already running, queued again in %ss", name, countdown)
+    else:
+        logger.info("%s is already running, skipped", name)
+    metrics.TASK_OVERLAPS.labels(
+        task=task_name, action="queued" if queued else "skipped"
+    ).inc()
+    return {"skipped": True, "queued": queued}
+
+
+def _lag(started):
+    # published_at ставит banking_system.celery при отправке; у eager-задач его нет
+    request = current_task.request if current_task else None
+    published_at = getattr(request, "published_at", None)
+    if published_at is None:
+        return None
+    return max(started - published_at, 0)
+
+
+def _record(name, task_name, started, duration, lag):
+    _cache().set(
+        f"task-runs:{name}",
+        {"started_at": started, "duration": duration, "lag": lag},
+        None,
+    )
+    metrics.TASK_LAST_DURATION.labels(task=task_name).set(duration)
+    if lag is not None:
+        metrics.TASK_LAG.labels(task=task_name).set(lag)
+
+
+@worker_process_shutdown.connect
+def _release_held(**kwargs):
+    for guard in list(_held):
+        guard.release()
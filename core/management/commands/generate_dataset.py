@@ -0,0 +1,75 @@
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import User
+from core.synthetic import EMAIL_DOMAIN, Generator
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a reproducible synthetic dataset: users, cards, budgeting "
+        "systems, credits and payment history."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10_000)
+        parser.add_argument("--cards-per-user", type=int, default=2)
+        parser.add_argument("--payments", type=int, default=1_000_000)
+        parser.add_argument(
+            "--days", type=int, default=365, help="payment history length in days"
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--prefix", default="load", help="e-mail prefix of the generated users"
+        )
+        parser.add_argument(
+            "--budget-share",
+            type=float,
+            default=0.2,
+            help="share of users with a budgeting system",
+        )
+        parser.add_argument(
+            "--credit-share",
+            type=float,
+            default=0.1,
+            help="share of users with a credit",
+        )
+        parser.add_argument("--batch-size", type=int, default=50_000)
+        parser.add_argument(
+            "--password", default="synthetic", help="password of every generated user"
+        )
+
+    def handle(self, *args, **options):
+        if options["cards_per_user"] < 1:
+            raise CommandError("--cards-per-user must be at least 1")
+        if User.objects.filter(
+            email__startswith=options["prefix"], email__endswith=f"@{EMAIL_DOMAIN}"
+        ).exists():
+            raise CommandError(
+                f"Users with prefix {options['prefix']!r} already exist, "
+                "pick another --prefix"
+            )
+
+        started = time.perf_counter()
+        generator = Generator(
+            seed=options["seed"],
+            prefix=options["prefix"],
+            batch_size=options["batch_size"],
+            budget_share=options["budget_share"],
+            credit_share=options["credit_share"],
+            password=options["password"],
+            progress=self.stderr.write,
+        )
+        generator.users_and_cards(options["users"], options["cards_per_user"])
+        generator.payments(options["payments"], options["days"])
+        call_command("rebuild_payment_rollups", stdout=self.stdout)
+
+        counts = ", ".join(
+            f"{count} {name}" for name, count in generator.counts.items()
+        )
+        self.stdout.write(
+            f"Generated {counts} in {time.perf_counter() - started:.1f}s "
+            f"(seed {options['seed']})"
+        )
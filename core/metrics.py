@@ -0,0 +1,121 @@
+"""
+Prometheus metrics for web requests and Celery tasks.
+
+Gunicorn workers and Celery prefork children are separate processes: with
+``PROMETHEUS_MULTIPROC_DIR`` set every process writes its samples to files in
+that directory and ``/metrics`` aggregates them with ``MultiProcessCollector``.
+Workers running on the web host should share the directory so their task
+metrics are served by the same endpoint.
+"""
+
+import os
+import time
+
+from celery.signals import task_postrun, task_prerun, worker_process_shutdown
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Request latency by URL name",
+    ["view", "method"],
+)
+REQUEST_QUERIES = Histogram(
+    "http_request_db_queries",
+    "SQL queries per request by URL name",
+    ["view"],
+    buckets=(1, 2, 5, 10, 15, 20, 30, 50, 100, 200),
+)
+TRANSFERS = Counter(
+    "bank_transfers_total", "Fund transfers by kind and outcome", ["kind", "outcome"]
+)
+PAYMENTS = Counter("bank_payments_total", "Card payments by outcome", ["outcome"])
+TASK_RUNTIME = Histogram(
+    "celery_task_duration_seconds",
+    "Celery task runtime",
+    ["task", "state"],
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
+)
+TASK_ITEMS = Counter(
+    "celery_task_items_processed_total", "Items processed by batch tasks", ["task"]
+)
+# Задачи под core.locks.single_instance
+TASK_LAST_DURATION = Gauge(
+    "celery_task_last_duration_seconds",
+    "Duration of the last run of a single-instance task",
+    ["task"],
+    multiprocess_mode="mostrecent",
+)
+TASK_LAG = Gauge(
+    "celery_task_lag_seconds",
+    "Time from publishing to starting the last run of a single-instance task",
+    ["task"],
+    multiprocess_mode="mostrecent",
+)
+TASK_OVERLAPS = Counter(
+    "celery_task_overlaps_total",
+    "Runs of a single-instance task that found it already running",
+    ["task", "action"],
+)
+
+# Задачи, возвращающие {"processed": ...}; итог chord считаем за всю задачу
+ITEM_TASKS = {
+    "accounts.tasks.recount_daily_budget": "recount_daily_budget",
+    "accounts.tasks.process_pending_deposits": "process_pending_deposits",
+    "accounts.tasks.summarize_monthly_budget": "count_monthly_budget_all",
+    "credits.tasks.process_monthly_payment": "process_monthly_payment",
+}
+
+_started = {}
+
+
+def registry():
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    collector_registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(collector_registry)
+    return collector_registry
+
+
+def render():
+    return generate_latest(registry())
+
+
+def observe_request(view, method, duration, queries):
+    REQUEST_LATENCY.labels(view=view, method=method).observe(duration)
+    REQUEST_QUERIES.labels(view=view).observe(queries)
+
+
+@task_prerun.connect
+def _task_started(task_id=None, **kwargs):
+    _started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def _task_finished(task_id=None, task=None, retval=None, state=None, **kwargs):
+    started = _started.pop(task_id, None)
+    if started is not None:
+        TASK_RUNTIME.labels(task=task.name, state=state or "UNKNOWN").observe(
+            time.perf_counter() - started
+        )
+    name = ITEM_TASKS.get(task.name)
+    if (
+        name is not None
+        and isinstance(retval, dict)
+        and not retval.get("dry_run")
+        and retval.get("processed")
+    ):
+        TASK_ITEMS.labels(task=name).inc(retval["processed"])
+
+
+@worker_process_shutdown.connect
+def _worker_process_exited(**kwargs):
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(os.getpid())
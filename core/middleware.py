@@ -0,0 +1,146 @@
+"""
+Per-request SQL instrumentation.
+
+``QueryStatsMiddleware`` hooks every database connection with
+``connection.execute_wrapper`` for the duration of the request and records
+the query count, total SQL time, the slowest statement and statements that
+ran more than once. With ``DEBUG`` the numbers go into ``X-DB-*`` response
+headers, otherwise into one log line per request. Requests over their query
+budget (``QUERY_BUDGETS`` by view name, else ``QUERY_BUDGET_DEFAULT``) are
+logged as warnings. Latency and query count also go to the Prometheus
+histograms in ``core.metrics``.
+"""
+
+import hashlib
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+# Списки IN (%s, %s, ...) разной длины и числа в тексте — один и тот же запрос
+_IN_LIST = re.compile(r"\(\s*%s(?:\s*,\s*%s)*\s*\)")
+_NUMBER = re.compile(r"\b\d+\b")
+
+
+def fingerprint(sql):
+    normalized = _NUMBER.sub("?", _IN_LIST.sub("(...)", sql))
+    return hashlib.md5(normalized.encode()).hexdigest()[:12]
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest_sql = None
+        self.slowest_duration = 0.0
+        self.fingerprints = Counter()
+        self.samples = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.record(sql, time.perf_counter() - started)
+
+    def record(self, sql, duration):
+        self.count += 1
+        self.duration += duration
+        if duration >= self.slowest_duration:
+            self.slowest_sql, self.slowest_duration = sql, duration
+        key = fingerprint(sql)
+        self.fingerprints[key] += 1
+        self.samples.setdefault(key, sql)
+
+    @property
+    def duplicates(self):
+        """``{fingerprint: executions}`` for statements that ran more than once."""
+        return {key: n for key, n in self.fingerprints.items() if n > 1}
+
+    def as_dict(self):
+        return {
+            "queries": self.count,
+            "sql_ms": round(self.duration * 1000, 2),
+            "slowest_ms": round(self.slowest_duration * 1000, 2),
+            "slowest_sql": self.slowest_sql,
+            "duplicates": self.duplicates,
+        }
+
+
+def query_budget(view_name):
+    return settings.QUERY_BUDGETS.get(view_name, settings.QUERY_BUDGET_DEFAULT)
+
+
+class QueryStatsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = QueryStats()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(stats))
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        match = getattr(request, "resolver_match", None)
+        view_name = match.view_name if match else request.path
+        # Метка — имя URL, а не путь, иначе 404 раздуют число серий
+        metrics.observe_request(
+            match.view_name if match else "unresolved",
+            request.method,
+            duration,
+            stats.count,
+        )
+        if settings.DEBUG:
+            self.add_headers(response, stats)
+        else:
+            logger.info(
+                "sql view=%s method=%s status=%s queries=%d sql_ms=%.2f "
+                "slowest_ms=%.2f duplicates=%d",
+                view_name,
+                request.method,
+                response.status_code,
+                stats.count,
+                stats.duration * 1000,
+                stats.slowest_duration * 1000,
+                len(stats.duplicates),
+                extra={"view": view_name, "sql": stats.as_dict()},
+            )
+
+        budget = query_budget(view_name)
+        if budget is not None and stats.count > budget:
+            logger.warning(
+                "Query budget exceeded: %s issued %d queries (budget %d), "
+                "duplicated: %s",
+                view_name,
+                stats.count,
+                budget,
+                "; ".join(
+                    f"{n}x {stats.samples[key][:200]}"
+                    for key, n in sorted(
+                        stats.duplicates.items(), key=lambda item: -item[1]
+                    )
+                )
+                or "none",
+                extra={"view": view_name, "sql": stats.as_dict()},
+            )
+        return response
+
+    @staticmethod
+    def add_headers(response, stats):
+        response["X-DB-Query-Count"] = str(stats.count)
+        response["X-DB-Query-Time-Ms"] = f"{stats.duration * 1000:.2f}"
+        response["X-DB-Slowest-Query-Ms"] = f"{stats.slowest_duration * 1000:.2f}"
+        response["X-DB-Duplicate-Queries"] = ",".join(
+            f"{key}:{n}" for key, n in stats.duplicates.items()
+        )
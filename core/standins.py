@@ -0,0 +1,204 @@
+"""
+Local stand-ins for the external services the bank talks to, so the project
+can be exercised offline.
+"""
+
+import json
+import random
+import socketserver
+import threading
+import time
+from collections import deque
+from email import message_from_bytes
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_RATES = {
+    "USD_in": "3.1160",
+    "USD_out": "3.1900",
+    "EUR_in": "3.3900",
+    "EUR_out": "3.4600",
+}
+
+
+class ExchangeRateStandIn:
+    """
+    Tiny HTTP server answering ``GET /api/kursExchange`` with a
+    Belarusbank-shaped payload.
+
+    Usage::
+
+        with ExchangeRateStandIn(rates={"USD_in": "3.20"}) as standin:
+            settings.EXCHANGE_RATE_URL = standin.url
+
+    ``latency`` (seconds) delays every answer and ``failure_rate`` is the share
+    of requests answered with 503, to load-test the fallback paths.
+    """
+
+    path = "/api/kursExchange"
+
+    def __init__(
+        self, rates=None, host="127.0.0.1", port=0, latency=0.0, failure_rate=0.0
+    ):
+        self.rates = dict(DEFAULT_RATES, **(rates or {}))
+        self.status = 200
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.requests = 0
+        self.failures = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{self.path}"
+
+    def _handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                standin.requests += 1
+                if self.path.split("?")[0] != standin.path:
+                    self.send_error(404)
+                    return
+                if standin.latency:
+                    time.sleep(standin.latency)
+                if standin.status != 200:
+                    self.send_error(standin.status)
+                    return
+                if standin.failure_rate and random.random() < standin.failure_rate:
+                    standin.failures += 1
+                    self.send_error(503)
+                    return
+                body = json.dumps([dict(standin.rates, filial_id="1")]).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="exchange-rate-standin", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class SMTPSinkStandIn:
+    """
+    SMTP server that accepts every message and keeps the last ``keep`` of
+    them in ``messages``.
+
+    It speaks plain SMTP without STARTTLS and AUTH, so Django has to use
+    ``EMAIL_USE_TLS = False`` and an empty ``EMAIL_HOST_USER``.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, keep=100):
+        self.messages = deque(maxlen=keep)
+        self.received = 0
+        self._lock = threading.Lock()
+        self._server = socketserver.ThreadingTCPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def host(self):
+        return self._server.server_address[0]
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def _handler(self):
+        standin = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write(f"{line}\r\n".encode())
+
+            def handle(self):
+                self.reply("220 standin ESMTP")
+                recipients = []
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    command = line.decode(errors="replace").strip()
+                    verb = command[:4].upper()
+                    if verb in ("HELO", "EHLO"):
+                        self.reply("250 standin")
+                    elif verb == "MAIL":
+                        recipients = []
+                        self.reply("250 OK")
+                    elif verb == "RCPT":
+                        recipients.append(command.split(":", 1)[-1].strip(" <>"))
+                        self.reply("250 OK")
+                    elif verb == "DATA":
+                        self.reply("354 End data with <CR><LF>.<CR><LF>")
+                        standin._store(self._read_data(), recipients)
+                        self.reply("250 OK")
+                    elif verb in ("RSET", "NOOP"):
+                        self.reply("250 OK")
+                    elif verb == "QUIT":
+                        self.reply("221 Bye")
+                        return
+                    else:
+                        self.reply("502 Command not implemented")
+
+            def _read_data(self):
+                lines = []
+                for line in self.rfile:
+                    if line.rstrip(b"\r\n") == b".":
+                        break
+                    # Точку в начале строки клиент удваивает (RFC 5321, 4.5.2)
+                    lines.append(line[1:] if line.startswith(b"..") else line)
+                return b"".join(lines)
+
+        return Handler
+
+    def _store(self, data, recipients):
+        message = message_from_bytes(data)
+        with self._lock:
+            self.received += 1
+            self.messages.append(
+                {"to": recipients, "subject": message["Subject"], "raw": data}
+            )
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="smtp-sink-standin", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
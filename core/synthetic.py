@@ -0,0 +1,261 @@
+"""
+Seeded synthetic dataset for load and performance testing.
+
+The same seed and sizes give the same users, cards, budgeting systems,
+credits and payment history on every run; card numbers come from the card
+number sequence, so they repeat only on a fresh database. Payments are
+written with COPY on PostgreSQL and ``bulk_create`` elsewhere, and the daily
+rollups are left to ``rebuild_payment_rollups``.
+
+Card balances get a single opening ledger entry dated at the end of the
+history, so ``reconcile_balances`` finds no discrepancies; the payment
+history itself is not replayed into the ledger.
+"""
+
+import io
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.utils import timezone
+
+from accounts import card_numbers
+from accounts.constants import BYN, CREDIT, DEBIT, OPENING, USD
+from accounts.models import BudgetSystem, Card, LedgerEntry, Payment, User
+from credits.models import Credit
+from credits.views import calculate_monthly_payment
+
+EMAIL_DOMAIN = "synthetic.test"
+# Относительная активность по часам суток: ночью почти не платят
+HOUR_WEIGHTS = [
+    *(1, 1, 1, 1, 1, 2),  # 00-05
+    *(4, 8, 12, 14, 14, 15),  # 06-11
+    *(16, 15, 14, 14, 15, 16),  # 12-17
+    *(17, 16, 13, 9, 5, 2),  # 18-23
+]
+DEPOSIT_SHARE = 0.15
+PAYMENT_COLUMNS = [
+    "card_id",
+    "amount",
+    "currency",
+    "card_type",
+    "timestamp",
+    "deposit_pending",
+]
+
+
+def email(prefix, number):
+    return f"{prefix}{number:07d}@{EMAIL_DOMAIN}"
+
+
+class Generator:
+    def __init__(
+        self,
+        seed=0,
+        prefix="load",
+        batch_size=50_000,
+        budget_share=0.2,
+        credit_share=0.1,
+        end=None,
+        password="synthetic",
+        progress=None,
+    ):
+        self.rng = random.Random(seed)
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.budget_share = budget_share
+        self.credit_share = credit_share
+        self.end = end or timezone.now()
+        self.password = make_password(password)
+        self.progress = progress or (lambda message: None)
+        # (id, currency, card_type) of every generated card, in creation order
+        self.cards = []
+        self.counts = dict.fromkeys(
+            ["users", "cards", "budget_systems", "credits", "payments"], 0
+        )
+
+    def users_and_cards(self, users, cards_per_user):
+        started = time.perf_counter()
+        per_batch = max(1, self.batch_size // max(cards_per_user, 1))
+        for first in range(0, users, per_batch):
+            count = min(per_batch, users - first)
+            with transaction.atomic():
+                self._user_batch(first, count, cards_per_user)
+            self.progress(
+                f"{self.counts['users']} users, {self.counts['cards']} cards "
+                f"({time.perf_counter() - started:.1f}s)"
+            )
+
+    def _user_batch(self, first, count, cards_per_user):
+        rng = self.rng
+        batch = User.objects.bulk_create(
+            [
+                User(
+                    email=email(self.prefix, number),
+                    first_name=f"User{number}",
+                    last_name="Synthetic",
+                    password=self.password,
+                )
+                for number in range(first, first + count)
+            ]
+        )
+        numbers = iter(card_numbers.allocator.allocate(count * cards_per_user))
+        cards = []
+        for user in batch:
+            for index in range(cards_per_user):
+                balance = Decimal(rng.randint(0, 500_000)) / 100
+                cards.append(
+                    Card(
+                        user=user,
+                        card_name=f"Card {index + 1}",
+                        account_no=next(numbers),
+                        cvv_code=f"{rng.randrange(1000):03d}",
+                        card_type=DEBIT if rng.random() < 0.7 else CREDIT,
+                        currency=BYN if rng.random() < 0.8 else USD,
+                        balance=balance,
+                    )
+                )
+        Card.objects.bulk_create(cards)
+        LedgerEntry.objects.bulk_create(
+            LedgerEntry(
+                card=card,
+                kind=OPENING,
+                amount=card.balance,
+                balance_after=card.balance,
+                created_at=self.end,
+            )
+            for card in cards
+            if card.balance
+        )
+        self.cards += [(card.id, card.currency, card.card_type) for card in cards]
+
+        systems, credits = [], []
+        for position, user in enumerate(batch):
+            own = cards[position * cards_per_user : (position + 1) * cards_per_user]
+            card = own[0]
+            # Копилка — другая карта того же пользователя, без неё системы нет
+            if len(own) > 1 and card.card_type == DEBIT:
+                if rng.random() < self.budget_share:
+                    systems.append(self._budget_system(user, card, own[1]))
+            if rng.random() < self.credit_share:
+                credits.append(self._credit(user, rng.choice(own)))
+        if systems:
+            Card.objects.filter(id__in=[system.card_id for system in systems]).update(
+                using_system=True
+            )
+        BudgetSystem.objects.bulk_create(systems)
+        Credit.objects.bulk_create(credits)
+
+        self.counts["users"] += len(batch)
+        self.counts["cards"] += len(cards)
+        self.counts["budget_systems"] += len(systems)
+        self.counts["credits"] += len(credits)
+
+    def _budget_system(self, user, card, savings_card):
+        daily_control = self.rng.random() < 0.5
+        return BudgetSystem(
+            user=user,
+            name="Budget",
+            description="Synthetic budget",
+            card=card,
+            savings_card=savings_card,
+            daily_control=daily_control,
+            daily_percent=self.rng.randint(1, 10) if daily_control else None,
+            savings_percent=self.rng.choice([10, 20, 30, 50]),
+        )
+
+    def _credit(self, user, card):
+        amount = Decimal(self.rng.randint(10, 500) * 100)
+        months_paid = self.rng.randint(0, 11)
+        monthly_payment = calculate_monthly_payment(amount)
+        return Credit(
+            user=user,
+            card=card,
+            amount=amount,
+            interest_rate=Decimal("5.00"),
+            term_months=12 - months_paid,
+            monthly_payment=monthly_payment,
+            remaining_amount=max(amount - monthly_payment * months_paid, Decimal(0)),
+            status="APPROVED",
+        )
+
+    def payments(self, count, days):
+        """
+        Insert ``count`` payments spread over the last ``days`` days.
+
+        A few cards make most of the payments (Pareto weights), recent days
+        are busier than old ones and payments follow the hour-of-day profile.
+        """
+        if not self.cards or not count:
+            return
+        rng = self.rng
+        card_weights = list(accumulate(rng.paretovariate(1.2) for _ in self.cards))
+        hours = list(range(24))
+        hour_weights = list(accumulate(HOUR_WEIGHTS))
+        midnight = timezone.localtime(self.end).replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+
+        started = time.perf_counter()
+        while self.counts["payments"] < count:
+            size = min(self.batch_size, count - self.counts["payments"])
+            picked = rng.choices(self.cards, cum_weights=card_weights, k=size)
+            picked_hours = rng.choices(hours, cum_weights=hour_weights, k=size)
+            rows = []
+            for (card_id, currency, card_type), hour in zip(picked, picked_hours):
+                day = midnight - timedelta(days=int(rng.triangular(0, days, 0)))
+                timestamp = min(
+                    day + timedelta(hours=hour, seconds=rng.randrange(3600)),
+                    self.end,
+                )
+                amount = min(max(rng.lognormvariate(3, 1.2), 0.5), 5000)
+                rows.append(
+                    (
+                        card_id,
+                        f"{amount:.2f}",
+                        currency,
+                        card_type,
+                        timestamp,
+                        rng.random() < DEPOSIT_SHARE,
+                    )
+                )
+            with transaction.atomic():
+                insert_payments(rows)
+            self.counts["payments"] += size
+
+            elapsed = time.perf_counter() - started
+            self.progress(
+                f"{self.counts['payments']}/{count} payments "
+                f"({self.counts['payments'] / elapsed:.0f} rows/s)"
+            )
+
+
+def insert_payments(rows):
+    """Insert ``PAYMENT_COLUMNS`` tuples without touching the daily rollups."""
+    if connection.vendor != "postgresql":
+        Payment.objects.bulk_create(
+            [Payment(**dict(zip(PAYMENT_COLUMNS, row))) for row in rows],
+            update_rollups=False,
+        )
+        return
+
+    data = io.StringIO()
+    for card_id, amount, currency, card_type, timestamp, deposit_pending in rows:
+        data.write(
+            f"{card_id}\t{amount}\t{currency}\t{card_type}\t"
+            f"{timestamp.isoformat()}\t{'t' if deposit_pending else 'f'}\n"
+        )
+    data.seek(0)
+    sql = f"COPY {Payment._meta.db_table} ({', '.join(PAYMENT_COLUMNS)}) FROM STDIN"
+    with connection.cursor() as cursor:
+        raw = cursor.cursor
+        if hasattr(raw, "copy"):
+            # psycopg 3
+            with raw.copy(sql) as copy:
+                copy.write(data.getvalue())
+        else:
+            raw.copy_expert(sql, data)
@@ -1,3 +1,270 @@
-from django.test import TestCase
+import io
+import time
+from unittest import mock
 
-# Create your tests here.
+from celery import shared_task
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.mail.backends.smtp import EmailBackend
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django_redis.cache import RedisCache
+import requests
+from prometheus_client import REGISTRY
+
+from accounts.models import Card, Payment, PaymentDailyRollup
+from banking_system.celery import app
+from core import locks, metrics
+from core.middleware import QueryStats, fingerprint
+from core.standins import ExchangeRateStandIn, SMTPSinkStandIn
+from core.synthetic import Generator
+
+User = get_user_model()
+
+
+class QueryStatsTest(TestCase):
+    def test_fingerprint_ignores_in_list_length_and_numbers(self):
+        self.assertEqual(
+            fingerprint('SELECT * FROM "t" WHERE "id" IN (%s, %s) LIMIT 21'),
+            fingerprint('SELECT * FROM "t" WHERE "id" IN (%s) LIMIT 1'),
+        )
+
+    def test_record(self):
+        stats = QueryStats()
+        stats.record("SELECT 1", 0.002)
+        stats.record("SELECT 2", 0.001)
+        stats.record("SELECT %s", 0.005)
+        stats.record("SELECT 3", 0.001)
+
+        self.assertEqual(stats.count, 4)
+        self.assertAlmostEqual(stats.duration, 0.009)
+        self.assertEqual(stats.slowest_sql, "SELECT %s")
+        self.assertEqual(list(stats.duplicates.values()), [3])
+
+
+class QueryStatsMiddlewareTest(TestCase):
+    def setUp(self):
+        User.objects.create_user(email="testuser@example.com", password="testpass")
+        self.client.login(email="testuser@example.com", password="testpass")
+
+    @override_settings(DEBUG=True)
+    def test_headers_in_debug(self):
+        response = self.client.get(reverse("accounts:card_list"))
+        self.assertGreater(int(response["X-DB-Query-Count"]), 0)
+        self.assertIn("X-DB-Query-Time-Ms", response)
+        self.assertIn("X-DB-Slowest-Query-Ms", response)
+
+    def test_log_line_in_production(self):
+        with self.assertLogs("core.middleware", "INFO") as logs:
+            response = self.client.get(reverse("accounts:card_list"))
+        self.assertNotIn("X-DB-Query-Count", response)
+        self.assertIn("view=accounts:card_list", logs.output[0])
+        self.assertGreater(logs.records[0].sql["queries"], 0)
+
+    @override_settings(QUERY_BUDGETS={"accounts:card_list": 1})
+    def test_budget_exceeded(self):
+        with self.assertLogs("core.middleware", "WARNING") as logs:
+            self.client.get(reverse("accounts:card_list"))
+        self.assertIn("Query budget exceeded: accounts:card_list", logs.output[0])
+
+
+@shared_task(name="core.tests.processing_task")
+def processing_task(processed):
+    return {"processed": processed}
+
+
+class MetricsTest(TestCase):
+    def test_metrics_endpoint(self):
+        staff = get_user_model().objects.create_user(
+            email="staff@example.com", password="testpass", is_staff=True
+        )
+        self.client.force_login(staff)
+        self.client.get(reverse("home"))
+        response = self.client.get(reverse("metrics"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            b'http_request_duration_seconds_count{method="GET",view="home"}',
+            response.content,
+        )
+        self.assertIn(b"http_request_db_queries_bucket", response.content)
+
+    def test_metrics_are_hidden_without_token(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 404)
+        user = get_user_model().objects.create_user(
+            email="user@example.com", password="testpass"
+        )
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 404)
+
+        with self.settings(DEBUG=True):
+            self.client.logout()
+            self.assertEqual(self.client.get(reverse("metrics")).status_code, 200)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 404)
+        response = self.client.get(
+            reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret"
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_task_metrics(self):
+        labels = {"task": "processing"}
+        before = REGISTRY.get_sample_value("celery_task_items_processed_total", labels)
+
+        app.conf.task_always_eager = True
+        try:
+            with mock.patch.dict(
+                metrics.ITEM_TASKS, {"core.tests.processing_task": "processing"}
+            ):
+                processing_task.delay(7)
+        finally:
+            app.conf.task_always_eager = False
+
+        after = REGISTRY.get_sample_value("celery_task_items_processed_total", labels)
+        self.assertEqual(after - (before or 0), 7)
+        self.assertIsNotNone(
+            REGISTRY.get_sample_value(
+                "celery_task_duration_seconds_count",
+                {"task": "core.tests.processing_task", "state": "SUCCESS"},
+            )
+        )
+
+
+class SyntheticDatasetTest(TestCase):
+    def generate(self, prefix, end):
+        generator = Generator(seed=42, prefix=prefix, batch_size=50, end=end)
+        generator.users_and_cards(20, 2)
+        generator.payments(300, 30)
+        return generator
+
+    def history(self, prefix):
+        return list(
+            Payment.objects.filter(card__user__email__startswith=prefix)
+            .order_by("id")
+            .values_list("amount", "timestamp", "deposit_pending", "currency")
+        )
+
+    def test_same_seed_same_data(self):
+        end = timezone.now()
+        first = self.generate("a", end)
+        second = self.generate("b", end)
+
+        self.assertEqual(first.counts, second.counts)
+        self.assertEqual(first.counts["payments"], 300)
+        self.assertEqual(Card.objects.count(), 80)
+        self.assertEqual(self.history("a"), self.history("b"))
+        self.assertTrue(
+            all(timestamp <= end for _, timestamp, _, _ in self.history("a"))
+        )
+
+    def test_command(self):
+        call_command(
+            "generate_dataset",
+            users=5,
+            payments=50,
+            days=10,
+            stdout=io.StringIO(),
+            stderr=io.StringIO(),
+        )
+        self.assertEqual(Payment.objects.count(), 50)
+        self.assertTrue(PaymentDailyRollup.objects.exists())
+
+
+class StandInTest(TestCase):
+    def test_smtp_sink_receives_mail(self):
+        with SMTPSinkStandIn() as sink:
+            connection = EmailBackend(
+                host=sink.host, port=sink.port, use_tls=False, username=""
+            )
+            messages = [
+                mail.EmailMessage(f"Hello {i}", "..\nbody", to=[f"user{i}@example.com"])
+                for i in range(3)
+            ]
+            self.assertEqual(connection.send_messages(messages), 3)
+
+        self.assertEqual(sink.received, 3)
+        self.assertEqual(sink.messages[0]["to"], ["user0@example.com"])
+        self.assertEqual(sink.messages[2]["subject"], "Hello 2")
+        self.assertIn(b"\r\n..\r\nbody", sink.messages[0]["raw"])
+
+    def test_exchange_rate_failures(self):
+        with ExchangeRateStandIn(failure_rate=1) as standin:
+            response = requests.get(standin.url, timeout=5)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(standin.failures, 1)
+
+
+@shared_task
+@locks.single_instance()
+def guarded_task(value):
+    return {"processed": value}
+
+
+@override_settings(TASK_LOCK_LEASE=0.3)
+class SingleInstanceTest(TestCase):
+    lock_key = "task-lock:core.tests.guarded_task"
+
+    def setUp(self):
+        locks._cache().clear()
+
+    def test_runs_and_records(self):
+        self.assertEqual(guarded_task(3), {"processed": 3})
+        self.assertIsNone(locks._cache().get(self.lock_key))
+        run = locks.last_run("core.tests.guarded_task")
+        self.assertGreaterEqual(run["duration"], 0)
+        self.assertIsNone(run["lag"])
+
+    def test_overlapping_run_is_skipped(self):
+        locks._cache().add(self.lock_key, "other worker", 60)
+        self.assertEqual(guarded_task(3), {"skipped": True, "queued": False})
+        # Чужой замок не снимаем
+        self.assertEqual(locks._cache().get(self.lock_key), "other worker")
+
+    def test_heartbeat_keeps_lease_and_crash_frees_it(self):
+        lease = locks.Lease(self.lock_key, 0.3)
+        self.assertTrue(lease.acquire())
+        time.sleep(0.5)
+        self.assertEqual(locks._cache().get(self.lock_key), lease.token)
+        self.assertFalse(locks.Lease(self.lock_key, 0.3).acquire())
+
+        # Упавший воркер перестаёт продлевать аренду
+        lease._stop.set()
+        lease._heartbeat.join()
+        time.sleep(0.4)
+        successor = locks.Lease(self.lock_key, 0.3)
+        self.assertTrue(successor.acquire())
+        lease.release()
+        self.assertEqual(locks._cache().get(self.lock_key), successor.token)
+        successor.release()
+        self.assertIsNone(locks._cache().get(self.lock_key))
+
+    def test_redis_lease_is_renewed_and_released_by_its_owner_only(self):
+        cache = RedisCache("redis://127.0.0.1:6379/0", {})
+        client = mock.Mock()
+        client.eval.side_effect = [1, 0]
+        with mock.patch.object(locks, "_cache", return_value=cache), mock.patch.object(
+            locks, "get_redis_connection", return_value=client
+        ):
+            self.assertTrue(locks._renew_if_owner(self.lock_key, "token", 0.3))
+            self.assertFalse(locks._delete_if_owner(self.lock_key, "token"))
+
+        # Проверка токена и PEXPIRE/DEL — один вызов скрипта, без отдельного GET
+        key, token = cache.make_key(self.lock_key), cache.client.encode("token")
+        self.assertEqual(
+            [call.args for call in client.eval.call_args_list],
+            [(locks._RENEW, 1, key, token, 300), (locks._RELEASE, 1, key, token)],
+        )
+        client.get.assert_not_called()
+        client.delete.assert_not_called()
+
+    def test_beat_tasks_are_single_instance(self):
+        for entry in app.conf.beat_schedule.values():
+            task = app.tasks.get(entry["task"])
+            if task is None:
+                # calculate_interest нигде не объявлена
+                continue
+            self.assertTrue(getattr(task.run, "single_instance", False), entry["task"])
@@ -1,5 +1,25 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
 from django.views.generic import TemplateView
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from core import metrics
 
 
 class HomeView(TemplateView):
     template_name = "core/index.html"
+
+
+def metrics_view(request):
+    token = settings.METRICS_TOKEN
+    if token:
+        allowed = constant_time_compare(
+            request.headers.get("Authorization", ""), f"Bearer {token}"
+        )
+    else:
+        # Без токена метрики видны только в DEBUG и сотрудникам
+        allowed = settings.DEBUG or request.user.is_staff
+    if not allowed:
+        raise Http404
+    return HttpResponse(metrics.render(), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from credits.tasks import process_monthly_payment
+
+
+class Command(BaseCommand):
+    help = "Charge the monthly credit instalments from the linked credit cards."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="only report what would be charged",
+        )
+
+    def handle(self, *args, **options):
+        totals = process_monthly_payment(dry_run=options["dry_run"])
+        prefix = "Would charge" if totals["dry_run"] else "Charged"
+        self.stdout.write(
+            f"{prefix} {totals['processed']} credits for {totals['charged']} BYN, "
+            f"{totals['paid_off']} paid off, {totals['skipped']} without a card "
+            f"({totals['elapsed']:.2f}s)"
+        )
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def link_credit_cards(apps, schema_editor):
+    # Раньше кредит и карта связывались только по имени карты "<purpose> Credit".
+    # Обе записи создаются вместе при одобрении, поэтому сопоставляем их по порядку.
+    Credit = apps.get_model("credits", "Credit")
+    Card = apps.get_model("accounts", "Card")
+
+    user_ids = Credit.objects.filter(card__isnull=True).values_list(
+        "user_id", flat=True
+    )
+    for user_id in set(user_ids):
+        credits = Credit.objects.filter(user_id=user_id, card__isnull=True).order_by(
+            "id"
+        )
+        cards = Card.objects.filter(
+            user_id=user_id, card_type="C", card_name__endswith=" Credit"
+        ).order_by("id")
+        for credit, card in zip(credits, cards):
+            credit.card = card
+            credit.save(update_fields=["card"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("accounts", "0007_idempotencykey"),
+        ("credits", "0003_remove_credit_term_months_from_enum_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="credit",
+            name="card",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="credits",
+                to="accounts.card",
+            ),
+        ),
+        migrations.RunPython(link_credit_cards, migrations.RunPython.noop),
+    ]
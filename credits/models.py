@@ -1,6 +1,6 @@
 from django.db import models
 
-from accounts.models import User
+from accounts.models import Card, User
 from credits.constants import CREDIT_STATUS, STATUS
 
 
@@ -28,5 +28,12 @@ class Credit(models.Model):
     monthly_payment = models.DecimalField(max_digits=10, decimal_places=2)
     remaining_amount = models.DecimalField(max_digits=10, decimal_places=2)
     status = models.CharField(max_length=20, choices=STATUS)
+    card = models.ForeignKey(
+        Card,
+        related_name="credits",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
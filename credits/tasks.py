@@ -1,37 +1,99 @@
+import logging
+import time
+from collections import defaultdict
 from datetime import datetime
+from decimal import Decimal
 
 from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 
-from accounts.models import Card
+from accounts.constants import CREDIT_PAYMENT
+from accounts.utils import adjust_balances
 from .models import Credit
 
+logger = logging.getLogger(__name__)
+
 
 @shared_task
-def process_monthly_payment():
-    # Получить все активные кредиты, для которых не был проведен ежемесячный платеж
-    credits = Credit.objects.filter(
-        status="APPROVED", updated_at__month=datetime.now().month
-    )
+def process_monthly_payment(dry_run=False):
+    started = time.perf_counter()
+    totals = {"processed": 0, "paid_off": 0, "skipped": 0, "chunks": 0}
+    charged = Decimal(0)
+    last_id = 0
 
-    for credit in credits:
-        # Получить карту, привязанную к кредиту
-        card = Card.objects.get(user=credit.user, card_name=f"{credit.purpose} Credit")
+    while True:
+        with transaction.atomic():
+            credits = list(
+                _due_credits(last_id, lock=not dry_run)[
+                    : settings.CREDIT_TASK_CHUNK_SIZE
+                ]
+            )
+            if not credits:
+                break
+            last_id = credits[-1].id
 
-        # Вычесть ежемесячный платеж из баланса карты
-        card.balance -= credit.monthly_payment
-        card.save()
+            now = timezone.now()
+            card_debits = defaultdict(Decimal)
+            charged_credits = []
+            for credit in credits:
+                if credit.card_id is None:
+                    logger.warning("Credit %s has no card, skipping", credit.id)
+                    totals["skipped"] += 1
+                    continue
 
-        # Обновить оставшуюся сумму по кредиту
-        credit.remaining_amount -= credit.monthly_payment
+                # Вычесть ежемесячный платеж из баланса карты
+                card_debits[credit.card_id] -= credit.monthly_payment
+                charged += credit.monthly_payment
 
-        # Уменьшить количество оставшихся месяцев
-        credit.term_months -= 1
-        credit.save()
+                credit.remaining_amount -= credit.monthly_payment
+                credit.term_months = max(credit.term_months - 1, 0)
+                credit.updated_at = now
+                # Если кредит выплачен, обновить статус
+                if credit.remaining_amount <= 0:
+                    credit.status = "PAID"
+                    credit.term_months = 0
+                    totals["paid_off"] += 1
+                charged_credits.append(credit)
 
-        # Если кредит выплачен, обновить статус
-        if credit.remaining_amount <= 0:
-            credit.status = "PAID"
-            credit.term_months = (
-                0  # Убедитесь, что месяцы равны нулю, если кредит выплачен
-            )
-            credit.save()
+            if not dry_run:
+                adjust_balances(card_debits, CREDIT_PAYMENT)
+                Credit.objects.bulk_update(
+                    charged_credits,
+                    ["remaining_amount", "term_months", "status", "updated_at"],
+                )
+
+        totals["processed"] += len(charged_credits)
+        totals["chunks"] += 1
+
+    totals["charged"] = str(charged)
+    totals["dry_run"] = dry_run
+    totals["elapsed"] = time.perf_counter() - started
+    logger.info(
+        "process_monthly_payment%s: %d credits charged %s in %d chunks, "
+        "%d paid off, %d skipped, %.2fs",
+        " (dry run)" if dry_run else "",
+        totals["processed"],
+        totals["charged"],
+        totals["chunks"],
+        totals["paid_off"],
+        totals["skipped"],
+        totals["elapsed"],
+    )
+    return totals
+
+
+def _due_credits(after_id, lock):
+    # Получить все активные кредиты, для которых не был проведен ежемесячный платеж
+    credits = Credit.objects.filter(
+        status="APPROVED",
+        updated_at__month=datetime.now().month,
+        id__gt=after_id,
+    ).order_by("id")
+    if lock:
+        # Только строки кредитов: card — nullable FK, а PostgreSQL не даёт
+        # блокировать nullable-сторону LEFT JOIN. Карты блокирует UPDATE
+        # в adjust_balances
+        credits = credits.select_for_update(of=("self",))
+    return credits
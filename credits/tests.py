@@ -1,8 +1,13 @@
+from unittest import mock
+
+from django.db import connection
+from django.db.backends.postgresql.base import DatabaseWrapper
 from django.test import TestCase
 from django.urls import reverse
-from accounts.models import User
+from accounts.models import Card, User
 from decimal import Decimal
 from credits.models import CreditApplication, Credit
+from credits.tasks import _due_credits, process_monthly_payment
 from credits.views import calculate_monthly_payment
 
 
@@ -76,3 +81,102 @@ class CreditsTestCase(TestCase):
         )
         response = self.client.get(reverse("credits:active_credits"))
         self.assertEqual(response.status_code, 302)
+
+
+class ProcessMonthlyPaymentTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="credituser@gmail.com", password="testpass"
+        )
+
+    def create_credit(self, remaining_amount, with_card=True):
+        card = None
+        if with_card:
+            card = Card.objects.create(
+                user=self.user,
+                card_name="Home Credit",
+                card_type="C",
+                balance=1000,
+                currency="B",
+            )
+        return Credit.objects.create(
+            user=self.user,
+            card=card,
+            amount=1000,
+            interest_rate=5.0,
+            term_months=12,
+            monthly_payment=Decimal("85.61"),
+            remaining_amount=remaining_amount,
+            status="APPROVED",
+        )
+
+    def test_charges_linked_card(self):
+        credit = self.create_credit(1000)
+
+        result = process_monthly_payment()
+
+        credit.refresh_from_db()
+        credit.card.refresh_from_db()
+        self.assertEqual(result["processed"], 1)
+        self.assertEqual(result["charged"], "85.61")
+        self.assertEqual(credit.card.balance, Decimal("914.39"))
+        self.assertEqual(credit.remaining_amount, Decimal("914.39"))
+        self.assertEqual(credit.term_months, 11)
+        self.assertEqual(credit.status, "APPROVED")
+
+    def test_last_payment_closes_credit(self):
+        credit = self.create_credit(Decimal("50.00"))
+
+        result = process_monthly_payment()
+
+        credit.refresh_from_db()
+        self.assertEqual(result["paid_off"], 1)
+        self.assertEqual(credit.status, "PAID")
+        self.assertEqual(credit.term_months, 0)
+
+    def test_credit_without_card_is_skipped(self):
+        credit = self.create_credit(1000, with_card=False)
+
+        result = process_monthly_payment()
+
+        credit.refresh_from_db()
+        self.assertEqual(result["skipped"], 1)
+        self.assertEqual(credit.remaining_amount, Decimal("1000"))
+
+    def test_dry_run_changes_nothing(self):
+        credit = self.create_credit(1000)
+
+        result = process_monthly_payment(dry_run=True)
+
+        credit.refresh_from_db()
+        credit.card.refresh_from_db()
+        self.assertEqual(result["processed"], 1)
+        self.assertEqual(credit.card.balance, Decimal("1000"))
+        self.assertEqual(credit.remaining_amount, Decimal("1000"))
+
+    def test_processes_in_chunks(self):
+        for _ in range(3):
+            self.create_credit(1000)
+
+        with self.settings(CREDIT_TASK_CHUNK_SIZE=2):
+            result = process_monthly_payment()
+
+        self.assertEqual(result["processed"], 3)
+        self.assertEqual(result["chunks"], 2)
+        self.assertEqual(Card.objects.filter(balance=Decimal("914.39")).count(), 3)
+
+    def test_lock_compiles_for_postgresql(self):
+        # SQLite игнорирует FOR UPDATE, поэтому смотрим SQL для PostgreSQL
+        postgresql = DatabaseWrapper(
+            {**connection.settings_dict, "ENGINE": "django.db.backends.postgresql"},
+            alias="postgresql",
+        )
+        with mock.patch.object(postgresql, "get_autocommit", return_value=False):
+            sql, _ = (
+                _due_credits(0, lock=True)
+                .query.get_compiler(connection=postgresql)
+                .as_sql()
+            )
+
+        self.assertIn('FOR UPDATE OF "credits_credit"', sql)
+        self.assertNotIn("JOIN", sql)
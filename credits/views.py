@@ -56,18 +56,6 @@ def approve_credit(request, credit_app_id):
             approved = form.cleaned_data["approved"]
 
             if approved:
-                # Process the approved credits application
-                Credit.objects.create(
-                    user=credit_application.user,
-                    amount=credit_application.amount,
-                    interest_rate=5.0,
-                    term_months=12,
-                    monthly_payment=calculate_monthly_payment(
-                        credit_application.amount
-                    ),
-                    remaining_amount=credit_application.amount,
-                    status="APPROVED",
-                )
                 if Card.objects.filter(
                     user=credit_application.user,
                     card_name=f"Credit: {credit_application.purpose}",
@@ -75,7 +63,7 @@ def approve_credit(request, credit_app_id):
                     raise ValidationError("Card already exists for this Credit")
 
                 # Create associated card
-                Card.objects.create(
+                card = Card.objects.create(
                     card_name=f"{credit_application.purpose} Credit",
                     user=credit_application.user,
                     card_type="C",
@@ -83,6 +71,20 @@ def approve_credit(request, credit_app_id):
                     currency="B",
                 )
 
+                # Process the approved credits application
+                Credit.objects.create(
+                    user=credit_application.user,
+                    card=card,
+                    amount=credit_application.amount,
+                    interest_rate=5.0,
+                    term_months=12,
+                    monthly_payment=calculate_monthly_payment(
+                        credit_application.amount
+                    ),
+                    remaining_amount=credit_application.amount,
+                    status="APPROVED",
+                )
+
                 messages.success(
                     request, "Credit and card created. Review and confirm to proceed."
                 )
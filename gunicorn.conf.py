@@ -0,0 +1,21 @@
+import os
+import shutil
+
+from prometheus_client import multiprocess
+
+wsgi_app = "banking_system.wsgi"
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", 4))
+
+
+def on_starting(server):
+    # Файлы метрик прошлого запуска иначе попадут в /metrics
+    path = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(worker.pid)
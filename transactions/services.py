@@ -0,0 +1,196 @@
+import logging
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+from django.db.models import F
+
+from accounts.constants import TRANSFER_IN, TRANSFER_OUT
+from accounts.exchange_rates import get_usd_rate
+from accounts.models import Card, Payment, BudgetSystem, LedgerEntry
+from transactions.models import Transaction
+
+logger = logging.getLogger(__name__)
+
+CENT = Decimal("0.01")
+# Переводы между картами всегда шли по курсу продажи (раньше зашитые 3.19),
+# в обе стороны; платежи по-прежнему считаются по USD_in
+TRANSFER_RATE_CODE = "USD_out"
+
+
+class TransferError(Exception):
+    pass
+
+
+@dataclass
+class TransferResult:
+    sender: Card
+    receiver: Card
+    amount: Decimal
+    converted_amount: Decimal
+    transaction_id: int = None
+    timings: dict = field(default_factory=dict)
+
+
+class _PhaseTimer:
+    def __init__(self):
+        self.timings = {}
+        self._started = self._last = time.perf_counter()
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.timings[phase] = now - self._last
+        self._last = now
+
+    def finish(self):
+        self.timings["total"] = time.perf_counter() - self._started
+        return self.timings
+
+
+def convert_amount(amount, from_currency, to_currency, usd_rate):
+    if from_currency == to_currency:
+        return amount
+    if from_currency == "U":
+        converted = amount * usd_rate
+    else:
+        converted = amount / usd_rate
+    return converted.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def transfer(
+    sender_id,
+    amount,
+    receiver_id=None,
+    receiver_account_no=None,
+    usd_rate=None,
+):
+    """
+    Move ``amount`` from the sender card to the receiver card.
+
+    Both cards are locked in ascending id order, so opposite transfers between
+    the same pair of cards cannot deadlock. Balances are changed with
+    F-expressions. The transfer header, both ledger legs and both history rows
+    are written in the same transaction.
+    Raises ``TransferError`` with a user-facing message when the transfer is
+    not allowed.
+    """
+    timer = _PhaseTimer()
+    amount = Decimal(str(amount))
+    if amount <= 0:
+        raise TransferError("Amount must be greater than zero.")
+
+    if receiver_id is None:
+        receiver_id = (
+            Card.objects.filter(account_no=receiver_account_no)
+            .values_list("id", flat=True)
+            .first()
+        )
+        if receiver_id is None:
+            raise TransferError("Receiver card not found.")
+    if sender_id == receiver_id:
+        raise TransferError("Cannot transfer funds from and to the same card.")
+
+    # Курс берём до блокировки, чтобы не держать строки во время запроса к API
+    if usd_rate is None:
+        usd_rate = get_usd_rate(TRANSFER_RATE_CODE)
+    timer.mark("resolve")
+
+    with transaction.atomic():
+        cards = {
+            card.id: card
+            for card in Card.objects.select_for_update()
+            .filter(id__in=[sender_id, receiver_id])
+            .order_by("id")
+        }
+        if len(cards) != 2:
+            raise TransferError("Card not found.")
+        sender, receiver = cards[sender_id], cards[receiver_id]
+        timer.mark("lock")
+
+        if sender.card_type != "C" and amount > sender.balance:
+            raise TransferError("Insufficient funds to transfer.")
+
+        daily_control = False
+        if sender.using_system:
+            system = BudgetSystem.objects.filter(card=sender).first()
+            daily_control = system is not None and system.daily_control
+            if daily_control and amount > sender.daily_balance:
+                raise TransferError(
+                    "Insufficient funds out of your budget to transfer."
+                )
+        converted_amount = convert_amount(
+            amount, sender.currency, receiver.currency, usd_rate
+        )
+        timer.mark("checks")
+
+        sender_updates = {"balance": F("balance") - amount}
+        if daily_control:
+            sender_updates["daily_balance"] = F("daily_balance") - amount
+        Card.objects.filter(pk=sender.pk).update(**sender_updates)
+        Card.objects.filter(pk=receiver.pk).update(
+            balance=F("balance") + converted_amount
+        )
+
+        # Строки заблокированы, поэтому новые балансы можно посчитать в Python
+        sender.balance -= amount
+        if daily_control:
+            sender.daily_balance -= amount
+        receiver.balance += converted_amount
+        timer.mark("update")
+
+        header = Transaction.objects.create(
+            sender_card=sender, receiver_card=receiver, amount=amount
+        )
+        LedgerEntry.objects.bulk_create(
+            [
+                LedgerEntry(
+                    card=sender,
+                    transfer=header,
+                    kind=TRANSFER_OUT,
+                    amount=-amount,
+                    balance_after=sender.balance,
+                    created_at=header.timestamp,
+                ),
+                LedgerEntry(
+                    card=receiver,
+                    transfer=header,
+                    kind=TRANSFER_IN,
+                    amount=converted_amount,
+                    balance_after=receiver.balance,
+                    created_at=header.timestamp,
+                ),
+            ]
+        )
+        Payment.objects.bulk_create(
+            [
+                Payment(
+                    card=sender,
+                    amount=-amount,
+                    currency=sender.currency,
+                    card_type=sender.card_type,
+                ),
+                Payment(
+                    card=receiver,
+                    amount=converted_amount,
+                    currency=receiver.currency,
+                    card_type=receiver.card_type,
+                    deposit_pending=True,
+                ),
+            ]
+        )
+        timer.mark("ledger")
+    timer.mark("commit")
+
+    timings = timer.finish()
+    logger.info(
+        "Transfer %s -> %s: %s",
+        sender.pk,
+        receiver.pk,
+        " ".join(
+            f"{phase}={seconds * 1000:.1f}ms" for phase, seconds in timings.items()
+        ),
+    )
+    return TransferResult(
+        sender, receiver, amount, converted_amount, header.id, timings
+    )
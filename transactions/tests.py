@@ -1,22 +1,41 @@
 from decimal import Decimal
+from unittest.mock import patch
 
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.contrib.messages import get_messages
-from accounts.models import Card, Payment
-from accounts.views import get_usd_exchange_rate
+from accounts.models import BudgetSystem, Card, LedgerEntry, Payment
+from accounts.exchange_rates import get_usd_rate
 from transactions.forms import FundTransferForm
+from transactions.models import Transaction
+from transactions.services import TRANSFER_RATE_CODE, TransferError, transfer
 from django.test import Client
+from core.standins import ExchangeRateStandIn
 
 User = get_user_model()
 
 
-class FundTransferByCardViewTest(TestCase):
+class ExchangeRateStandInMixin:
+    # Курсы отдаёт локальный сервер, чтобы тесты не ходили в API Беларусбанка
+    @classmethod
+    def setUpClass(cls):
+        cls.rate_standin = cls.enterClassContext(ExchangeRateStandIn())
+        cls.enterClassContext(override_settings(EXCHANGE_RATE_URL=cls.rate_standin.url))
+        super().setUpClass()
+
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+
+
+class FundTransferByCardViewTest(ExchangeRateStandInMixin, TestCase):
     def create_user(self, email="test@example.com", password="testpassword"):
         return User.objects.create_user(email=email, password=password)
 
     def setUp(self):
+        super().setUp()
         # Создаем тестового пользователя и две карты
         self.user = self.create_user()
         self.card_one = Card.objects.create(
@@ -57,15 +76,14 @@ class FundTransferByCardViewTest(TestCase):
         # Проверяем, что балансы обновлены правильно
         sender_card = Card.objects.get(id=self.card_one.id)
         receiver_card = Card.objects.get(id=self.card_two.id)
-        usd_in_rate = get_usd_exchange_rate()
+        usd_rate = get_usd_rate(TRANSFER_RATE_CODE)
         self.assertEqual(sender_card.balance, 50)
-        self.assertAlmostEqual(
-            Decimal(receiver_card.balance), 50 * Decimal(usd_in_rate), places=2
-        )
+        self.assertAlmostEqual(Decimal(receiver_card.balance), 50 * usd_rate, places=2)
 
 
-class FundTransferViewTest(TestCase):
+class FundTransferViewTest(ExchangeRateStandInMixin, TestCase):
     def setUp(self):
+        super().setUp()
         self.user = User.objects.create_user(
             email="test@example.com", password="testpass"
         )
@@ -100,24 +118,50 @@ class FundTransferViewTest(TestCase):
         self.sender_card.refresh_from_db()
         self.receiver_card.refresh_from_db()
         self.assertAlmostEqual(float(self.sender_card.balance), float(70), places=2)
-        usd_in_rate = get_usd_exchange_rate()
+        usd_rate = get_usd_rate(TRANSFER_RATE_CODE)
         self.assertAlmostEqual(
             float(self.receiver_card.balance),
-            float(50 + Decimal("30") * Decimal(usd_in_rate)),
+            float(50 + Decimal("30") * usd_rate),
             places=2,
         )
 
         self.assertEqual(
-            Payment.objects.filter(card=self.sender_card, amount=70).count(), 1
+            Payment.objects.filter(card=self.sender_card, amount=-30).count(), 1
         )
         self.assertEqual(
             Payment.objects.filter(
                 card=self.receiver_card,
-                amount=50 + Decimal("30") * Decimal(usd_in_rate),
+                amount=Decimal("30") * usd_rate,
             ).count(),
             1,
         )
 
+    def test_fund_transfer_view_post_retry_with_same_key(self):
+        data = {
+            "receiver_account_number": self.receiver_card.account_no,
+            "amount": 30,
+            "card": self.sender_card.id,
+            "idempotency_key": "transfer-1",
+        }
+        self.client.post(reverse("transactions:fund_transfer"), data)
+        response = self.client.post(reverse("transactions:fund_transfer"), data)
+
+        self.assertRedirects(response, reverse("accounts:card_list"))
+        self.sender_card.refresh_from_db()
+        self.assertAlmostEqual(float(self.sender_card.balance), float(70), places=2)
+        self.assertEqual(Payment.objects.count(), 2)
+
+    def test_fund_transfer_stays_within_query_budget(self):
+        data = {
+            "receiver_account_number": self.receiver_card.account_no,
+            "amount": 30,
+            "card": self.sender_card.id,
+            "idempotency_key": "transfer-budget",
+        }
+        # Дневные итоги пишутся одним upsert, а не UPDATE + INSERT на карту
+        with self.assertNoLogs("core.middleware", level="WARNING"):
+            self.client.post(reverse("transactions:fund_transfer"), data)
+
     def test_fund_transfer_view_post_insufficient_funds(self):
         data = {
             "receiver_account_number": self.receiver_card.account_no,
@@ -129,3 +173,122 @@ class FundTransferViewTest(TestCase):
         self.assertRedirects(response, reverse("accounts:card_list"))
 
         self.assertEqual(Payment.objects.count(), 2)
+
+
+class TransferServiceTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="test@example.com", password="testpass"
+        )
+        self.sender_card = Card.objects.create(
+            user=self.user, card_type="D", currency="B", balance=100
+        )
+        self.receiver_card = Card.objects.create(
+            user=self.user, card_type="D", currency="U", balance=0
+        )
+
+    def test_transfer_converts_and_records_signed_amounts(self):
+        result = transfer(
+            self.sender_card.id,
+            Decimal("32"),
+            receiver_id=self.receiver_card.id,
+            usd_rate=Decimal("3.2"),
+        )
+
+        self.sender_card.refresh_from_db()
+        self.receiver_card.refresh_from_db()
+        self.assertEqual(self.sender_card.balance, Decimal("68"))
+        self.assertEqual(self.receiver_card.balance, Decimal("10"))
+        self.assertEqual(result.converted_amount, Decimal("10"))
+        self.assertEqual(
+            Payment.objects.get(card=self.sender_card).amount, Decimal("-32")
+        )
+        self.assertTrue(Payment.objects.get(card=self.receiver_card).deposit_pending)
+        self.assertIn("lock", result.timings)
+        self.assertIn("total", result.timings)
+
+    def test_transfer_uses_sell_rate_by_default(self):
+        with patch(
+            "transactions.services.get_usd_rate", return_value=Decimal("3.19")
+        ) as rate:
+            result = transfer(
+                self.sender_card.id,
+                Decimal("31.9"),
+                receiver_id=self.receiver_card.id,
+            )
+
+        rate.assert_called_once_with("USD_out")
+        self.assertEqual(result.converted_amount, Decimal("10"))
+
+    def test_transfer_writes_header_and_ledger_legs(self):
+        result = transfer(
+            self.sender_card.id,
+            Decimal("32"),
+            receiver_id=self.receiver_card.id,
+            usd_rate=Decimal("3.2"),
+        )
+
+        header = Transaction.objects.get()
+        self.assertEqual(result.transaction_id, header.id)
+        self.assertEqual(header.amount, Decimal("32"))
+        legs = {
+            entry.card_id: entry
+            for entry in LedgerEntry.objects.filter(transfer=header)
+        }
+        self.assertEqual(legs[self.sender_card.id].amount, Decimal("-32"))
+        self.assertEqual(legs[self.sender_card.id].balance_after, Decimal("68"))
+        self.assertEqual(legs[self.receiver_card.id].amount, Decimal("10"))
+        self.assertEqual(legs[self.receiver_card.id].balance_after, Decimal("10"))
+
+    def test_transfer_respects_daily_budget(self):
+        savings_card = Card.objects.create(user=self.user, card_type="D", currency="B")
+        BudgetSystem.objects.create(
+            user=self.user,
+            name="Budget",
+            description="Budget",
+            card=self.sender_card,
+            savings_card=savings_card,
+            daily_control=True,
+            daily_percent=3,
+        )
+        Card.objects.filter(pk=self.sender_card.pk).update(
+            using_system=True, daily_balance=10
+        )
+
+        with self.assertRaisesMessage(
+            TransferError, "Insufficient funds out of your budget to transfer."
+        ):
+            transfer(
+                self.sender_card.id,
+                Decimal("20"),
+                receiver_id=savings_card.id,
+                usd_rate=Decimal("3.2"),
+            )
+
+        transfer(
+            self.sender_card.id,
+            Decimal("5"),
+            receiver_id=savings_card.id,
+            usd_rate=Decimal("3.2"),
+        )
+        self.sender_card.refresh_from_db()
+        self.assertEqual(self.sender_card.daily_balance, Decimal("5"))
+
+    def test_transfer_rejects_non_positive_amount(self):
+        with self.assertRaises(TransferError):
+            transfer(
+                self.sender_card.id,
+                Decimal("-10"),
+                receiver_id=self.receiver_card.id,
+                usd_rate=Decimal("3.2"),
+            )
+        self.assertEqual(Payment.objects.count(), 0)
+
+    def test_transfer_to_unknown_account(self):
+        with self.assertRaisesMessage(TransferError, "Receiver card not found."):
+            transfer(
+                self.sender_card.id,
+                Decimal("10"),
+                receiver_account_no="0000000000000000",
+                usd_rate=Decimal("3.2"),
+            )